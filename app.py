@@ -1,41 +1,69 @@
+import hashlib
+import importlib.util
 import os
+import queue
+import tempfile
+import threading
 import time
-from datetime import datetime, timedelta
-from io import BytesIO
+import unicodedata
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
 
 from dotenv import load_dotenv
 # Cargar variables de entorno PRIMERO
 load_dotenv()
 
-from flask import Flask, render_template, request, jsonify, send_file
-import pytz
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-
-from weatherlink_client import WeatherLinkClient
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
+
+from cache_backend import create_cache
+from compression import create_compressor
+from downsampling import downsample_history, downsample_records
+from export_jobs import create_export_job_manager
+from historic_cache import HistoricRangeCache
+from historic_export import csv_error_row, stream_csv, stream_parquet, write_xlsx
+from json_provider import configure_json
+from live_feed import create_live_feed
+import metrics
+from profiling import create_request_profiler, pool_prefix
+from refresher import create_refresher
+from stations import create_stations
+from weatherlink_client import LazyClients
 
 # Inicializar Flask App
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# Inicializar Supabase
-try:
-    from supabase_api import SupabaseAPI
-    
-    supabase_url = os.getenv('SUPABASE_URL')
-    supabase_key = os.getenv('SUPABASE_KEY')
+# JSON rápido (orjson) y compresión br/gzip de las respuestas grandes
+configure_json(app)
+create_compressor().init_app(app)
+
+# Latencias por ruta, llamadas a WeatherLink/Supabase y aciertos de caché en /metrics
+metrics.init_app(app)
+
+# Perfilado por muestreo (PROFILE_SAMPLE_EVERY / PROFILE_HEADER_TOKEN); apagado no registra hooks
+create_request_profiler().init_app(app)
+
+# Supabase: al arrancar solo se comprueba la configuración; el cliente se
+# crea con la primera petición que lo necesita
+SUPABASE_ENABLED = bool(os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_KEY'))
+_supabase = None
 
-    if not supabase_url or not supabase_key:
-        raise ValueError("SUPABASE_URL y SUPABASE_KEY no están definidas en el entorno.")
+if SUPABASE_ENABLED:
+    print("✅ Supabase API configurada.")
+else:
+    print("⚠️  Supabase no disponible: SUPABASE_URL y SUPABASE_KEY no están definidas en el entorno.")
 
-    supabase = SupabaseAPI(supabase_url, supabase_key)
-    SUPABASE_ENABLED = True
-    print("✅ Supabase API inicializada correctamente.")
 
-except (ImportError, ValueError) as e:
-    print(f"⚠️  Supabase no disponible: {e}")
-    SUPABASE_ENABLED = False
-    supabase = None
+def get_supabase():
+    """Cliente de Supabase del proceso (se crea en el primer uso)"""
+    global _supabase
+    if _supabase is None:
+        from supabase_api import SupabaseAPI
+        
+        _supabase = SupabaseAPI(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+    return _supabase
 
 # Deshabilitar caché para HTML
 @app.after_request
@@ -47,61 +75,101 @@ def add_header(response):
     return response
 
 # Configurar las 3 estaciones
-STATIONS = {
-    'finca1': {
-        'name': 'PYGANFLOR',
-        'api_key': os.getenv('FINCA1_API_KEY'),
-        'api_secret': os.getenv('FINCA1_API_SECRET'),
-        'station_id': os.getenv('FINCA1_STATION_ID')
-    },
-    'finca2': {
-        'name': 'Urcuquí',
-        'api_key': os.getenv('FINCA2_API_KEY'),
-        'api_secret': os.getenv('FINCA2_API_SECRET'),
-        'station_id': os.getenv('FINCA2_STATION_ID')
-    },
-    'finca3': {
-        'name': 'Malchinguí',
-        'api_key': os.getenv('FINCA3_API_KEY'),
-        'api_secret': os.getenv('FINCA3_API_SECRET'),
-        'station_id': os.getenv('FINCA3_STATION_ID')
-    }
-}
+STATIONS = create_stations()
 
-# Crear clientes para cada estación
-clients = {}
-for key, station in STATIONS.items():
-    clients[key] = WeatherLinkClient(
-        station['api_key'],
-        station['api_secret'],
-        station['station_id']
-    )
+# Clientes para cada estación (se crean en cada worker al primer uso)
+clients = LazyClients(STATIONS)
 
-# Sistema de caché simple (TTL: 5 minutos)
-CACHE = {}
-CACHE_TTL = 300  # segundos
+# Caché acotada (LRU en memoria o Redis compartido entre workers, ver CACHE_BACKEND)
+CACHE = metrics.instrument_cache(create_cache())
+CACHE_TTL = int(os.getenv('CACHE_TTL', '300'))  # segundos
 
-def get_cache_key(station_key, start_ts, end_ts):
-    """Generar clave de caché"""
-    return f"{station_key}_{start_ts}_{end_ts}"
-
-def get_cached_data(cache_key):
+def get_cached_data(cache_key, ttl=CACHE_TTL):
     """Obtener datos del caché si aún son válidos"""
-    if cache_key in CACHE:
-        cached_time, cached_data = CACHE[cache_key]
-        if time.time() - cached_time < CACHE_TTL:
-            return cached_data
-    return None
+    return CACHE.get(cache_key, ttl)
 
-def set_cached_data(cache_key, data):
+def set_cached_data(cache_key, data, ttl=CACHE_TTL):
     """Guardar datos en el caché"""
-    CACHE[cache_key] = (time.time(), data)
+    CACHE.set(cache_key, data, ttl)
+
+
+# Stale-while-revalidate: las claves pedidas hace poco se refrescan en segundo
+# plano antes de vencer y, si vencen, se sirve la copia anterior mientras tanto
+refresher = create_refresher(CACHE)
+
+
+def _refresh_historic_later(station_key):
+    """Refrescar en segundo plano los buckets abiertos de una estación servidos vencidos
+
+    Una sola clave por estación: los buckets abiertos son los mismos para
+    cualquier rango que llegue hasta ahora, así que los refrescos pedidos
+    por peticiones distintas se agrupan.
+    """
+    refresher.refresh_later(f"hot:hist:{station_key}:open",
+                            lambda: historic_cache.refresh_recent(station_key), CACHE_TTL)
+
+
+# Históricos cacheados por estación y bucket horario alineado: sirve a
+# /api/historical, /api/compare y /api/export aunque la ventana se mueva
+historic_cache = HistoricRangeCache(clients, CACHE, open_ttl=CACHE_TTL,
+                                    stale_seconds=refresher.stale_seconds,
+                                    on_stale=_refresh_historic_later)
+
+
+def track_recent_history(station_key, seconds):
+    """Mantener vigentes los buckets abiertos de la ventana "últimos N segundos" de una estación"""
+    key = f"hot:hist:{station_key}:{seconds}"
+    
+    def load():
+        now = int(time.time())
+        historic_cache.refresh_open(station_key, now - seconds, now)
+    
+    refresher.track(key, load, CACHE_TTL)
+    if refresher.peek(key) is None:
+        # La petición actual acaba de cargar el rango
+        refresher.store(key, None, CACHE_TTL)
+
+
+# Condiciones actuales: una ventana de frescura ligada al timestamp de la
+# lectura (la estación publica ~1 lectura/min); el refrescador las mantiene
+# al día mientras alguien las consulte
+CURRENT_INTERVAL = int(os.getenv('CURRENT_READING_INTERVAL_SEC', '60'))
+CURRENT_MIN_TTL = int(os.getenv('CURRENT_CACHE_MIN_TTL_SEC', '15'))
+CURRENT_MAX_TTL = int(os.getenv('CURRENT_CACHE_MAX_TTL_SEC', '120'))
+
+
+def _current_expiry(data, fetched_at):
+    """Hasta cuándo servir una lectura: hasta la próxima lectura esperada,
+    con un mínimo (estación atrasada) y un máximo (reloj de la estación adelantado)"""
+    expires_at = fetched_at + CURRENT_MIN_TTL
+    reading_ts = data.get('timestamp')
+    if isinstance(reading_ts, (int, float)):
+        expires_at = max(expires_at, reading_ts + CURRENT_INTERVAL)
+    return min(expires_at, fetched_at + CURRENT_MAX_TTL)
+
+
+def current_ttl(data):
+    """Segundos de vigencia de una lectura recién obtenida"""
+    fetched_at = time.time()
+    return _current_expiry(data, fetched_at) - fetched_at
+
+
+def get_current_conditions_cached(station_key):
+    """Condiciones actuales (stale-while-revalidate, una sola llamada en vuelo por estación)"""
+    return refresher.get(f"current:{station_key}", clients[station_key].get_current_conditions, current_ttl)
 
 
 @app.route('/')
 def index():
     """Página principal con dashboard de las 3 estaciones"""
-    return render_template('index.html', stations=STATIONS, supabase_enabled=SUPABASE_ENABLED)
+    return render_template('index.html', stations=STATIONS, supabase_enabled=SUPABASE_ENABLED,
+                           stream_stale_sec=STREAM_STALE_SEC)
+
+
+@app.route('/healthz')
+def healthz():
+    """Healthcheck liviano para Docker (sin plantillas ni llamadas externas)"""
+    return jsonify({'status': 'ok'})
 
 
 @app.route('/rain/events')
@@ -117,12 +185,118 @@ def get_current_data(station_key):
         return jsonify({'error': 'Estación no encontrada'}), 404
     
     try:
-        data = clients[station_key].get_current_conditions()
+        data = get_current_conditions_cached(station_key)
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _current_or_error(station_key):
+    """Condiciones actuales con el mismo formato que /api/current/<station_key>"""
+    try:
+        return get_current_conditions_cached(station_key)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _load_active_rain_events():
+    result = get_supabase().get_active_rain_events()
+    if not result['success']:
+        raise SupabaseLoadError(result, 500)
+    return result
+
+
+def _active_rain_events():
+    if not SUPABASE_ENABLED:
+        return {'success': False, 'error': 'Supabase no configurado'}
+    # Los errores no se cachean: se sigue sirviendo la copia anterior mientras
+    # exista y, sin copia, se responde el error de esta petición
+    try:
+        return refresher.get('rain_events:active', _load_active_rain_events, SUPABASE_VERSION_TTL)
+    except SupabaseLoadError as e:
+        return e.payload
+
+
+@app.route('/api/current')
+def get_current_bundle():
+    """Condiciones actuales de todas las estaciones y eventos de lluvia activos
+    
+    Una sola petición en lugar de una por estación más /api/rain/events/active.
+    Las estaciones (caché o WeatherLink) y Supabase se consultan en paralelo.
+    Soporta If-None-Match: si nada cambió responde 304 sin cuerpo.
+    """
+    with ThreadPoolExecutor(max_workers=len(clients) + 1, thread_name_prefix=pool_prefix('bundle')) as executor:
+        rain_future = executor.submit(_active_rain_events)
+        futures = {key: executor.submit(_current_or_error, key) for key in clients}
+        bundle = {
+            'stations': {key: future.result() for key, future in futures.items()},
+            'rain_events': rain_future.result(),
+        }
+    
+    response = jsonify(bundle)
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# Feed en vivo (SSE): un consumidor de Kafka por proceso para todas las conexiones
+live_feed = create_live_feed(STATIONS.keys())
+SSE_KEEPALIVE_SEC = float(os.getenv('SSE_KEEPALIVE_SEC', '15'))
+# Las conexiones se cierran periódicamente; EventSource reconecta solo
+SSE_MAX_DURATION_SEC = float(os.getenv('SSE_MAX_DURATION_SEC', '600'))
+# Cada conexión ocupa un hilo de gunicorn (gthread) mientras dura: como
+# máximo SSE_MAX_CONNECTIONS por worker, para que el resto de hilos siga
+# atendiendo peticiones normales
+SSE_MAX_CONNECTIONS = int(os.getenv('SSE_MAX_CONNECTIONS') or max(1, int(os.getenv('GUNICORN_THREADS', '16')) // 2))
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_CONNECTIONS)
+# Sin lecturas del stream durante este tiempo el navegador vuelve al polling:
+# algo más de dos ciclos del productor (POLL_INTERVAL_SEC)
+STREAM_STALE_SEC = int(os.getenv('STREAM_STALE_SEC') or 2 * int(os.getenv('POLL_INTERVAL_SEC', '270')) + 30)
+
+
+def _sse_message(event_type, data):
+    return f"event: {event_type}\ndata: {app.json.dumps(data)}\n\n"
+
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events con lecturas nuevas ('reading') y transiciones de lluvia ('rain_event')
+
+    Sin hilos libres para más conexiones (SSE_MAX_CONNECTIONS) responde 503;
+    el navegador sigue con polling.
+    """
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({'error': 'Demasiadas conexiones en vivo'}), 503, {'Retry-After': '60'}
+    subscription = live_feed.subscribe()
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            for event_type, data in live_feed.snapshot():
+                yield _sse_message(event_type, data)
+            
+            deadline = time.monotonic() + SSE_MAX_DURATION_SEC
+            while time.monotonic() < deadline:
+                try:
+                    event_type, data = subscription.get(timeout=SSE_KEEPALIVE_SEC)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse_message(event_type, data)
+        finally:
+            live_feed.unsubscribe(subscription)
+    
+    def close():
+        # También si el cliente se va antes de que empiece el generador
+        live_feed.unsubscribe(subscription)
+        _sse_slots.release()
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)
+    return response
+
+
 @app.route('/api/historical/<station_key>')
 def get_historical_data(station_key):
     """Obtener datos históricos de una estación"""
@@ -133,6 +307,8 @@ def get_historical_data(station_key):
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     days = request.args.get('days', type=int, default=7)
+    # Máximo de puntos para gráficos (LTTB por serie, conservando picos de lluvia)
+    max_points = request.args.get('max_points', type=int)
     
     try:
         if start_date and end_date:
@@ -143,22 +319,12 @@ def get_historical_data(station_key):
             # Usar últimos N días
             end_timestamp = int(datetime.now().timestamp())
             start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
+            track_recent_history(station_key, days * 86400)
         
-        # Verificar caché
-        cache_key = get_cache_key(station_key, start_timestamp, end_timestamp)
-        cached_data = get_cached_data(cache_key)
-        
-        if cached_data:
-            cached_data['from_cache'] = True
-            return jsonify(cached_data)
-        
-        # Si no hay en caché, obtener de la API
-        data = clients[station_key].get_historic_data(start_timestamp, end_timestamp)
-        data['from_cache'] = False
-        
-        # Guardar en caché
-        set_cached_data(cache_key, data)
-        
+        # Armar el rango desde la caché por buckets (solo se piden los que faltan)
+        data = historic_cache.get_range(station_key, start_timestamp, end_timestamp)
+        if max_points:
+            data['records'] = downsample_records(data['records'], max_points)
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -181,37 +347,172 @@ def compare_stations():
     return render_template('compare.html', stations=STATIONS)
 
 
+# Comparación: todas las estaciones en paralelo con un tope global de
+# peticiones simultáneas y un tiempo límite total (por debajo del timeout de gunicorn)
+COMPARE_MAX_CONCURRENCY = int(os.getenv('COMPARE_MAX_CONCURRENCY', '8'))
+COMPARE_DEADLINE_SEC = float(os.getenv('COMPARE_DEADLINE_SEC', '60'))
+
+
+def _collect_station_range(station_key, start_timestamp, end_timestamp, limit, cancel, batches):
+    """Descargar el rango de una estación acumulando lotes en `batches` hasta terminar o cancelar
+
+    limit es el semáforo compartido por todas las estaciones de la petición:
+    acota el total de chunks descargándose a la vez.
+    """
+    chunks = historic_cache.iter_range(station_key, start_timestamp, end_timestamp,
+                                       max_workers=COMPARE_MAX_CONCURRENCY, limit=limit, cancel=cancel)
+    try:
+        for records in chunks:
+            batches.append(records)
+    except CancelledError:
+        return False
+    finally:
+        chunks.close()
+    return True
+
+
+def compare_station_json(key, station_batches, start_timestamp, end_timestamp, max_points=None,
+                         error=None, partial=False):
+    """Fragmentos JSON de una estación en la respuesta de /api/compare
+
+    Una estación con error se devuelve como {"name", "error"}, sin datos.
+    """
+    dumps = app.json.dumps
+    yield f'{dumps(key)}: {{"name": {dumps(STATIONS[key]["name"])}'
+    if error is not None:
+        yield f', "error": {dumps(error)}}}'
+        return
+    if max_points:
+        station_batches = [downsample_records([r for batch in station_batches for r in batch], max_points)]
+    yield (f', "data": {{"station_id": {dumps(clients[key].station_id)}, '
+           f'"start_timestamp": {start_timestamp}, "end_timestamp": {end_timestamp}, '
+           f'"records": [')
+    first = True
+    for records in station_batches:
+        if not records:
+            continue
+        body = dumps(records)[1:-1]
+        yield body if first else ', ' + body
+        first = False
+    yield ']}'
+    if partial:
+        yield ', "partial": true'
+    yield '}'
+
+
 @app.route('/api/compare')
 def get_compare_data():
-    """Obtener datos de todas las estaciones para comparar"""
+    """Obtener datos de todas las estaciones para comparar
+    
+    Las estaciones se descargan en paralelo y cada una se escribe en la
+    respuesta (JSON por partes) en cuanto termina. Si se alcanza
+    COMPARE_DEADLINE_SEC, las estaciones pendientes se devuelven con los
+    datos obtenidos hasta ese momento y 'partial': true. Con max_points,
+    cada estación se reduce a ~max_points registros antes de enviarse.
+    """
     days = request.args.get('days', type=int, default=7)
+    max_points = request.args.get('max_points', type=int)
     
     end_timestamp = int(datetime.now().timestamp())
     start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
     
-    result = {}
-    for key, client in clients.items():
+    for key in clients:
+        track_recent_history(key, days * 86400)
+    
+    deadline = time.monotonic() + COMPARE_DEADLINE_SEC
+    limit = threading.BoundedSemaphore(COMPARE_MAX_CONCURRENCY)
+    cancel = threading.Event()
+    batches = {key: [] for key in clients}
+    executor = ThreadPoolExecutor(max_workers=max(1, len(clients)), thread_name_prefix=pool_prefix('compare'))
+    futures = {
+        executor.submit(_collect_station_range, key, start_timestamp, end_timestamp,
+                        limit, cancel, batches[key]): key
+        for key in clients
+    }
+    
+    def generate():
+        pending = dict(futures)
+        emitted = 0
+        yield '{'
         try:
-            data = client.get_historic_data(start_timestamp, end_timestamp)
-            result[key] = {
-                'name': STATIONS[key]['name'],
-                'data': data
-            }
-        except Exception as e:
-            result[key] = {
-                'name': STATIONS[key]['name'],
-                'error': str(e)
-            }
+            for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+                key = pending.pop(future)
+                if emitted:
+                    yield ', '
+                emitted += 1
+                error = future.exception()
+                if error is not None:
+                    yield from compare_station_json(key, [], start_timestamp, end_timestamp,
+                                                    error=str(error))
+                else:
+                    yield from compare_station_json(key, batches[key], start_timestamp, end_timestamp,
+                                                    max_points)
+        except FuturesTimeoutError:
+            # Tiempo límite: devolver lo obtenido hasta ahora de las estaciones lentas
+            cancel.set()
+            for key in pending.values():
+                if emitted:
+                    yield ', '
+                emitted += 1
+                yield from compare_station_json(key, list(batches[key]), start_timestamp, end_timestamp,
+                                                max_points, partial=True)
+        finally:
+            cancel.set()
+            executor.shutdown(wait=False)
+        yield '}'
     
-    return jsonify(result)
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def _content_disposition(filename):
+    """Cabecera de descarga (filename* en UTF-8 para nombres con tildes, como send_file)"""
+    try:
+        filename.encode('ascii')
+        return 'attachment', {'filename': filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return 'attachment', {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+
+
+def _streamed_export(station_key, body, error_row=None):
+    """Envolver un generador de exportación
+
+    Si falla a mitad de descarga se agrega error_row(mensaje) (CSV) y la
+    excepción se vuelve a lanzar: el servidor corta la conexión sin cerrar el
+    cuerpo chunked y el cliente ve una descarga fallida, no un archivo
+    truncado con apariencia de completo (un Parquet sin pie tampoco se puede leer).
+    """
+    try:
+        yield from body
+    except Exception as e:
+        print(f"⚠️ Exportación de {station_key} interrumpida: {e}")
+        if error_row is not None:
+            yield error_row(str(e))
+        raise
 
 
 @app.route('/api/export/<station_key>')
 def export_to_excel(station_key):
-    """Exportar datos históricos a Excel"""
+    """Exportar datos históricos a Excel (format=xlsx), CSV o Parquet
+    
+    CSV y Parquet se envían día a día a medida que se descargan; Excel se
+    escribe en modo write-only a un archivo temporal. En ningún caso se
+    mantiene el rango completo en memoria.
+    """
     if station_key not in clients:
         return jsonify({'error': 'Estación no encontrada'}), 404
     
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Formato no soportado: {export_format} (xlsx, csv o parquet)"}), 400
+    
     # Obtener parámetros de fecha
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -225,126 +526,257 @@ def export_to_excel(station_key):
             end_timestamp = int(datetime.now().timestamp())
             start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
         
-        # Obtener datos
-        data = clients[station_key].get_historic_data(start_timestamp, end_timestamp)
-        records = data.get('records', [])
-        
-        # Crear archivo Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Datos Meteorológicos"
+        # Un lote por día de buckets
+        chunks = historic_cache.iter_range(station_key, start_timestamp, end_timestamp,
+                                           batch_buckets=max(1, 86400 // historic_cache.bucket_seconds))
         
-        # Estilo para encabezados
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-        
-        # Encabezados
-        headers = ['Fecha y Hora', 'Temperatura (°C)', 'Humedad (%)', 'Viento (km/h)', 
-                   'Lluvia (mm)', 'Radiación Solar (W/m²)', 'DPV (kPa)']
-        
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Datos
-        # Ecuador timezone UTC-5
-        for row_idx, record in enumerate(records, 2):
-            # Fecha - Convertir timestamp Unix a hora de Ecuador
-            # Los timestamps son UTC, restar 5 horas para Ecuador
-            timestamp = record['timestamp']
-            ecuador_dt = datetime.utcfromtimestamp(timestamp) - timedelta(hours=5)
-            
-            ws.cell(row=row_idx, column=1, value=ecuador_dt.strftime('%Y-%m-%d %H:%M:%S'))
-            
-            # Temperatura (F -> C)
-            temp_c = ((record.get('temperature', 0) - 32) * 5 / 9) if record.get('temperature') else None
-            ws.cell(row=row_idx, column=2, value=round(temp_c, 2) if temp_c else '')
-            
-            # Humedad
-            ws.cell(row=row_idx, column=3, value=record.get('humidity', ''))
-            
-            # Viento (mph -> km/h)
-            wind_kmh = (record.get('wind_speed', 0) * 1.60934) if record.get('wind_speed') else None
-            ws.cell(row=row_idx, column=4, value=round(wind_kmh, 2) if wind_kmh else '')
-            
-            # Lluvia en mm (el backend ya entrega mm)
-            rain_mm = record.get('rain')
-            ws.cell(row=row_idx, column=5, value=round(rain_mm, 2) if rain_mm else '')
-            
-            # Radiación Solar
-            ws.cell(row=row_idx, column=6, value=record.get('solar_radiation', ''))
-            
-            # DPV (kPa)
-            if record.get('temperature') and record.get('humidity'):
-                tc = (record['temperature'] - 32) * 5 / 9
-                vpsat = 0.6108 * (2.718281828 ** ((17.27 * tc) / (tc + 237.3)))
-                vpactual = (record['humidity'] / 100) * vpsat
-                dpv = vpsat - vpactual
-                ws.cell(row=row_idx, column=7, value=round(dpv, 3))
-            else:
-                ws.cell(row=row_idx, column=7, value='')
-        
-        # Ajustar ancho de columnas
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 30)
-            ws.column_dimensions[column].width = adjusted_width
+        # Generar nombre de archivo
+        filename = (f"{STATIONS[station_key]['name']}_datos_"
+                    f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}")
         
-        # Guardar en memoria
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        if export_format == 'xlsx':
+            output = tempfile.TemporaryFile()
+            try:
+                write_xlsx(chunks, output)
+                output.seek(0)
+            except Exception:
+                output.close()
+                raise
+            return send_file(
+                output,
+                mimetype=EXPORT_FORMATS['xlsx'],
+                as_attachment=True,
+                download_name=filename
+            )
         
-        # Generar nombre de archivo
-        filename = f"{STATIONS[station_key]['name']}_datos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        if export_format == 'csv':
+            body = _streamed_export(station_key, stream_csv(chunks), csv_error_row)
+        else:
+            try:
+                body = _streamed_export(station_key, stream_parquet(chunks))
+            except ImportError:
+                return jsonify({'error': 'Exportación Parquet no disponible (falta pyarrow)'}), 501
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        response = Response(stream_with_context(body),
+                            mimetype=EXPORT_FORMATS[export_format])
+        disposition, options = _content_disposition(filename)
+        response.headers.set('Content-Disposition', disposition, **options)
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+# Exportaciones largas: trabajos en segundo plano con progreso y descarga posterior
+export_jobs = create_export_job_manager(clients, STATIONS, historic_cache=historic_cache)
+
+
+def _export_job_status(job):
+    """Estado público de un trabajo (con URLs de consulta y descarga)"""
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'stations': job['stations'],
+        'format': job['format'],
+        'start_timestamp': job['start_timestamp'],
+        'end_timestamp': job['end_timestamp'],
+        'chunks_done': job['chunks_done'],
+        'chunks_total': job['chunks_total'],
+        'progress': round(job['chunks_done'] / job['chunks_total'], 3) if job['chunks_total'] else 1.0,
+        'filename': job['filename'],
+        'error': job['error'],
+        'status_url': f"/api/export/jobs/{job['id']}",
+        'download_url': f"/api/export/jobs/{job['id']}/download" if job['status'] == 'done' else None,
+    }
+
+
+@app.route('/api/export/jobs', methods=['POST'])
+def create_export_job():
+    """Encolar una exportación (una o varias estaciones, cualquier rango)
+    
+    Parámetros (JSON o formulario): stations (lista o "finca1,finca2"),
+    start_date y end_date (YYYY-MM-DD) o days, format (xlsx | csv | parquet).
+    Responde 202 con el id del trabajo.
+    """
+    params = request.get_json(silent=True) or request.form or request.args
+    
+    stations = params.get('stations') or list(clients)
+    if isinstance(stations, str):
+        stations = [key.strip() for key in stations.split(',') if key.strip()]
+    unknown = [key for key in stations if key not in clients]
+    if unknown or not stations:
+        return jsonify({'error': f"Estación no encontrada: {', '.join(unknown)}"}), 404
+    
+    export_format = str(params.get('format', 'xlsx')).lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Formato no soportado: {export_format} (xlsx, csv o parquet)"}), 400
+    if export_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        return jsonify({'error': 'Exportación Parquet no disponible (falta pyarrow)'}), 501
+    
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    
+    try:
+        if start_date and end_date:
+            start_timestamp = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
+            end_timestamp = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp()) + 86399
+        else:
+            days = int(params.get('days', 7))
+            end_timestamp = int(datetime.now().timestamp())
+            start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f"Rango de fechas inválido: {e}"}), 400
+    if end_timestamp < start_timestamp:
+        return jsonify({'error': 'Rango de fechas inválido: end_date anterior a start_date'}), 400
+    
+    try:
+        job = export_jobs.submit(stations, start_timestamp, end_timestamp, export_format)
+        return jsonify(_export_job_status(job)), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/export/jobs/<job_id>')
+def get_export_job(job_id):
+    """Progreso de un trabajo de exportación"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(_export_job_status(job))
+
+
+@app.route('/api/export/jobs/<job_id>/download')
+def download_export_job(job_id):
+    """Descargar el archivo de un trabajo terminado"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    if job['status'] != 'done':
+        return jsonify(_export_job_status(job)), 409
+    
+    path = export_jobs.artifact_path(job)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Archivo de exportación expirado'}), 410
+    
+    mimetype = EXPORT_FORMATS.get(job['artifact_ext'], 'application/zip')
+    return send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                     download_name=job['filename'])
+
+
 # ============================================
 # RUTAS DE SUPABASE (datos en tiempo real)
 # ============================================
 
+# Respuestas condicionales: el cuerpo y su versión (ETag + Last-Modified) se
+# guardan SUPABASE_VERSION_TTL segundos; dentro de esa ventana las consultas
+# (con o sin If-None-Match) se responden sin volver a llamar a Supabase
+SUPABASE_VERSION_TTL = int(os.getenv('SUPABASE_VERSION_TTL_SEC', '30'))
+# Historial: horas máximas por consulta y rangos del dashboard (6h, 24h,
+# 48h, 7d) que se mantienen calientes; los demás se cachean sin refresco
+# anticipado para no acumular claves por cada combinación de parámetros
+SUPABASE_HISTORY_MAX_HOURS = int(os.getenv('SUPABASE_HISTORY_MAX_HOURS', '720'))
+SUPABASE_HOT_HISTORY_HOURS = {int(h) for h in os.getenv('SUPABASE_HOT_HISTORY_HOURS', '6,24,48,168').split(',') if h.strip()}
+# max_points de las gráficas (MAX_CHART_POINTS en las plantillas)
+CHART_MAX_POINTS = 1000
+
+
+def _newest_timestamp(values):
+    """Fecha más reciente de una lista de timestamps ISO (event_time / updated_at)"""
+    newest = None
+    for value in values:
+        if not value:
+            continue
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        if newest is None or parsed > newest:
+            newest = parsed
+    return newest
+
+
+class SupabaseLoadError(Exception):
+    """Respuesta de error de Supabase (no se cachea como versión)"""
+    
+    def __init__(self, payload, status):
+        super().__init__(payload.get('error'))
+        self.payload = payload
+        self.status = status
+
+
+def _conditional_response(cache_key, load, timestamps, hot=True):
+    """Respuesta JSON con ETag fuerte, Last-Modified y 304 si el cliente ya la tiene
+    
+    load() devuelve (payload, status); timestamps(payload) los event_time /
+    updated_at del resultado. El ETag combina el más reciente con un hash del
+    cuerpo, de modo que cambia aunque solo salgan filas viejas de la ventana.
+    Las versiones se mantienen con el refrescador (stale-while-revalidate);
+    con hot=False la clave no se registra como caliente.
+    """
+    def build_version():
+        payload, status = load()
+        if status != 200:
+            raise SupabaseLoadError(payload, status)
+        body = app.json.dumps(payload)
+        newest = _newest_timestamp(timestamps(payload))
+        digest = hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+        return {
+            'body': body,
+            'etag': f"{int(newest.timestamp()) if newest else 0}-{digest}",
+            'last_modified': newest.timestamp() if newest else None,
+        }
+    
+    try:
+        version = refresher.get(cache_key, build_version, SUPABASE_VERSION_TTL, hot=hot)
+    except SupabaseLoadError as e:
+        return jsonify(e.payload), e.status
+    
+    response = app.response_class(version['body'], mimetype='application/json')
+    response.set_etag(version['etag'])
+    if version['last_modified'] is not None:
+        response.last_modified = datetime.fromtimestamp(version['last_modified'], tz=timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @app.route('/api/supabase/latest')
 def api_supabase_latest():
     """GET /api/supabase/latest - Últimas lecturas de todas las estaciones desde Supabase"""
     if not SUPABASE_ENABLED:
         return jsonify({'error': 'Supabase no configurado'}), 503
     
-    result = supabase.get_latest_readings()
-    if result['success']:
-        return jsonify(result['data'])
-    return jsonify({'error': result['error']}), 500
+    def load():
+        result = get_supabase().get_latest_readings()
+        if result['success']:
+            return result['data'], 200
+        return {'error': result['error']}, 500
+    
+    return _conditional_response('supabase:latest', load,
+                                 lambda data: (row['ultima_actualizacion'] for row in data))
 
 
 @app.route('/api/supabase/station/<station_key>/history')
 def api_supabase_history(station_key):
-    """GET /api/supabase/station/<key>/history?hours=24 - Historial desde Supabase"""
+    """GET /api/supabase/station/<key>/history?hours=24&max_points=1000 - Historial desde Supabase"""
     if not SUPABASE_ENABLED:
         return jsonify({'error': 'Supabase no configurado'}), 503
     
-    hours = int(request.args.get('hours', 24))
-    result = supabase.get_station_history(station_key, hours)
-    if result['success']:
-        return jsonify(result['data'])
-    return jsonify({'error': result['error']}), 500
+    hours = min(max(int(request.args.get('hours', 24)), 1), SUPABASE_HISTORY_MAX_HOURS)
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None and max_points <= 0:
+        max_points = None
+    
+    def load():
+        result = get_supabase().get_station_history(station_key, hours)
+        if result['success']:
+            return downsample_history(result['data'], max_points), 200
+        return {'error': result['error']}, 500
+    
+    return _conditional_response(f"supabase:history:{station_key}:{hours}:{max_points or 0}", load,
+                                 lambda data: data['timestamps'][-1:],
+                                 hot=hours in SUPABASE_HOT_HISTORY_HOURS and max_points in (None, CHART_MAX_POINTS))
 
 
 @app.route('/api/supabase/station/<station_key>/daily')
@@ -354,7 +786,7 @@ def api_supabase_daily(station_key):
         return jsonify({'error': 'Supabase no configurado'}), 503
     
     days = int(request.args.get('days', 7))
-    result = supabase.get_daily_summary(station_key, days)
+    result = get_supabase().get_daily_summary(station_key, days)
     if result['success']:
         return jsonify(result['data'])
     return jsonify({'error': result['error']}), 500
@@ -366,7 +798,7 @@ def api_supabase_comparison():
     if not SUPABASE_ENABLED:
         return jsonify({'error': 'Supabase no configurado'}), 503
     
-    result = supabase.get_all_stations_comparison()
+    result = get_supabase().get_all_stations_comparison()
     if result['success']:
         return jsonify(result['data'])
     return jsonify({'error': result['error']}), 500
@@ -378,10 +810,13 @@ def api_rain_events_active():
     if not SUPABASE_ENABLED:
         return jsonify({'error': 'Supabase no configurado'}), 503
     
-    result = supabase.get_active_rain_events()
-    if result['success']:
-        return jsonify(result)
-    return jsonify(result), 500
+    def load():
+        result = get_supabase().get_active_rain_events()
+        return result, 200 if result['success'] else 500
+    
+    return _conditional_response('supabase:rain_active', load,
+                                 lambda result: (event.get('updated_at') or event.get('event_start')
+                                                 for event in result['data']))
 
 
 @app.route('/api/rain/events/history')
@@ -393,7 +828,7 @@ def api_rain_events_history():
     station_key = request.args.get('station_key')
     limit = request.args.get('limit', 10, type=int)
     
-    result = supabase.get_rain_events_history(station_key=station_key, limit=limit)
+    result = get_supabase().get_rain_events_history(station_key=station_key, limit=limit)
     if result['success']:
         return jsonify(result)
     return jsonify(result), 500
@@ -405,9 +840,13 @@ def api_rain_accumulated():
     if not SUPABASE_ENABLED:
         return jsonify({'error': 'Supabase no configurado'}), 503
     
-    result = supabase.get_accumulated_rain()
-    if result['success']:
-        # Agregar nombres de estaciones al resultado
-        result['data']['stations'] = {key: STATIONS[key]['name'] for key in STATIONS}
-        return jsonify(result)
-    return jsonify(result), 500
\ No newline at end of file
+    def load():
+        result = get_supabase().get_accumulated_rain()
+        if result['success']:
+            # Agregar nombres de estaciones al resultado
+            result['data']['stations'] = {key: STATIONS[key]['name'] for key in STATIONS}
+            return result, 200
+        return result, 500
+    
+    return _conditional_response('supabase:rain_accumulated', load,
+                                 lambda result: [result['data'].get('last_updated')])
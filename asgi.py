@@ -0,0 +1,331 @@
+"""
+Modo de servicio ASGI (SERVER_MODE=asgi).
+
+Las rutas de la API que esperan a WeatherLink (condiciones actuales, bundle,
+históricos y comparación) y el feed SSE se atienden como corrutinas en el
+event loop del worker con AsyncWeatherLinkClient: mientras WeatherLink
+responde, el worker sigue atendiendo otras peticiones, así que un solo
+proceso sostiene cientos de peticiones lentas en vuelo (las conexiones
+salientes las limita WEATHERLINK_POOL_SIZE).
+
+Las cachés compartidas con app.py (SQLite, Redis) son síncronas: sus
+lecturas y escrituras se hacen con asyncio.to_thread para no bloquear el
+event loop.
+
+El resto (páginas, Supabase, exportaciones) sigue siendo la app Flask de
+app.py, montada con a2wsgi sobre un pool de hilos (ASGI_WSGI_THREADS).
+Ambos modos comparten cachés, claves y proveedor JSON, así que las
+respuestas tienen el mismo formato.
+
+    SERVER_MODE=asgi gunicorn --config gunicorn_config.py
+    uvicorn asgi:app --reload    # desarrollo
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags
+
+import app as dashboard
+import metrics
+from downsampling import downsample_records
+from historic_cache import HistoricRangeCache
+from historic_store import get_default_store
+from singleflight import AsyncSingleFlight
+from weatherlink_client import AsyncWeatherLinkClient, close_shared_async_client
+
+# Clientes asíncronos por estación (se crean dentro del event loop de cada worker)
+async_clients = {}
+
+# Misma configuración de buckets que la caché de app.py: comparten las entradas
+# (y los buckets vencidos se refrescan en segundo plano con la de app.py)
+historic_cache = HistoricRangeCache(
+    async_clients,
+    dashboard.CACHE,
+    bucket_seconds=dashboard.historic_cache.bucket_seconds,
+    open_ttl=dashboard.historic_cache.open_ttl,
+    closed_ttl=dashboard.historic_cache.closed_ttl,
+    grace_seconds=dashboard.historic_cache.grace_seconds,
+    empty_ttl=dashboard.historic_cache.empty_ttl,
+    stale_seconds=dashboard.historic_cache.stale_seconds,
+    on_stale=dashboard.historic_cache.on_stale,
+)
+current_flight = AsyncSingleFlight()
+
+def json_response(data, status=200, headers=None):
+    """Equivalente de jsonify (mismo proveedor JSON que la app Flask)"""
+    return Response(dashboard.app.json.dumps(data) + "\n", status_code=status,
+                    media_type='application/json', headers=headers)
+
+
+def _int_arg(request, name, default=None):
+    """Como request.args.get(name, type=int, default=default) de Flask"""
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+async def _fetch_current_conditions(station_key):
+    """Llamada real a WeatherLink (solo la ejecuta el primero de cada ráfaga)"""
+    data = await async_clients[station_key].get_current_conditions()
+    await asyncio.to_thread(dashboard.refresher.store, f"current:{station_key}", data, dashboard.current_ttl)
+    return data
+
+
+async def get_current_conditions_cached(station_key):
+    """Condiciones actuales con el mismo stale-while-revalidate que app.py
+
+    Los refrescos en segundo plano los hace el refrescador de app.py (hilos y
+    cliente síncrono); aquí solo se espera cuando no hay ni copia vieja.
+    """
+    key = f"current:{station_key}"
+    load = dashboard.clients[station_key].get_current_conditions
+    dashboard.refresher.track(key, load, dashboard.current_ttl)
+    cached = await asyncio.to_thread(dashboard.refresher.peek, key)
+    if cached is not None:
+        data, fresh = cached
+        if not fresh:
+            dashboard.refresher.refresh_later(key, load, dashboard.current_ttl)
+        return data
+    return await current_flight.do(station_key, _fetch_current_conditions, station_key)
+
+
+async def get_current_data(request):
+    """Obtener datos actuales de una estación"""
+    station_key = request.path_params['station_key']
+    if station_key not in async_clients:
+        return json_response({'error': 'Estación no encontrada'}, 404)
+
+    try:
+        return json_response(await get_current_conditions_cached(station_key))
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+async def _current_or_error(station_key):
+    try:
+        return await get_current_conditions_cached(station_key)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+async def get_current_bundle(request):
+    """Condiciones actuales de todas las estaciones y eventos de lluvia activos
+
+    Las estaciones se esperan en el event loop; Supabase (cliente síncrono)
+    se consulta en un hilo. Soporta If-None-Match como la ruta de Flask.
+    """
+    keys = list(async_clients)
+    rain_events, *stations = await asyncio.gather(
+        asyncio.to_thread(dashboard._active_rain_events),
+        *(_current_or_error(key) for key in keys),
+    )
+    body = (dashboard.app.json.dumps({'stations': dict(zip(keys, stations)),
+                                      'rain_events': rain_events}) + "\n").encode('utf-8')
+
+    # Mismo ETag que Response.add_etag de werkzeug (sha1 del cuerpo)
+    etag = hashlib.sha1(body).hexdigest()
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+async def api_stream(request):
+    """Server-Sent Events sin ocupar un hilo por conexión"""
+    subscription = dashboard.live_feed.subscribe_async()
+
+    async def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            for event_type, data in dashboard.live_feed.snapshot():
+                yield dashboard._sse_message(event_type, data)
+
+            deadline = time.monotonic() + dashboard.SSE_MAX_DURATION_SEC
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event_type, data = await subscription.get(min(dashboard.SSE_KEEPALIVE_SEC, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield dashboard._sse_message(event_type, data)
+        finally:
+            dashboard.live_feed.unsubscribe(subscription)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def get_historical_data(request):
+    """Obtener datos históricos de una estación"""
+    station_key = request.path_params['station_key']
+    if station_key not in async_clients:
+        return json_response({'error': 'Estación no encontrada'}, 404)
+
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+    days = _int_arg(request, 'days', 7)
+    max_points = _int_arg(request, 'max_points')
+
+    try:
+        if start_date and end_date:
+            start_timestamp = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp())
+            end_timestamp = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp()) + 86399  # Final del día
+        else:
+            end_timestamp = int(datetime.now().timestamp())
+            start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
+            await asyncio.to_thread(dashboard.track_recent_history, station_key, days * 86400)
+
+        data = await historic_cache.aget_range(station_key, start_timestamp, end_timestamp)
+        if max_points:
+            data['records'] = downsample_records(data['records'], max_points)
+        return json_response(data)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+async def _collect_station_range(station_key, start_timestamp, end_timestamp, limit, batches):
+    """Descargar el rango de una estación acumulando lotes en `batches`
+
+    limit (asyncio.Semaphore) es compartido por todas las estaciones de la petición.
+    """
+    async for records in historic_cache.aiter_range(station_key, start_timestamp, end_timestamp,
+                                                    max_workers=dashboard.COMPARE_MAX_CONCURRENCY,
+                                                    limit=limit):
+        batches.append(records)
+
+
+async def get_compare_data(request):
+    """Obtener datos de todas las estaciones para comparar
+
+    Mismo contrato que la ruta de Flask: cada estación se escribe al
+    terminar y, al vencer COMPARE_DEADLINE_SEC, las pendientes salen con
+    lo obtenido y 'partial': true (sus descargas se cancelan).
+    """
+    days = _int_arg(request, 'days', 7)
+    max_points = _int_arg(request, 'max_points')
+
+    end_timestamp = int(datetime.now().timestamp())
+    start_timestamp = int((datetime.now() - timedelta(days=days)).timestamp())
+
+    await asyncio.gather(*(asyncio.to_thread(dashboard.track_recent_history, key, days * 86400)
+                           for key in async_clients))
+
+    deadline = time.monotonic() + dashboard.COMPARE_DEADLINE_SEC
+    limit = asyncio.Semaphore(dashboard.COMPARE_MAX_CONCURRENCY)
+    batches = {key: [] for key in async_clients}
+    tasks = {
+        asyncio.ensure_future(_collect_station_range(key, start_timestamp, end_timestamp,
+                                                     limit, batches[key])): key
+        for key in async_clients
+    }
+
+    async def generate():
+        pending = dict(tasks)
+        emitted = 0
+        yield '{'
+        try:
+            while pending:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    key = pending.pop(task)
+                    if emitted:
+                        yield ', '
+                    emitted += 1
+                    error = task.exception()
+                    if error is not None:
+                        pieces = dashboard.compare_station_json(key, [], start_timestamp, end_timestamp,
+                                                                error=str(error))
+                    else:
+                        pieces = dashboard.compare_station_json(key, batches[key], start_timestamp,
+                                                                end_timestamp, max_points)
+                    for piece in pieces:
+                        yield piece
+
+            # Tiempo límite: devolver lo obtenido hasta ahora de las estaciones lentas
+            for task, key in pending.items():
+                task.cancel()
+                if emitted:
+                    yield ', '
+                emitted += 1
+                for piece in dashboard.compare_station_json(key, list(batches[key]), start_timestamp,
+                                                            end_timestamp, max_points, partial=True):
+                    yield piece
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield '}'
+
+    return StreamingResponse(generate(), media_type='application/json')
+
+
+def timed(route, endpoint):
+    """Métricas de ruta para los handlers asíncronos (las de Flask las toman sus hooks)
+
+    En las respuestas en streaming se mide hasta que empieza el envío.
+    """
+    async def handler(request):
+        started = time.perf_counter()
+        metrics.request_started(route)
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.request_finished(route, request.method, status, time.perf_counter() - started)
+    return handler
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    """Crear los clientes asíncronos en el event loop del worker y cerrar el pool al salir"""
+    # Abrir el almacén SQLite de días cerrados (si está configurado) fuera del event loop
+    await asyncio.to_thread(get_default_store)
+    for key, station in dashboard.STATIONS.items():
+        async_clients[key] = AsyncWeatherLinkClient(station['api_key'], station['api_secret'],
+                                                    station['station_id'])
+    try:
+        yield
+    finally:
+        await close_shared_async_client()
+
+
+# Gzip solo en las rutas JSON asíncronas: las respuestas de Flask ya pasan por
+# compression.py (que deja sin tocar binarios, SSE y cuerpos pequeños)
+_gzip = [Middleware(GZipMiddleware, minimum_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')))]
+
+app = Starlette(
+    routes=[
+        # Mismas etiquetas de ruta que las reglas de Flask
+        Route('/api/current', timed('/api/current', get_current_bundle), middleware=_gzip),
+        Route('/api/current/{station_key}', timed('/api/current/<station_key>', get_current_data),
+              middleware=_gzip),
+        Route('/api/stream', timed('/api/stream', api_stream)),
+        Route('/api/historical/{station_key}', timed('/api/historical/<station_key>', get_historical_data),
+              middleware=_gzip),
+        Route('/api/compare', timed('/api/compare', get_compare_data), middleware=_gzip),
+        # Todo lo demás: la app Flask en un pool de hilos
+        Mount('/', app=WSGIMiddleware(dashboard.app, workers=int(os.getenv('ASGI_WSGI_THREADS', '16')))),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,283 @@
+"""
+Backends de caché para el dashboard.
+
+- LRUCache: en memoria del proceso, acotada a CACHE_MAX_ENTRIES con
+  desalojo LRU y expiración por TTL.
+- PersistentLRUCache: LRUCache con copia en un archivo SQLite local
+  (CACHE_SNAPSHOT_PATH). Un worker recién creado (p. ej. tras el reciclado
+  por max_requests de gunicorn) arranca con las entradas vigentes y consulta
+  el archivo ante un fallo en memoria, en lugar de volver a llamar a
+  WeatherLink.
+- RedisCache: compartida por todos los workers de gunicorn a través del
+  Redis del docker-compose; cada clave expira con su TTL.
+
+create_cache() elige el backend con CACHE_BACKEND (memory | redis) y, si
+Redis no está disponible, opera con la LRU en memoria (persistente si
+CACHE_SNAPSHOT_PATH no está vacío).
+
+Interfaz común:
+    get(key, ttl)          -> valor o None si no existe o tiene más de ttl segundos
+    get_many(keys, ttl)    -> {key: valor} solo con las claves vigentes
+    set(key, value, ttl)   -> guardar (ttl = vida máxima de la entrada)
+    add(key, value, ttl)   -> guardar solo si la clave no existe; True si se guardó
+    shared                 -> True si todos los workers ven las mismas entradas
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Caché en memoria acotada (LRU + TTL)"""
+
+    shared = False
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (stored_at, expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, expires_at, value = entry
+            if now >= expires_at:
+                del self._data[key]
+                return None
+            if now - stored_at >= ttl:
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys, ttl):
+        result = {}
+        for key in keys:
+            value = self.get(key, ttl)
+            if value is not None:
+                result[key] = value
+        return result
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._data[key] = (now, now + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now < entry[1]:
+                return False
+            self._data[key] = (now, now + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PersistentLRUCache(LRUCache):
+    """LRU en memoria con escritura directa a un snapshot SQLite compartido por los workers"""
+
+    # Cada cuántas escrituras se eliminan del archivo las entradas vencidas
+    PRUNE_EVERY = 500
+
+    def __init__(self, path, max_entries=5000):
+        super().__init__(max_entries=max_entries)
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                value TEXT NOT NULL
+            )
+            """
+        )
+        conn.commit()
+
+    def _connection(self):
+        """Una conexión por hilo y por proceso (se reabre tras el fork de gunicorn)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def warm(self):
+        """Cargar en memoria las entradas vigentes más recientes del snapshot"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+            conn.commit()
+            rows = conn.execute(
+                'SELECT key, stored_at, expires_at, value FROM cache_entries '
+                'ORDER BY stored_at DESC LIMIT ?',
+                (self.max_entries,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ Error cargando snapshot de caché ({self.path}): {e}")
+            return 0
+
+        with self._lock:
+            # Insertar de la más antigua a la más reciente para respetar el orden LRU
+            for key, stored_at, expires_at, value in reversed(rows):
+                self._data[key] = (stored_at, expires_at, json.loads(value))
+        return len(rows)
+
+    def get(self, key, ttl):
+        value = super().get(key, ttl)
+        if value is not None:
+            return value
+
+        # Fallo en memoria: otro worker (o uno ya reciclado) pudo haberla guardado
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                'SELECT stored_at, expires_at, value FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Error leyendo snapshot de caché ({key}): {e}")
+            return None
+        if row is None:
+            return None
+        stored_at, expires_at, raw = row
+        if now >= expires_at or now - stored_at >= ttl:
+            return None
+
+        value = json.loads(raw)
+        with self._lock:
+            self._data[key] = (stored_at, expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return value
+
+    def set(self, key, value, ttl):
+        super().set(key, value, ttl)
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, stored_at, expires_at, value) VALUES (?, ?, ?, ?)',
+                (key, now, now + ttl, json.dumps(value, separators=(',', ':'))),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+            conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"⚠️ Error guardando snapshot de caché ({key}): {e}")
+
+
+class RedisCache:
+    """Caché compartida entre procesos en Redis (valores JSON con marca de tiempo)"""
+
+    shared = True
+
+    def __init__(self, redis_client, prefix='weatherlink:cache:'):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def _decode(self, raw, ttl, now):
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if now - entry['t'] >= ttl:
+            return None
+        return entry['v']
+
+    def get(self, key, ttl):
+        try:
+            raw = self.redis.get(self.prefix + key)
+            return self._decode(raw, ttl, time.time())
+        except Exception as e:
+            print(f"⚠️ Error leyendo caché Redis ({key}): {e}")
+            return None
+
+    def get_many(self, keys, ttl):
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            raws = self.redis.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            print(f"⚠️ Error leyendo caché Redis ({len(keys)} claves): {e}")
+            return {}
+        now = time.time()
+        result = {}
+        for key, raw in zip(keys, raws):
+            value = self._decode(raw, ttl, now)
+            if value is not None:
+                result[key] = value
+        return result
+
+    def set(self, key, value, ttl):
+        try:
+            payload = json.dumps({'t': time.time(), 'v': value}, separators=(',', ':'))
+            self.redis.set(self.prefix + key, payload, ex=max(1, int(ttl)))
+        except Exception as e:
+            print(f"⚠️ Error guardando en caché Redis ({key}): {e}")
+
+    def add(self, key, value, ttl):
+        try:
+            payload = json.dumps({'t': time.time(), 'v': value}, separators=(',', ':'))
+            return bool(self.redis.set(self.prefix + key, payload, ex=max(1, int(ttl)), nx=True))
+        except Exception as e:
+            # Sin Redis cada worker sigue por su cuenta
+            print(f"⚠️ Error guardando en caché Redis ({key}): {e}")
+            return True
+
+
+def create_cache():
+    """Backend configurado por CACHE_BACKEND (memory | redis)"""
+    max_entries = int(os.getenv('CACHE_MAX_ENTRIES', '5000'))
+
+    if os.getenv('CACHE_BACKEND', 'memory').lower() == 'redis':
+        redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_url, socket_connect_timeout=1.0, socket_timeout=2.0)
+            client.ping()
+            print(f"✅ Caché compartida en Redis: {redis_url}")
+            return RedisCache(client)
+        except Exception as e:
+            print(f"⚠️ Redis no disponible para la caché ({e}). Usando LRU en memoria.")
+
+    snapshot_path = os.getenv('CACHE_SNAPSHOT_PATH', '')
+    if snapshot_path:
+        try:
+            cache = PersistentLRUCache(snapshot_path, max_entries=max_entries)
+            loaded = cache.warm()
+            print(f"✅ Caché precargada desde {snapshot_path} ({loaded} entradas)")
+            return cache
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Snapshot de caché no disponible en {snapshot_path}: {e}")
+
+    return LRUCache(max_entries=max_entries)
@@ -0,0 +1,162 @@
+"""
+Compresión negociada (brotli / gzip) de respuestas grandes.
+
+Se aplica en after_request a las respuestas de texto (JSON, CSV, HTML) de
+al menos COMPRESS_MIN_SIZE bytes según Accept-Encoding; brotli solo si el
+paquete está instalado. Las respuestas por partes (/api/compare, CSV de
+/api/export) se comprimen en streaming con un flush por parte, así cada
+parte llega al cliente en cuanto se genera; para decidir si llegan a
+COMPRESS_MIN_SIZE se leen las primeras partes antes de enviar las
+cabeceras. Los eventos SSE y los archivos binarios no se tocan.
+
+Los cuerpos completos se comprimen una sola vez: el resultado se guarda por
+ETag fuerte (versiones cacheadas de Supabase, /api/current) o, sin él, por
+hash del cuerpo (/api/historical con el mismo rango) y las peticiones
+siguientes reutilizan los bytes ya comprimidos.
+"""
+
+import hashlib
+import itertools
+import os
+import zlib
+
+from flask import request
+
+from cache_backend import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/csv',
+    'text/css',
+    'text/html',
+    'text/plain',
+}
+
+# Los cuerpos comprimidos por ETag o hash no cambian; el TTL solo acota su vida en memoria
+_PRECOMPRESSED_TTL = 3600
+
+
+class ResponseCompressor:
+    """Hook after_request que comprime según Accept-Encoding"""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, cache_entries=256,
+                 cache_max_bytes=1048576):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache = LRUCache(max_entries=cache_entries)
+        # Cuerpos comprimidos más grandes no se guardan (acota la memoria de la caché)
+        self.cache_max_bytes = cache_max_bytes
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def choose_encoding(self, accept_encodings):
+        if brotli is not None and accept_encodings.quality('br') > 0:
+            return 'br'
+        if accept_encodings.quality('gzip') > 0:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)  # 31 = formato gzip
+        return compressor.compress(data) + compressor.flush()
+
+    def _compress_stream(self, chunks, encoding, original):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            process, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            process, finish = compressor.compress, compressor.flush
+
+            def flush():
+                return compressor.flush(zlib.Z_SYNC_FLUSH)
+        try:
+            for chunk in chunks:
+                # Flush por parte: nada queda retenido en el compresor
+                data = process(chunk) + flush()
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            # Cerrar el generador original (p. ej. cancela las descargas de /api/compare)
+            if hasattr(original, 'close'):
+                original.close()
+
+    def _peek(self, chunks):
+        """(primeras partes, el stream sigue): lee hasta min_size bytes o hasta que termina"""
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= self.min_size:
+                return head, True
+        return head, False
+
+    def _cache_key(self, response, data, encoding):
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            return f"{etag}:{encoding}"
+        return f"body:{hashlib.blake2b(data, digest_size=16).hexdigest()}:{encoding}"
+
+    def after_request(self, response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            original = response.response
+            chunks = response.iter_encoded()
+            head, more = self._peek(chunks)
+            if not more:
+                # El stream terminó por debajo de min_size: se envía tal cual
+                response.set_data(b''.join(head))
+                return response
+            response.response = self._compress_stream(itertools.chain(head, chunks), encoding, original)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            cache_key = self._cache_key(response, data, encoding)
+            compressed = self.cache.get(cache_key, _PRECOMPRESSED_TTL)
+            if compressed is None:
+                compressed = self.compress(data, encoding)
+                if len(compressed) <= self.cache_max_bytes:
+                    self.cache.set(cache_key, compressed, _PRECOMPRESSED_TTL)
+            response.set_data(compressed)
+            etag, _ = response.get_etag()
+            if etag:
+                # Misma entidad, distinta representación: ETag débil (If-None-Match compara en débil)
+                response.set_etag(etag, weak=True)
+
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def create_compressor():
+    """Compresor configurado por COMPRESS_MIN_SIZE / COMPRESS_GZIP_LEVEL / COMPRESS_BROTLI_QUALITY"""
+    return ResponseCompressor(
+        min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+        gzip_level=int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+        brotli_quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', '5')),
+        cache_entries=int(os.getenv('COMPRESS_CACHE_ENTRIES', '256')),
+        cache_max_bytes=int(os.getenv('COMPRESS_CACHE_MAX_BYTES', '1048576')),
+    )
@@ -0,0 +1,122 @@
+"""
+Reducción de puntos en el servidor para los gráficos (parámetro max_points).
+
+Cada serie recibe una parte del presupuesto de puntos:
+
+- Series continuas (temperatura, humedad, viento, radiación, DPV):
+  Largest-Triangle-Three-Buckets (LTTB), que conserva la forma visual.
+- Lluvia: el máximo de cada bucket (solo buckets con lluvia), para no
+  perder los picos que LTTB podría saltarse.
+
+Los índices elegidos de todas las series se unen y se devuelven las filas
+originales en esas posiciones: el formato de la respuesta no cambia y todos
+los valores son lecturas reales.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from historic_columns import HistoricColumns
+
+# Series de los registros de WeatherLink que se dibujan
+RECORD_LINE_FIELDS = ('temperature', 'humidity', 'wind_speed', 'solar_radiation')
+RECORD_PEAK_FIELDS = ('rain',)
+
+# Series de /api/supabase/station/<key>/history
+HISTORY_LINE_FIELDS = ('temperatura', 'humedad', 'dpv', 'radiacion_solar')
+HISTORY_PEAK_FIELDS = ('lluvia',)
+
+
+def lttb_indices(x, y, n_out):
+    """Índices elegidos por LTTB (incluye siempre el primer y el último punto)"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 1)])
+
+    # n_out - 2 buckets con los puntos interiores [1, n - 1)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Área del triángulo (a, candidato, promedio del bucket siguiente) para todo el bucket a la vez
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def peak_indices(y, n_buckets):
+    """Índice del máximo de cada bucket con valor > 0 (vectorizado)"""
+    n = len(y)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    values = np.nan_to_num(y, nan=0.0)
+    n_buckets = max(1, min(n_buckets, n))
+    starts = np.unique(np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1])
+    bucket_max = np.maximum.reduceat(values, starts)
+    bucket_of = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    hits = np.flatnonzero((values == bucket_max[bucket_of]) & (values > 0))
+    # Primer índice de cada bucket que alcanza su máximo
+    _, first = np.unique(bucket_of[hits], return_index=True)
+    return hits[first]
+
+
+def downsample_indices(x, line_series, peak_series, max_points):
+    """Unión ordenada de los índices elegidos para cada serie"""
+    n = len(x)
+    if not max_points or max_points <= 0 or n <= max_points:
+        return np.arange(n)
+
+    budget = max(3, max_points // max(1, len(line_series) + len(peak_series)))
+    chosen = [np.array([0, n - 1], dtype=np.int64)]
+    for y in line_series:
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid):
+            chosen.append(valid[lttb_indices(x[valid], y[valid], budget)])
+    for y in peak_series:
+        chosen.append(peak_indices(y, budget))
+    return np.unique(np.concatenate(chosen))
+
+
+def downsample_records(records, max_points):
+    """Registros de get_historic_data reducidos a ~max_points (mismo formato)"""
+    if not max_points or len(records) <= max_points:
+        return records
+    records = [r for r in records if r.get('timestamp') is not None]
+    columns = HistoricColumns.from_records(records)
+    indices = downsample_indices(
+        columns.timestamps.astype(np.float64),
+        [columns[name] for name in RECORD_LINE_FIELDS],
+        [columns[name] for name in RECORD_PEAK_FIELDS],
+        max_points,
+    )
+    return [records[i] for i in indices.tolist()]
+
+
+def _as_float_array(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def downsample_history(data, max_points):
+    """Historial de Supabase (listas paralelas por campo) reducido a ~max_points"""
+    timestamps = data.get('timestamps') or []
+    if not max_points or len(timestamps) <= max_points:
+        return data
+    x = np.array([datetime.fromisoformat(ts.replace('Z', '+00:00')).timestamp() for ts in timestamps])
+    indices = downsample_indices(
+        x,
+        [_as_float_array(data[name]) for name in HISTORY_LINE_FIELDS],
+        [_as_float_array(data[name]) for name in HISTORY_PEAK_FIELDS],
+        max_points,
+    ).tolist()
+    return {name: [values[i] for i in indices] for name, values in data.items()}
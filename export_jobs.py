@@ -0,0 +1,278 @@
+"""
+Trabajos de exportación en segundo plano.
+
+Las exportaciones largas (varios meses, varias estaciones) no caben en el
+timeout de 120 s de gunicorn. Un trabajo se envía, recibe un id y queda en
+EXPORT_JOBS_DIR, compartido por todos los workers; el progreso (días
+procesados / días totales) y el archivo final se escriben ahí mismo.
+
+Dónde se ejecutan (EXPORT_JOBS_RUNNER):
+- worker: en un proceso aparte (export_worker.py, servicio export-worker de
+  docker-compose) que toma los trabajos en cola. El reciclado de los workers
+  web (max_requests) no interrumpe las exportaciones.
+- thread: en un pool de hilos del propio worker web (desarrollo).
+
+Cada día se pide a la caché histórica por buckets (historic_cache.py, la
+misma de la app; compartida con CACHE_BACKEND=redis), y los días UTC ya
+cerrados también salen del almacén histórico de los clientes
+(WEATHERLINK_HISTORIC_STORE), así que un nuevo trabajo sobre un rango que se
+solapa solo descarga los días que faltan.
+
+Estado de un trabajo (JSON en EXPORT_JOBS_DIR/<id>.json):
+    queued -> running -> done | failed
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from historic_export import stream_csv, stream_parquet, write_xlsx
+from historic_store import DAY_SECONDS
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ExportJobManager:
+    """Cola de exportaciones con estado y artefactos en disco"""
+
+    def __init__(self, clients, stations, directory, max_workers=2,
+                 ttl_seconds=86400, stale_seconds=600, run_in_process=True, historic_cache=None):
+        self.clients = clients
+        self.stations = stations
+        # HistoricRangeCache sobre los mismos clientes; sin ella se pide cada día al cliente
+        self.historic_cache = historic_cache
+        self.directory = directory
+        self.max_workers = max_workers
+        # Tiempo que se conservan trabajos y archivos terminados
+        self.ttl_seconds = ttl_seconds
+        # Un trabajo sin progreso en este tiempo murió con su proceso
+        self.stale_seconds = stale_seconds
+        # False: submit solo encola y los trabajos los ejecuta export_worker.py
+        self.run_in_process = run_in_process
+
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        # Trabajos tomados por run_worker que aún no terminan
+        self._running = set()
+
+    def _pool(self):
+        """Pool de hilos del proceso actual (se crea tras el fork de gunicorn)"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='export-job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _job_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def artifact_path(self, job):
+        return os.path.join(self.directory, f"{job['id']}.{job['artifact_ext']}")
+
+    def _save(self, job):
+        """Escritura atómica para que otros workers nunca lean un JSON a medias"""
+        job['updated_at'] = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_path(job['id']))
+
+    def get(self, job_id):
+        """Estado de un trabajo, o None si no existe"""
+        if not _JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        try:
+            with open(self._job_path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Los trabajos en cola de export_worker.py esperan lo necesario; los del
+        # pool de un worker web se pierden con él
+        interrupted = ('queued', 'running') if self.run_in_process else ('running',)
+        if job['status'] in interrupted and time.time() - job['updated_at'] > self.stale_seconds:
+            job['status'] = 'failed'
+            job['error'] = 'Trabajo interrumpido (el worker que lo ejecutaba terminó)'
+        return job
+
+    def submit(self, station_keys, start_timestamp, end_timestamp, export_format):
+        """Encolar una exportación; devuelve el estado inicial del trabajo"""
+        first_day = start_timestamp - start_timestamp % DAY_SECONDS
+        days_total = (end_timestamp - first_day) // DAY_SECONDS + 1
+
+        if len(station_keys) == 1:
+            name = self.stations[station_keys[0]]['name']
+            artifact_ext = export_format
+        else:
+            name = 'estaciones'
+            artifact_ext = 'zip'
+        period = (f"{time.strftime('%Y%m%d', time.gmtime(start_timestamp))}_"
+                  f"{time.strftime('%Y%m%d', time.gmtime(end_timestamp))}")
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'stations': list(station_keys),
+            'format': export_format,
+            'start_timestamp': start_timestamp,
+            'end_timestamp': end_timestamp,
+            'chunks_done': 0,
+            'chunks_total': days_total * len(station_keys),
+            'artifact_ext': artifact_ext,
+            'filename': f"{name}_datos_{period}.{artifact_ext}",
+            'error': None,
+            'created_at': time.time(),
+        }
+        self._save(job)
+        if self.run_in_process:
+            self._pool().submit(self._run, job)
+        self.cleanup()
+        return job
+
+    def _day_records(self, station_key, day):
+        """Registros de un día UTC desde la caché histórica (o el cliente si no hay caché)"""
+        if self.historic_cache is not None:
+            return self.historic_cache.get_range(station_key, day, day + DAY_SECONDS - 1)['records']
+        return self.clients[station_key].get_historic_data(day, day + DAY_SECONDS - 1)['records']
+
+    def _station_chunks(self, job, station_key):
+        """Un lote de registros por día del rango, actualizando el progreso"""
+        start, end = job['start_timestamp'], job['end_timestamp']
+        day = start - start % DAY_SECONDS
+        while day <= end:
+            records = self._day_records(station_key, day)
+            if day < start or day + DAY_SECONDS - 1 > end:
+                records = [r for r in records if r.get('timestamp') is not None
+                           and start <= r['timestamp'] <= end]
+            yield records
+            job['chunks_done'] += 1
+            self._save(job)
+            day += DAY_SECONDS
+
+    def _write_station(self, job, station_key, path):
+        chunks = self._station_chunks(job, station_key)
+        with open(path, 'wb') as f:
+            if job['format'] == 'xlsx':
+                write_xlsx(chunks, f)
+            else:
+                body = stream_csv(chunks) if job['format'] == 'csv' else stream_parquet(chunks)
+                for data in body:
+                    f.write(data)
+
+    def _run(self, job):
+        job['status'] = 'running'
+        self._save(job)
+        tmp_path = self.artifact_path(job) + '.part'
+        try:
+            if len(job['stations']) == 1:
+                self._write_station(job, job['stations'][0], tmp_path)
+            else:
+                # Varias estaciones: un archivo por estación dentro de un zip
+                with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for station_key in job['stations']:
+                        station_path = f"{tmp_path}.{station_key}"
+                        try:
+                            self._write_station(job, station_key, station_path)
+                            archive.write(station_path,
+                                          f"{self.stations[station_key]['name']}.{job['format']}")
+                        finally:
+                            if os.path.exists(station_path):
+                                os.remove(station_path)
+            os.replace(tmp_path, self.artifact_path(job))
+            job['status'] = 'done'
+            print(f"✅ Exportación {job['id']} terminada ({job['filename']})")
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            print(f"⚠️ Exportación {job['id']} fallida: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._save(job)
+
+    def _claim(self, job_id):
+        """Marcar un trabajo en cola como tomado (solo un proceso lo consigue)"""
+        try:
+            os.close(os.open(os.path.join(self.directory, f"{job_id}.claim"),
+                             os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def _queued_jobs(self):
+        """Trabajos en cola, del más antiguo al más reciente"""
+        jobs = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            job = self.get(entry.name[:-5])
+            if job is not None and job['status'] == 'queued':
+                jobs.append(job)
+        return sorted(jobs, key=lambda job: job['created_at'])
+
+    def _run_claimed(self, job):
+        try:
+            self._run(job)
+        finally:
+            with self._lock:
+                self._running.discard(job['id'])
+
+    def run_worker(self, poll_seconds=2.0, cleanup_seconds=3600):
+        """Bucle del proceso de exportación: ejecutar los trabajos en cola (como máximo max_workers a la vez)"""
+        os.makedirs(self.directory, exist_ok=True)
+        pool = self._pool()
+        last_cleanup = 0
+        print(f"⏳ Esperando trabajos de exportación en {self.directory} ({self.max_workers} a la vez)")
+        while True:
+            try:
+                for job in self._queued_jobs():
+                    with self._lock:
+                        if len(self._running) >= self.max_workers:
+                            break
+                    if not self._claim(job['id']):
+                        continue
+                    with self._lock:
+                        self._running.add(job['id'])
+                    pool.submit(self._run_claimed, job)
+                if time.time() - last_cleanup >= cleanup_seconds:
+                    self.cleanup()
+                    last_cleanup = time.time()
+            except Exception as e:
+                print(f"⚠️ Error revisando la cola de exportaciones: {e}")
+            time.sleep(poll_seconds)
+
+    def cleanup(self):
+        """Eliminar trabajos y archivos más antiguos que ttl_seconds"""
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - self.ttl_seconds
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def create_export_job_manager(clients, stations, run_in_process=None, historic_cache=None):
+    """Gestor configurado por EXPORT_JOBS_DIR / EXPORT_JOBS_RUNNER / EXPORT_JOB_WORKERS / EXPORT_JOB_TTL_SEC"""
+    return ExportJobManager(
+        clients,
+        stations,
+        os.getenv('EXPORT_JOBS_DIR', 'data/exports'),
+        max_workers=int(os.getenv('EXPORT_JOB_WORKERS', '2')),
+        ttl_seconds=int(os.getenv('EXPORT_JOB_TTL_SEC', '86400')),
+        stale_seconds=int(os.getenv('EXPORT_JOB_STALE_SEC', '600')),
+        run_in_process=(os.getenv('EXPORT_JOBS_RUNNER', 'thread').lower() != 'worker'
+                        if run_in_process is None else run_in_process),
+        historic_cache=historic_cache,
+    )
@@ -0,0 +1,40 @@
+"""
+Proceso de exportaciones en segundo plano (EXPORT_JOBS_RUNNER=worker).
+
+Ejecuta los trabajos que los workers web dejan en cola en EXPORT_JOBS_DIR
+(ver export_jobs.py), fuera de gunicorn: el reciclado de workers y su
+timeout no afectan a las exportaciones largas. Debe ver la misma carpeta
+EXPORT_JOBS_DIR (y, si se usan, el mismo WEATHERLINK_HISTORIC_STORE y la
+caché Redis de CACHE_BACKEND=redis) que la app.
+
+    python export_worker.py
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+from cache_backend import create_cache
+from export_jobs import create_export_job_manager
+from historic_cache import HistoricRangeCache
+from stations import create_stations
+from weatherlink_client import LazyClients
+
+
+def main():
+    load_dotenv()
+
+    stations = create_stations(configured_only=True)
+    if not stations:
+        raise RuntimeError('No hay estaciones configuradas correctamente en .env')
+
+    clients = LazyClients(stations)
+    # Mismos buckets que la app (misma clave hist:<estación>:...) si la caché es Redis
+    historic_cache = HistoricRangeCache(clients, create_cache())
+    manager = create_export_job_manager(clients, stations, run_in_process=False,
+                                        historic_cache=historic_cache)
+    manager.run_worker(poll_seconds=float(os.getenv('EXPORT_WORKER_POLL_SEC', '2')))
+
+
+if __name__ == '__main__':
+    main()
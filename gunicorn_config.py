@@ -8,8 +8,19 @@ bind = "0.0.0.0:8000"
 # Número de workers (2-4 x número de CPUs)
 workers = multiprocessing.cpu_count() * 2 + 1
 
-# Tipo de worker (sync para aplicaciones normales, gevent para async)
-worker_class = "sync"
+# Modo de servicio (SERVER_MODE):
+# - wsgi: app.py con workers gthread, para que las conexiones SSE de
+#   /api/stream (largas) ocupen un hilo y no un worker completo
+# - asgi: asgi.py con workers de uvicorn; las rutas que esperan a WeatherLink
+#   corren en un event loop por worker (ver asgi.py)
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+if SERVER_MODE == 'asgi':
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    worker_class = "gthread"
+    threads = int(os.getenv('GUNICORN_THREADS', '16'))
 
 # Timeout para requests largos (especialmente para datos históricos)
 timeout = 120
@@ -33,3 +44,43 @@ max_requests_jitter = 50
 
 # Preload de la aplicación (mejora el tiempo de inicio)
 preload_app = True
+
+# Snapshot de la caché en memoria para que los workers reciclados arranquen
+# con datos (ver post_fork); fuera de gunicorn queda deshabilitado salvo que
+# se defina CACHE_SNAPSHOT_PATH
+os.environ.setdefault('CACHE_SNAPSHOT_PATH', 'data/cache_snapshot.sqlite3')
+
+# Métricas de Prometheus agregadas entre workers (ver metrics.py): debe
+# fijarse antes de que la app importe prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/weatherlink_metrics')
+
+
+def on_starting(server):
+    """Vaciar las métricas de una ejecución anterior"""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(path, exist_ok=True)
+    for entry in os.scandir(path):
+        if entry.name.endswith('.db'):
+            os.remove(entry.path)
+
+
+def child_exit(server, worker):
+    """Descartar los gauges de un worker terminado (los contadores se conservan)"""
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Recargar la caché desde el snapshot local en cada worker nuevo.
+
+    Con preload_app el master ya la precargó al importar app.py; los workers
+    que nacen después (reciclados por max_requests) traen además las
+    entradas que guardaron sus predecesores.
+    """
+    from app import CACHE
+
+    if hasattr(CACHE, 'warm'):
+        CACHE.warm()
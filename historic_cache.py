@@ -0,0 +1,317 @@
+"""
+Caché de datos históricos alineada a buckets de tiempo.
+
+En lugar de cachear cada rango exacto (start_ts, end_ts) — que cambia cada
+segundo en las vistas "últimos N días" — los registros se guardan por
+estación y bucket UTC alineado (por defecto 1 hora). Cualquier rango se arma
+a partir de los buckets cacheados y solo se piden a WeatherLink los buckets
+que faltan o que siguen abiertos (el bucket en curso).
+
+Un bucket solo se guarda si WeatherLink respondió por él: los buckets de un
+chunk que falló (FailedChunk: 429/5xx agotados, timeout, rate limit) se
+sirven vacíos en esa respuesta pero no se cachean, y refresh_open lanza
+excepción para que el refresco en segundo plano lo reintente con backoff.
+
+Con stale_seconds > 0, un bucket abierto vencido hace menos de
+stale_seconds se sirve igual y se avisa a on_stale(station_key) para
+refrescar los buckets abiertos en segundo plano (ver refresher.py).
+
+En las versiones asíncronas (aiter_range / aget_range) las lecturas y
+escrituras de la caché (SQLite, Redis) se hacen en un hilo con
+asyncio.to_thread para no bloquear el event loop.
+"""
+
+import os
+import time
+
+from weatherlink_client import FailedChunk
+
+
+class HistoricRangeCache:
+    """Ensambla rangos históricos desde buckets cacheados
+
+    cache es un backend de cache_backend (get / get_many / set).
+    """
+
+    def __init__(self, clients, cache, bucket_seconds=None, open_ttl=None, closed_ttl=None,
+                 grace_seconds=None, stale_seconds=0, on_stale=None, empty_ttl=None):
+        self.clients = clients
+        self.cache = cache
+        self.bucket_seconds = bucket_seconds or int(os.getenv('HISTORIC_BUCKET_SEC', '3600'))
+        # Buckets abiertos se refrescan con el TTL normal de la caché
+        self.open_ttl = open_ttl or int(os.getenv('CACHE_TTL', '300'))
+        # Buckets cerrados no cambian; el TTL solo limita cuánto viven en memoria
+        self.closed_ttl = closed_ttl or int(os.getenv('HISTORIC_BUCKET_TTL', '86400'))
+        # Margen tras el fin del bucket para registros de archivo que llegan tarde
+        self.grace_seconds = grace_seconds if grace_seconds is not None else int(
+            os.getenv('HISTORIC_BUCKET_GRACE_SEC', '900'))
+        # Buckets cerrados sin registros (estación sin conexión): se vuelven a
+        # consultar tras este TTL por si la estación sube su archivo más tarde
+        self.empty_ttl = empty_ttl or int(os.getenv('HISTORIC_EMPTY_BUCKET_TTL', '21600'))
+        # Ventana en la que un bucket abierto vencido aún se sirve mientras se refresca
+        self.stale_seconds = stale_seconds
+        self.on_stale = on_stale
+
+    def _bucket_key(self, station_key, bucket):
+        return f"hist:{station_key}:{self.bucket_seconds}:{bucket}"
+
+    def _load_buckets(self, station_key, buckets, include_open=True):
+        """({bucket: registros} de los buckets en caché utilizables, hay buckets vencidos)
+
+        Sin include_open solo se devuelven los buckets cerrados.
+        """
+        keys = {self._bucket_key(station_key, bucket): bucket for bucket in buckets}
+        entries = self.cache.get_many(keys, self.closed_ttl)
+        now = time.time()
+        loaded = {}
+        stale = False
+        for key, entry in entries.items():
+            if not entry['complete']:
+                age = now - entry['fetched_at']
+                if not include_open or age >= self.open_ttl + self.stale_seconds:
+                    continue
+                stale = stale or age >= self.open_ttl
+            loaded[keys[key]] = entry['records']
+        return loaded, stale
+
+    def _store_bucket(self, station_key, bucket, records, fetched_at):
+        complete = bucket + self.bucket_seconds + self.grace_seconds <= fetched_at
+        if not complete:
+            ttl = self.open_ttl + self.stale_seconds
+        else:
+            ttl = self.closed_ttl if records else self.empty_ttl
+        self.cache.set(self._bucket_key(station_key, bucket), {
+            'records': records,
+            'complete': complete,
+            'fetched_at': fetched_at,
+        }, ttl)
+
+    def _failed(self, bucket, failed):
+        """True si el bucket se solapa con algún chunk fallido [(inicio, fin), ...]"""
+        return any(bucket <= end and bucket + self.bucket_seconds > start for start, end in failed)
+
+    def _add_records(self, pending, run_start, run_end, chunk_records):
+        for record in chunk_records:
+            ts = record.get('timestamp')
+            if ts is None or not run_start <= ts < run_end:
+                continue
+            pending.setdefault(ts - ts % self.bucket_seconds, []).append(record)
+
+    def _flush_buckets(self, station_key, pending, bucket, until, now, failed=()):
+        """Guardar los buckets [bucket, until) salvo los de chunks fallidos
+
+        Devuelve (siguiente bucket, [(bucket, registros, guardado)]).
+        """
+        done = []
+        while bucket < until:
+            records = pending.pop(bucket, [])
+            stored = not self._failed(bucket, failed)
+            if stored:
+                self._store_bucket(station_key, bucket, records, now)
+            done.append((bucket, records, stored))
+            bucket += self.bucket_seconds
+        return bucket, done
+
+    def _fetch_run(self, station_key, run_start, run_end, now, max_workers=None, limit=None, cancel=None):
+        """Descargar buckets faltantes consecutivos; produce (bucket, registros, guardado) en orden"""
+        pending = {}
+        failed = []
+        bucket = run_start
+        client = self.clients[station_key]
+        for chunk_records in client.iter_historic_data(run_start, min(run_end, int(now)), max_workers,
+                                                       limit=limit, cancel=cancel):
+            if isinstance(chunk_records, FailedChunk):
+                failed.append((chunk_records.start, chunk_records.end))
+            self._add_records(pending, run_start, run_end, chunk_records)
+            # Los registros llegan ordenados: los buckets anteriores al último ya están completos
+            if pending:
+                bucket, done = self._flush_buckets(station_key, pending, bucket, max(pending), now, failed)
+                yield from done
+        yield from self._flush_buckets(station_key, pending, bucket, run_end, now, failed)[1]
+
+    async def _afetch_run(self, station_key, run_start, run_end, now, max_workers=None, limit=None):
+        """Versión de _fetch_run para clientes asíncronos (AsyncWeatherLinkClient)"""
+        import asyncio
+
+        pending = {}
+        failed = []
+        bucket = run_start
+        client = self.clients[station_key]
+        async for chunk_records in client.iter_historic_data(run_start, min(run_end, int(now)), max_workers,
+                                                             limit=limit):
+            if isinstance(chunk_records, FailedChunk):
+                failed.append((chunk_records.start, chunk_records.end))
+            self._add_records(pending, run_start, run_end, chunk_records)
+            if pending:
+                bucket, done = await asyncio.to_thread(self._flush_buckets, station_key, pending,
+                                                       bucket, max(pending), now, failed)
+                for item in done:
+                    yield item
+        _, done = await asyncio.to_thread(self._flush_buckets, station_key, pending, bucket, run_end,
+                                          now, failed)
+        for item in done:
+            yield item
+
+    def _plan(self, station_key, start_timestamp, end_timestamp, refresh=False):
+        """Segmentos del rango en orden: ('cached', registros) por bucket en caché
+        o ('fetch', inicio, fin) por cada tramo de buckets faltantes consecutivos
+
+        Con refresh, los buckets abiertos se vuelven a descargar aunque sigan vigentes.
+        """
+        size = self.bucket_seconds
+        first = start_timestamp - start_timestamp % size
+        last = end_timestamp - end_timestamp % size
+
+        # Una sola consulta a la caché para todos los buckets del rango
+        cached, stale = self._load_buckets(station_key, range(first, last + 1, size),
+                                           include_open=not refresh)
+        if stale and self.on_stale is not None:
+            self.on_stale(station_key)
+
+        segments = []
+        bucket = first
+        while bucket <= last:
+            records = cached.pop(bucket, None)
+            if records is not None:
+                segments.append(('cached', records))
+                bucket += size
+            else:
+                # Agrupar buckets faltantes consecutivos en una sola descarga
+                run_end = bucket + size
+                while run_end <= last and run_end not in cached:
+                    run_end += size
+                segments.append(('fetch', bucket, run_end))
+                bucket = run_end
+        return segments
+
+    def iter_range(self, station_key, start_timestamp, end_timestamp, stats=None, batch_buckets=24,
+                   max_workers=None, refresh=False, limit=None, cancel=None):
+        """Generador de registros en [start, end] en orden de timestamp
+
+        Produce listas de registros (hasta batch_buckets buckets por lista).
+        Si se pasa stats (dict), se anota cuántos buckets vinieron de caché,
+        cuántos de WeatherLink y cuántos no se pudieron descargar (no se
+        cachean). max_workers limita los chunks descargados en paralelo (ver
+        WeatherLinkClient.iter_historic_data, igual que limit y cancel).
+        Con refresh se vuelven a descargar los buckets abiertos aunque sigan
+        vigentes.
+        """
+        stats = _init_stats(stats)
+        now = time.time()
+
+        def in_range(records):
+            return [r for r in records if start_timestamp <= r['timestamp'] <= end_timestamp]
+
+        batch = []
+        batch_count = 0
+        for segment in self._plan(station_key, start_timestamp, end_timestamp, refresh):
+            if segment[0] == 'cached':
+                stats['cached_buckets'] += 1
+                batch.extend(in_range(segment[1]))
+                batch_count += 1
+            else:
+                for _, fetched, stored in self._fetch_run(station_key, segment[1], segment[2], now,
+                                                          max_workers, limit, cancel):
+                    stats['fetched_buckets'] += 1
+                    if not stored:
+                        stats['failed_buckets'] += 1
+                    batch.extend(in_range(fetched))
+                    batch_count += 1
+                    if batch_count >= batch_buckets:
+                        yield batch
+                        batch, batch_count = [], 0
+
+            if batch_count >= batch_buckets:
+                yield batch
+                batch, batch_count = [], 0
+
+        if batch:
+            yield batch
+
+    async def aiter_range(self, station_key, start_timestamp, end_timestamp, stats=None, batch_buckets=24,
+                          max_workers=None, limit=None):
+        """Versión asíncrona de iter_range (requiere clientes AsyncWeatherLinkClient;
+        limit es un asyncio.Semaphore)"""
+        import asyncio
+
+        stats = _init_stats(stats)
+        now = time.time()
+
+        def in_range(records):
+            return [r for r in records if start_timestamp <= r['timestamp'] <= end_timestamp]
+
+        batch = []
+        batch_count = 0
+        for segment in await asyncio.to_thread(self._plan, station_key, start_timestamp, end_timestamp):
+            if segment[0] == 'cached':
+                stats['cached_buckets'] += 1
+                batch.extend(in_range(segment[1]))
+                batch_count += 1
+            else:
+                async for _, fetched, stored in self._afetch_run(station_key, segment[1], segment[2], now,
+                                                                 max_workers, limit):
+                    stats['fetched_buckets'] += 1
+                    if not stored:
+                        stats['failed_buckets'] += 1
+                    batch.extend(in_range(fetched))
+                    batch_count += 1
+                    if batch_count >= batch_buckets:
+                        yield batch
+                        batch, batch_count = [], 0
+
+            if batch_count >= batch_buckets:
+                yield batch
+                batch, batch_count = [], 0
+
+        if batch:
+            yield batch
+
+    def _range_result(self, station_key, start_timestamp, end_timestamp, records, stats):
+        return {
+            'station_id': self.clients[station_key].station_id,
+            'start_timestamp': start_timestamp,
+            'end_timestamp': end_timestamp,
+            'records': records,
+            'from_cache': stats['fetched_buckets'] == 0,
+        }
+
+    def get_range(self, station_key, start_timestamp, end_timestamp):
+        """Mismo formato que WeatherLinkClient.get_historic_data (+ from_cache)"""
+        stats = {}
+        records = []
+        for batch in self.iter_range(station_key, start_timestamp, end_timestamp, stats):
+            records.extend(batch)
+        return self._range_result(station_key, start_timestamp, end_timestamp, records, stats)
+
+    def refresh_open(self, station_key, start_timestamp, end_timestamp):
+        """Volver a descargar los buckets abiertos (o faltantes) del rango
+
+        Lanza excepción si algún chunk falló (los buckets anteriores se conservan).
+        """
+        stats = {}
+        for _ in self.iter_range(station_key, start_timestamp, end_timestamp, stats, refresh=True):
+            pass
+        if stats['failed_buckets']:
+            raise Exception(f"{stats['failed_buckets']} buckets de {station_key} no se pudieron descargar")
+
+    def refresh_recent(self, station_key):
+        """Volver a descargar los buckets que aún pueden cambiar (los abiertos, hasta ahora)"""
+        now = int(time.time())
+        self.refresh_open(station_key, now - self.bucket_seconds - self.grace_seconds, now)
+
+    async def aget_range(self, station_key, start_timestamp, end_timestamp):
+        """Versión asíncrona de get_range"""
+        stats = {}
+        records = []
+        async for batch in self.aiter_range(station_key, start_timestamp, end_timestamp, stats):
+            records.extend(batch)
+        return self._range_result(station_key, start_timestamp, end_timestamp, records, stats)
+
+
+def _init_stats(stats):
+    if stats is None:
+        stats = {}
+    stats.setdefault('cached_buckets', 0)
+    stats.setdefault('fetched_buckets', 0)
+    stats.setdefault('failed_buckets', 0)
+    return stats
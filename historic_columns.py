@@ -0,0 +1,117 @@
+"""
+Contenedor columnar (NumPy) para registros históricos de WeatherLink.
+
+En lugar de una lista de diccionarios por registro, guarda un arreglo de
+timestamps y un arreglo float64 por campo (NaN = sin dato). Las conversiones
+°F→°C, mph→km/h y el DPV se calculan de forma vectorizada, y la lista de
+diccionarios original solo se construye bajo demanda con to_records().
+"""
+
+import numpy as np
+
+# Campos numéricos de cada registro histórico (ver WeatherLinkClient._parse_historic_records)
+FLOAT_FIELDS = (
+    'temperature',
+    'humidity',
+    'wind_speed',
+    'wind_dir',
+    'rain',
+    'solar_radiation',
+    'uv_index',
+    'dew_point',
+)
+
+
+def _nan_to_none(values):
+    """Lista de Python con None en lugar de NaN"""
+    return [None if v != v else v for v in values.tolist()]
+
+
+class HistoricColumns:
+    """Registros históricos en columnas ordenadas por timestamp"""
+
+    def __init__(self, timestamps, columns, rain_field=None):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.columns = {name: np.asarray(columns[name], dtype=np.float64) for name in FLOAT_FIELDS}
+        if rain_field is None:
+            rain_field = np.full(len(self.timestamps), None, dtype=object)
+        self.rain_field = np.asarray(rain_field, dtype=object)
+
+    @classmethod
+    def from_records(cls, records):
+        """Construir desde la lista de diccionarios de get_historic_data"""
+        records = [r for r in records if r.get('timestamp') is not None]
+        timestamps = np.fromiter((r['timestamp'] for r in records), dtype=np.int64, count=len(records))
+        columns = {}
+        for name in FLOAT_FIELDS:
+            columns[name] = np.fromiter(
+                (np.nan if r.get(name) is None else r[name] for r in records),
+                dtype=np.float64,
+                count=len(records),
+            )
+        rain_field = np.array([r.get('rain_field') for r in records], dtype=object)
+        return cls(timestamps, columns, rain_field)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, key):
+        """Indexar/recortar por posición (slice, máscara booleana o índices)"""
+        if isinstance(key, str):
+            return self.columns[key]
+        return HistoricColumns(
+            self.timestamps[key],
+            {name: values[key] for name, values in self.columns.items()},
+            self.rain_field[key],
+        )
+
+    def slice_time(self, start_timestamp=None, end_timestamp=None):
+        """Registros con start_timestamp <= ts <= end_timestamp (búsqueda binaria)"""
+        lo = 0 if start_timestamp is None else np.searchsorted(self.timestamps, start_timestamp, side='left')
+        hi = len(self) if end_timestamp is None else np.searchsorted(self.timestamps, end_timestamp, side='right')
+        return self[lo:hi]
+
+    # ------------------------------------------------------------------
+    # Conversiones vectorizadas
+    # ------------------------------------------------------------------
+
+    def temperature_c(self):
+        """Temperatura en °C (la API entrega °F)"""
+        return (self.columns['temperature'] - 32.0) * 5.0 / 9.0
+
+    def wind_speed_kmh(self):
+        """Velocidad del viento en km/h (la API entrega mph)"""
+        return self.columns['wind_speed'] * 1.60934
+
+    def vpd(self):
+        """DPV (Déficit de Presión de Vapor) en kPa usando la ecuación de Tetens"""
+        temp_c = self.temperature_c()
+        vpsat = 0.6108 * np.exp((17.27 * temp_c) / (temp_c + 237.3))
+        vpactual = (self.columns['humidity'] / 100.0) * vpsat
+        return vpsat - vpactual
+
+    # ------------------------------------------------------------------
+    # Conversión al formato original
+    # ------------------------------------------------------------------
+
+    def to_records(self):
+        """Lista de diccionarios con el mismo formato que get_historic_data"""
+        columns = {name: _nan_to_none(values) for name, values in self.columns.items()}
+        rain_field = self.rain_field.tolist()
+        records = []
+        for i, ts in enumerate(self.timestamps.tolist()):
+            rain = columns['rain'][i]
+            records.append({
+                'timestamp': ts,
+                'temperature': columns['temperature'][i],
+                'humidity': columns['humidity'][i],
+                'wind_speed': columns['wind_speed'][i],
+                'wind_dir': columns['wind_dir'][i],
+                'rain': rain,
+                'rain_mm': rain,
+                'rain_field': rain_field[i],
+                'solar_radiation': columns['solar_radiation'][i],
+                'uv_index': columns['uv_index'][i],
+                'dew_point': columns['dew_point'][i],
+            })
+        return records
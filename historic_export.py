@@ -0,0 +1,193 @@
+"""
+Exportación de datos históricos a Excel, CSV y Parquet.
+
+Los registros llegan por partes (un día de buckets por lote desde
+HistoricRangeCache.iter_range) y se convierten con HistoricColumns. Ningún
+formato guarda el rango completo en memoria:
+
+- Excel: openpyxl en modo write-only (las filas van a un archivo temporal),
+  con anchos de columna calculados de antemano a partir de los encabezados.
+- CSV y Parquet: se generan en streaming; cada día se envía al cliente en
+  cuanto se descarga (Parquet escribe un row group por lote).
+"""
+
+import csv
+from io import StringIO
+
+import numpy as np
+
+from historic_columns import HistoricColumns
+
+# Ecuador UTC-5: los timestamps de WeatherLink son UTC
+ECUADOR_OFFSET_SECONDS = 5 * 3600
+
+EXPORT_HEADERS = ['Fecha y Hora', 'Temperatura (°C)', 'Humedad (%)', 'Viento (km/h)',
+                  'Lluvia (mm)', 'Radiación Solar (W/m²)', 'DPV (kPa)']
+
+# Nombres de columna en Parquet (sin espacios ni símbolos, mismo orden)
+PARQUET_COLUMNS = ['fecha_hora', 'temperatura_c', 'humedad_pct', 'viento_kmh',
+                   'lluvia_mm', 'radiacion_solar_wm2', 'dpv_kpa']
+
+# "YYYY-MM-DD HH:MM:SS"
+DATETIME_WIDTH = 19
+
+
+def column_widths(headers=EXPORT_HEADERS):
+    """Ancho de cada columna de Excel (encabezado + 2, máximo 30)
+
+    La primera columna se ajusta a la fecha; el resto de valores numéricos
+    son más cortos que su encabezado.
+    """
+    widths = [len(header) for header in headers]
+    widths[0] = max(widths[0], DATETIME_WIDTH)
+    return [min(width + 2, 30) for width in widths]
+
+
+def export_columns(records):
+    """(hora local Ecuador como datetime64[s], [arrays float de cada columna numérica])"""
+    columns = HistoricColumns.from_records(records)
+    local_times = (columns.timestamps - ECUADOR_OFFSET_SECONDS).astype('datetime64[s]')
+    values = [
+        columns.temperature_c().round(2),       # F -> C
+        columns['humidity'],
+        columns.wind_speed_kmh().round(2),      # mph -> km/h
+        columns['rain'].round(2),               # el backend ya entrega mm
+        columns['solar_radiation'],
+        columns.vpd().round(3),
+    ]
+    return local_times, values
+
+
+def iter_rows(chunks):
+    """Filas [fecha, valores...] de cada lote; NaN = sin dato -> None"""
+    for records in chunks:
+        if not records:
+            continue
+        local_times, values = export_columns(records)
+        times = np.char.replace(local_times.astype(str), 'T', ' ').tolist()
+        for when, *row in zip(times, *(column.tolist() for column in values)):
+            yield [when] + [None if value != value else value for value in row]
+
+
+def write_xlsx(chunks, fileobj, title="Datos Meteorológicos"):
+    """Escribir el Excel en `fileobj` con un workbook write-only"""
+    # openpyxl tarda ~0.25 s en importarse y solo lo usa la exportación a Excel
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+
+    # En modo write-only los anchos deben fijarse antes de la primera fila
+    for col, width in enumerate(column_widths(), 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+
+    # Estilo para encabezados
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(color="FFFFFF", bold=True)
+    header_row = []
+    for header in EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal='center')
+        header_row.append(cell)
+    ws.append(header_row)
+
+    for row in iter_rows(chunks):
+        ws.append(row)
+
+    wb.save(fileobj)
+
+
+def stream_csv(chunks):
+    """Generador de bytes CSV (UTF-8 con BOM para que Excel respete los acentos)"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_HEADERS)
+    yield buffer.getvalue().encode('utf-8')
+
+    for records in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(iter_rows([records]))
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+
+def csv_error_row(message):
+    """Última fila de un CSV interrumpido (para no confundirlo con uno completo)"""
+    buffer = StringIO()
+    csv.writer(buffer).writerow([f"ERROR: exportación incompleta ({message})"])
+    return buffer.getvalue().encode('utf-8')
+
+
+class _ByteSink:
+    """Destino de escritura de pyarrow que acumula bytes hasta que se drenan"""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def stream_parquet(chunks):
+    """Generador de bytes Parquet: un row group por lote recibido
+
+    pyarrow es opcional; si no está instalado se lanza ImportError aquí,
+    antes de empezar a enviar la respuesta.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [pa.field(PARQUET_COLUMNS[0], pa.timestamp('s'))]
+    fields += [pa.field(name, pa.float64()) for name in PARQUET_COLUMNS[1:]]
+    schema = pa.schema(fields)
+
+    def generate():
+        sink = _ByteSink()
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        try:
+            for records in chunks:
+                if not records:
+                    continue
+                local_times, values = export_columns(records)
+                arrays = [pa.array(local_times, type=pa.timestamp('s'))]
+                # NaN -> null
+                arrays += [pa.array(column, type=pa.float64(), from_pandas=True) for column in values]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    return generate()
@@ -0,0 +1,121 @@
+"""
+Almacén persistente (SQLite) de días históricos de WeatherLink.
+
+Los datos de archivo de un día UTC ya cerrado no cambian, así que se guardan
+una sola vez por (station_id, día) y se reutilizan entre peticiones, workers
+de gunicorn y reinicios. Solo el día en curso y los días faltantes se piden
+a la API.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DAY_SECONDS = 86400
+
+
+class HistoricChunkStore:
+    """Caché en disco de registros históricos normalizados por día UTC"""
+
+    def __init__(self, path, grace_seconds=3600):
+        self.path = path
+        # Margen tras la medianoche UTC antes de considerar un día como cerrado
+        # (la estación puede subir registros de archivo con algo de retraso)
+        self.grace_seconds = grace_seconds
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS historic_days (
+                station_id TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                records TEXT NOT NULL,
+                fetched_at INTEGER NOT NULL,
+                PRIMARY KEY (station_id, day)
+            )
+            """
+        )
+        conn.commit()
+
+    def _connection(self):
+        """Una conexión por hilo (los chunks se descargan en paralelo)
+
+        Se reabre tras un fork: con preload_app el almacén se crea en el master
+        de gunicorn y una conexión SQLite no debe compartirse entre procesos.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            # WAL permite lectores concurrentes de varios workers de gunicorn
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def day_start(timestamp):
+        """Inicio (medianoche UTC) del día que contiene timestamp"""
+        return int(timestamp) - int(timestamp) % DAY_SECONDS
+
+    def is_day_closed(self, day, now=None):
+        """True si el día UTC terminó hace más de grace_seconds"""
+        if now is None:
+            now = time.time()
+        return day + DAY_SECONDS + self.grace_seconds <= now
+
+    def get(self, station_id, day):
+        """Registros guardados del día, o None si no está en el almacén"""
+        try:
+            row = self._connection().execute(
+                'SELECT records FROM historic_days WHERE station_id = ? AND day = ?',
+                (str(station_id), int(day)),
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Error leyendo almacén histórico ({station_id}, {day}): {e}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, station_id, day, records):
+        """Guardar los registros de un día cerrado"""
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO historic_days (station_id, day, records, fetched_at) '
+                'VALUES (?, ?, ?, ?)',
+                (str(station_id), int(day), json.dumps(records), int(time.time())),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Error guardando en almacén histórico ({station_id}, {day}): {e}")
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Almacén configurado con WEATHERLINK_HISTORIC_STORE (sin definir = deshabilitado)"""
+    global _default_store
+    path = os.getenv('WEATHERLINK_HISTORIC_STORE', '')
+    if not path:
+        return None
+    if _default_store is None or _default_store.path != path:
+        with _default_store_lock:
+            if _default_store is None or _default_store.path != path:
+                grace = int(os.getenv('WEATHERLINK_HISTORIC_STORE_GRACE_SEC', '3600'))
+                try:
+                    _default_store = HistoricChunkStore(path, grace_seconds=grace)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠️ Almacén histórico no disponible en {path}: {e}")
+                    return None
+    return _default_store
@@ -0,0 +1,59 @@
+"""
+Proveedor JSON de Flask basado en orjson.
+
+Las respuestas de históricos y comparación son listas grandes de floats;
+orjson las serializa varias veces más rápido que el módulo json estándar y
+maneja de forma nativa UUID, dataclasses y arrays de NumPy. Los NaN se
+envían como null (JSON válido). datetime y date se pasan a default, así que
+siguen saliendo como fecha HTTP (RFC 822), igual que con el proveedor de Flask.
+
+Se elige con JSON_PROVIDER (orjson | default). Si orjson no está instalado
+se mantiene el proveedor por defecto de Flask.
+"""
+
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Mismo comportamiento que DefaultJSONProvider (claves ordenadas) usando orjson"""
+
+    def _options(self, pretty=False):
+        option = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                  | orjson.OPT_PASSTHROUGH_DATETIME)
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # Opciones propias de json.dumps (cls, ensure_ascii...) -> proveedor estándar
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(pretty))
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def configure_json(app):
+    """Instalar el proveedor configurado en JSON_PROVIDER"""
+    provider = os.getenv('JSON_PROVIDER', 'orjson').lower()
+    if provider == 'orjson':
+        if orjson is None:
+            print("⚠️ orjson no está instalado. Usando el proveedor JSON por defecto.")
+            return
+        app.json = OrjsonProvider(app)
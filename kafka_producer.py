@@ -1,42 +1,24 @@
 import os
 import json
 import time
+import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
 from kafka import KafkaProducer
-from weatherlink_client import WeatherLinkClient
+from rate_limiter import PRIORITY_INGEST
+from stations import create_stations
+from weatherlink_client import AsyncWeatherLinkClient, close_shared_async_client
 
 
 def create_clients():
     """Create WeatherLink clients for configured stations from environment."""
-    stations = {
-        'finca1': {
-            'name': 'PYGANFLOR',
-            'api_key': os.getenv('FINCA1_API_KEY'),
-            'api_secret': os.getenv('FINCA1_API_SECRET'),
-            'station_id': os.getenv('FINCA1_STATION_ID'),
-        },
-        'finca2': {
-            'name': 'Urcuquí',
-            'api_key': os.getenv('FINCA2_API_KEY'),
-            'api_secret': os.getenv('FINCA2_API_SECRET'),
-            'station_id': os.getenv('FINCA2_STATION_ID'),
-        },
-        'finca3': {
-            'name': 'Malchinguí',
-            'api_key': os.getenv('FINCA3_API_KEY'),
-            'api_secret': os.getenv('FINCA3_API_SECRET'),
-            'station_id': os.getenv('FINCA3_STATION_ID'),
-        },
-    }
-
     clients = {}
-    for key, s in stations.items():
-        if s['api_key'] and s['api_secret'] and s['station_id']:
-            clients[key] = {
-                'meta': s,
-                'client': WeatherLinkClient(s['api_key'], s['api_secret'], s['station_id']),
-            }
+    for key, s in create_stations(configured_only=True).items():
+        clients[key] = {
+            'meta': s,
+            'client': AsyncWeatherLinkClient(s['api_key'], s['api_secret'], s['station_id'],
+                                             priority=PRIORITY_INGEST),
+        }
     return clients
 
 
@@ -53,6 +35,44 @@ def build_producer(bootstrap_servers: str):
     )
 
 
+async def poll_station(station_key, entry):
+    """Leer condiciones actuales de una estación y construir el evento Kafka."""
+    meta = entry['meta']
+    data = await entry['client'].get_current_conditions()
+    return {
+        'station_key': station_key,
+        'station_name': meta['name'],
+        'station_id': meta['station_id'],
+        'ingest_ts': int(time.time()),
+        'event_ts': data.get('timestamp'),
+        'payload': data,
+    }
+
+
+async def run_producer(producer, clients, topic, poll_interval):
+    """Bucle de polling: todas las estaciones se consultan a la vez en el mismo event loop."""
+    try:
+        while True:
+            keys = list(clients)
+            results = await asyncio.gather(
+                *(poll_station(key, clients[key]) for key in keys),
+                return_exceptions=True,
+            )
+            for station_key, result in zip(keys, results):
+                if isinstance(result, Exception):
+                    print(f"⚠ Error obteniendo/enviando datos de {station_key}: {result}")
+                    continue
+                try:
+                    producer.send(topic, key=station_key, value=result)
+                    print(f"✔ [{datetime.now().isoformat()}] Enviado {station_key} ts={result['event_ts']}")
+                except Exception as e:
+                    print(f"⚠ Error obteniendo/enviando datos de {station_key}: {e}")
+            await asyncio.to_thread(producer.flush)
+            await asyncio.sleep(poll_interval)
+    finally:
+        await close_shared_async_client()
+
+
 def main():
     load_dotenv()
 
@@ -61,32 +81,17 @@ def main():
     poll_interval = int(os.getenv('POLL_INTERVAL_SEC', '60'))
 
     producer = build_producer(bootstrap)
-    clients = create_clients()
-
-    if not clients:
-        raise RuntimeError('No hay estaciones configuradas correctamente en .env')
-
-    print(f"⏳ Publicando datos en Kafka cada {poll_interval}s → {topic} (broker: {bootstrap})")
-    while True:
-        for station_key, entry in clients.items():
-            wl = entry['client']
-            meta = entry['meta']
-            try:
-                data = wl.get_current_conditions()
-                event = {
-                    'station_key': station_key,
-                    'station_name': meta['name'],
-                    'station_id': meta['station_id'],
-                    'ingest_ts': int(time.time()),
-                    'event_ts': data.get('timestamp'),
-                    'payload': data,
-                }
-                producer.send(topic, key=station_key, value=event)
-                print(f"✔ [{datetime.now().isoformat()}] Enviado {station_key} ts={event['event_ts']}")
-            except Exception as e:
-                print(f"⚠ Error obteniendo/enviando datos de {station_key}: {e}")
-        producer.flush()
-        time.sleep(poll_interval)
+
+    async def run():
+        # Los clientes se crean dentro del loop para que compartan su httpx.AsyncClient
+        clients = create_clients()
+        if not clients:
+            raise RuntimeError('No hay estaciones configuradas correctamente en .env')
+
+        print(f"⏳ Publicando datos en Kafka cada {poll_interval}s → {topic} (broker: {bootstrap})")
+        await run_producer(producer, clients, topic, poll_interval)
+
+    asyncio.run(run())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,255 @@
+"""
+Feed en vivo para /api/stream (Server-Sent Events).
+
+Un solo consumidor del tópico weatherlink.raw por proceso (hilo en segundo
+plano, arrancado con la primera conexión) reparte cada lectura a todas las
+conexiones SSE abiertas. Las transiciones de eventos de lluvia se detectan
+leyendo el estado que mantiene consumer_rain_alerts.py en Redis
+(rain_state:<station_key>).
+
+El consumidor no usa group_id: no confirma offsets ni compite con los
+consumidores de Supabase y alertas; empieza siempre por el final del tópico.
+
+Las conexiones atendidas en un event loop (asgi.py) se suscriben con
+subscribe_async: reciben los eventos en un asyncio.Queue y los esperan con
+await, sin revisar la cola periódicamente.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+
+def latest_reading_row(event):
+    """Lectura en el formato de /api/supabase/latest (tarjetas de dashboard.html)
+
+    Mismas conversiones que consumer_weather_to_supabase.transform_event.
+    """
+    payload = event.get('payload') or {}
+    temp_f = payload.get('temperature')
+    humidity = payload.get('humidity')
+    temp_c = round((temp_f - 32.0) * 5.0 / 9.0, 2) if temp_f is not None else None
+    event_ts = event.get('event_ts') or payload.get('timestamp') or event.get('ingest_ts')
+
+    rain_daily = payload.get('rain_daily_mm')
+    legacy_rain = payload.get('rain_rate_mm')
+    rain_rate = payload.get('rain_rate_mm_h') or 0.0
+    is_raining = payload.get('is_raining')
+
+    return {
+        'station': event.get('station_name'),
+        'station_key': event.get('station_key'),
+        'ultima_actualizacion': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(event_ts)) if event_ts else None,
+        'temperatura_c': temp_c,
+        'humedad': humidity,
+        'dpv_kpa': payload.get('vpd'),
+        'radiacion_solar': payload.get('solar_radiation'),
+        'lluvia_mm': legacy_rain if legacy_rain is not None else rain_daily,
+        'lluvia_diaria_mm': rain_daily if rain_daily is not None else (legacy_rain or 0.0),
+        'tasa_lluvia_mm_h': rain_rate,
+        'esta_lloviendo': bool(is_raining) if is_raining is not None else rain_rate > 0,
+        'velocidad_viento': payload.get('wind_speed'),
+    }
+
+
+class AsyncSubscription:
+    """Cola asyncio de una conexión SSE, alimentada desde el hilo consumidor"""
+
+    def __init__(self, loop, maxsize):
+        self._loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put_nowait(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # Event loop cerrado: la conexión ya terminó
+            pass
+
+    def _put(self, item):
+        if self.queue.full():
+            # Cliente lento: descartar el evento más antiguo
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+    async def get(self, timeout):
+        """Siguiente evento (tipo, datos); asyncio.TimeoutError si no llega en timeout segundos"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class LiveFeedHub:
+    """Reparte los eventos del tópico a las conexiones SSE del proceso"""
+
+    def __init__(self, bootstrap_servers, topic, station_keys, redis_url=None,
+                 rain_poll_seconds=5.0, queue_size=100):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.station_keys = list(station_keys)
+        self.redis_url = redis_url
+        self.rain_poll_seconds = rain_poll_seconds
+        self.queue_size = queue_size
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        # Última lectura y último estado de lluvia por estación (para conexiones nuevas)
+        self._latest = {}
+        self._rain_states = {}
+
+    def _ensure_started(self):
+        """Arrancar el hilo consumidor en este proceso (tras el fork de gunicorn)"""
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def subscribe(self):
+        """Cola de eventos (tipo, datos) para una conexión nueva"""
+        self._ensure_started()
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def subscribe_async(self):
+        """Como subscribe, para una conexión atendida en el event loop actual"""
+        self._ensure_started()
+        subscription = AsyncSubscription(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def snapshot(self):
+        """Eventos con el último estado conocido, para enviar al conectarse"""
+        with self._lock:
+            return [('reading', reading) for reading in self._latest.values()]
+
+    def publish(self, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait((event_type, data))
+            except queue.Full:
+                # Cliente lento: descartar el evento más antiguo
+                try:
+                    subscription.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscription.put_nowait((event_type, data))
+                except queue.Full:
+                    pass
+
+    def _handle_reading(self, event):
+        station_key = event.get('station_key')
+        if not station_key:
+            return
+        reading = {
+            'station_key': station_key,
+            'data': event.get('payload') or {},
+            'latest': latest_reading_row(event),
+        }
+        with self._lock:
+            self._latest[station_key] = reading
+        self.publish('reading', reading)
+
+    def _check_rain_states(self, redis_client):
+        """Publicar 'rain_event' cuando una estación empieza o deja de llover"""
+        keys = self.station_keys
+        raws = redis_client.mget([f"rain_state:{key}" for key in keys])
+        for station_key, raw in zip(keys, raws):
+            state = json.loads(raw) if raw else None
+            current = (bool(state and state.get('is_raining')), state.get('event_id') if state else None)
+            previous = self._rain_states.get(station_key)
+            self._rain_states[station_key] = current
+            if previous is None or previous == current:
+                continue
+            self.publish('rain_event', {
+                'station_key': station_key,
+                'status': 'started' if current[0] else 'ended',
+                'event_id': current[1] if current[0] else previous[1],
+                'state': state,
+            })
+
+    def _connect_redis(self):
+        if not self.redis_url:
+            return None
+        try:
+            import redis
+
+            client = redis.Redis.from_url(self.redis_url, socket_connect_timeout=1.0, socket_timeout=2.0)
+            client.ping()
+            return client
+        except Exception as e:
+            print(f"⚠️ Redis no disponible para el feed en vivo ({e}). Sin transiciones de lluvia.")
+            return None
+
+    def _run(self):
+        try:
+            from kafka import KafkaConsumer
+        except ImportError as e:
+            print(f"⚠️ Feed en vivo deshabilitado ({e})")
+            return
+
+        redis_client = self._connect_redis()
+        next_rain_check = 0.0
+        retry_delay = 1.0
+        while True:
+            consumer = None
+            try:
+                consumer = KafkaConsumer(
+                    self.topic,
+                    bootstrap_servers=self.bootstrap_servers,
+                    group_id=None,
+                    auto_offset_reset='latest',
+                    enable_auto_commit=False,
+                    value_deserializer=lambda v: json.loads(v.decode('utf-8')),
+                )
+                print(f"✅ Feed en vivo conectado a {self.topic} ({self.bootstrap_servers})")
+                retry_delay = 1.0
+                while True:
+                    batches = consumer.poll(timeout_ms=1000)
+                    for messages in batches.values():
+                        for message in messages:
+                            if isinstance(message.value, dict):
+                                self._handle_reading(message.value)
+
+                    if redis_client is not None and time.monotonic() >= next_rain_check:
+                        next_rain_check = time.monotonic() + self.rain_poll_seconds
+                        try:
+                            self._check_rain_states(redis_client)
+                        except Exception as e:
+                            print(f"⚠️ Error leyendo estados de lluvia: {e}")
+            except Exception as e:
+                print(f"⚠️ Feed en vivo desconectado de Kafka ({e}). Reintentando en {retry_delay:g}s")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60.0)
+            finally:
+                if consumer is not None:
+                    try:
+                        consumer.close()
+                    except Exception:
+                        pass
+
+
+def create_live_feed(station_keys):
+    """Hub configurado con KAFKA_BOOTSTRAP_SERVERS / KAFKA_TOPIC_RAW / REDIS_URL"""
+    return LiveFeedHub(
+        os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092'),
+        os.getenv('KAFKA_TOPIC_RAW', 'weatherlink.raw'),
+        station_keys,
+        redis_url=os.getenv('REDIS_URL') or None,
+        rain_poll_seconds=float(os.getenv('LIVE_FEED_RAIN_POLL_SEC', '5')),
+        queue_size=int(os.getenv('LIVE_FEED_QUEUE_SIZE', '100')),
+    )
@@ -0,0 +1,219 @@
+"""
+Métricas Prometheus del dashboard (GET /metrics).
+
+- dashboard_http_requests_total / dashboard_http_request_duration_seconds:
+  por ruta (regla de Flask, p. ej. /api/current/<station_key>), método y
+  estado. En las respuestas en streaming la duración incluye el envío.
+- dashboard_http_requests_in_progress: peticiones en curso por ruta.
+- upstream_requests_total / upstream_request_duration_seconds /
+  upstream_requests_in_progress: cada intento HTTP a WeatherLink (current /
+  historic por station_id) y a Supabase (tabla o RPC, con station_key si
+  la consulta filtra por estación).
+- cache_lookups_total: aciertos y fallos de CACHE por tipo de clave
+  (current, hist, supabase, ...).
+
+Con varios workers de gunicorn se usa el modo multiproceso de
+prometheus_client: cada worker escribe sus valores en PROMETHEUS_MULTIPROC_DIR
+(lo fija gunicorn_config.py) y /metrics suma los de todos al responder.
+Sin prometheus_client instalado las métricas no hacen nada y /metrics
+responde 501.
+
+Las métricas se activan con init_app (la app web). El resto de procesos que
+usan WeatherLinkClient o SupabaseAPI (productor Kafka, export_worker.py) no
+las activan: upstream_call no hace nada y no se importan ni Flask ni
+prometheus_client.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+# Desde respuestas de caché (ms) hasta exportaciones y comparaciones largas
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Métricas registradas (None hasta enable(), o si falta prometheus_client)
+_metrics = None
+
+
+class _Metrics:
+    """Contadores, histogramas y gauges del dashboard"""
+
+    def __init__(self, prometheus_client):
+        self.prometheus_client = prometheus_client
+        self.http_requests = prometheus_client.Counter(
+            'dashboard_http_requests_total', 'Peticiones HTTP atendidas',
+            ['route', 'method', 'status'])
+        self.http_latency = prometheus_client.Histogram(
+            'dashboard_http_request_duration_seconds', 'Duración de las peticiones HTTP',
+            ['route', 'method'], buckets=LATENCY_BUCKETS)
+        self.http_in_progress = prometheus_client.Gauge(
+            'dashboard_http_requests_in_progress', 'Peticiones HTTP en curso',
+            ['route'], multiprocess_mode='livesum')
+        self.upstream_requests = prometheus_client.Counter(
+            'upstream_requests_total', 'Peticiones a WeatherLink y Supabase',
+            ['service', 'endpoint', 'station', 'status'])
+        self.upstream_latency = prometheus_client.Histogram(
+            'upstream_request_duration_seconds', 'Duración de las peticiones a WeatherLink y Supabase',
+            ['service', 'endpoint', 'station'], buckets=LATENCY_BUCKETS)
+        self.upstream_in_progress = prometheus_client.Gauge(
+            'upstream_requests_in_progress', 'Peticiones a WeatherLink y Supabase en curso',
+            ['service', 'endpoint'], multiprocess_mode='livesum')
+        self.cache_lookups = prometheus_client.Counter(
+            'cache_lookups_total', 'Consultas a la caché por tipo de clave',
+            ['kind', 'result'])
+
+
+def enable():
+    """Importar prometheus_client y registrar las métricas; False si no está instalado"""
+    global _metrics
+    if _metrics is None:
+        try:
+            import prometheus_client
+        except ImportError:
+            return False
+        _metrics = _Metrics(prometheus_client)
+    return True
+
+
+def request_started(route):
+    if _metrics is not None:
+        _metrics.http_in_progress.labels(route).inc()
+
+
+def request_finished(route, method, status, seconds):
+    if _metrics is not None:
+        _metrics.http_in_progress.labels(route).dec()
+        _metrics.http_requests.labels(route, method, str(status)).inc()
+        _metrics.http_latency.labels(route, method).observe(seconds)
+
+
+class _UpstreamCall:
+    """Resultado de una llamada externa; status queda en None si no hubo respuesta"""
+
+    status = None
+
+
+@contextmanager
+def upstream_call(service, endpoint, station=''):
+    """Medir una petición HTTP externa (fijar call.status con el código recibido)"""
+    call = _UpstreamCall()
+    metrics = _metrics
+    if metrics is None:
+        yield call
+        return
+    in_progress = metrics.upstream_in_progress.labels(service, endpoint)
+    in_progress.inc()
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        in_progress.dec()
+        metrics.upstream_latency.labels(service, endpoint, station).observe(time.perf_counter() - started)
+        metrics.upstream_requests.labels(service, endpoint, station,
+                                         str(call.status) if call.status is not None else 'error').inc()
+
+
+def _cache_kind(key):
+    # Prefijo de la clave (current:finca1 -> current): pocas etiquetas distintas
+    return key.split(':', 1)[0]
+
+
+class MeteredCache:
+    """Backend de caché que cuenta aciertos y fallos de get / get_many"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        # warm() y demás métodos propios del backend
+        return getattr(self.backend, name)
+
+    def get(self, key, ttl):
+        value = self.backend.get(key, ttl)
+        _metrics.cache_lookups.labels(_cache_kind(key), 'miss' if value is None else 'hit').inc()
+        return value
+
+    def get_many(self, keys, ttl):
+        keys = list(keys)
+        found = self.backend.get_many(keys, ttl)
+        if keys:
+            kind = _cache_kind(keys[0])
+            hits = sum(1 for key in keys if key in found)
+            if hits:
+                _metrics.cache_lookups.labels(kind, 'hit').inc(hits)
+            if hits < len(keys):
+                _metrics.cache_lookups.labels(kind, 'miss').inc(len(keys) - hits)
+        return found
+
+    def set(self, key, value, ttl):
+        self.backend.set(key, value, ttl)
+
+
+def instrument_cache(cache):
+    """Envolver el backend de caché si las métricas están activas"""
+    if _metrics is None:
+        return cache
+    return MeteredCache(cache)
+
+
+# Hooks de Flask: flask se importa aquí dentro para que los procesos que no
+# sirven la app (y solo usan upstream_call) no lo carguen
+
+def _route_label():
+    from flask import request
+
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _before_request():
+    from flask import g
+
+    g._metrics_started = time.perf_counter()
+    request_started(_route_label())
+
+
+def _after_request(response):
+    from flask import g
+
+    g._metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(error):
+    from flask import g, request
+
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return
+    status = 500 if error is not None else g.pop('_metrics_status', 500)
+    request_finished(_route_label(), request.method, status, time.perf_counter() - started)
+
+
+def metrics_view():
+    """Métricas en formato de texto de Prometheus (todos los workers)"""
+    from flask import Response
+
+    if _metrics is None:
+        return Response("prometheus_client no está instalado\n", status=501, mimetype='text/plain')
+    prometheus_client = _metrics.prometheus_client
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry),
+                    mimetype=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """Medir todas las rutas de la app y exponer /metrics"""
+    if not enable():
+        print("⚠️ prometheus_client no está instalado. /metrics deshabilitado.")
+    else:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+        app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,196 @@
+"""
+Perfilado por muestreo de peticiones de Flask (opcional, por variables de entorno).
+
+Se perfila una de cada PROFILE_SAMPLE_EVERY peticiones y cualquier petición
+con la cabecera X-Profile igual a PROFILE_HEADER_TOKEN. Mientras dura la
+petición (incluido el envío de las respuestas en streaming), un hilo toma
+cada PROFILE_INTERVAL_MS la pila del hilo de la petición y de los hilos de
+los pools que ella crea (bundle de /api/current, estaciones de /api/compare,
+chunks históricos). Esos pools se nombran con pool_prefix(), que agrega la
+marca de la petición perfilada; los hilos de otras peticiones no la llevan
+y no se muestrean.
+
+El resultado se escribe en PROFILE_DIR en formato de pilas plegadas
+("folded", una línea "raíz;...;hoja cuenta" por pila), que leen
+flamegraph.pl, speedscope e inferno.
+
+Con ambas variables vacías no se registra ningún hook: sin costo por petición.
+"""
+
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+PROFILE_HEADER = 'X-Profile'
+
+# Marca de la petición perfilada en el hilo que la atiende
+_local = threading.local()
+# La marca viaja en el nombre de los hilos de pool: "compare[prof-1a2b3c4d]_0"
+_TAG_PATTERN = re.compile(r'\[prof-[0-9a-f]+\]')
+
+
+def pool_prefix(name):
+    """thread_name_prefix para un ThreadPoolExecutor creado durante una petición
+
+    Si la petición se está perfilando (o el pool se crea desde un hilo de
+    otro pool de esa petición) el nombre lleva su marca. Sin flask: lo usa
+    también weatherlink_client.
+    """
+    tag = getattr(_local, 'tag', None)
+    if tag is None:
+        match = _TAG_PATTERN.search(threading.current_thread().name)
+        tag = match.group(0) if match else None
+    return f"{name}{tag}" if tag else name
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame):
+    """Pila de frame como "raíz;...;hoja" (de la raíz a la hoja)"""
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    return ';'.join(_frame_label(code) for code in reversed(codes)), codes
+
+
+def _is_idle_pool_thread(codes):
+    # Hilo del pool esperando trabajo: _worker -> queue.get (codes va de la hoja a la raíz)
+    for callee, caller in zip(codes, codes[1:]):
+        if caller.co_name == '_worker' and callee.co_name == 'get':
+            return True
+    return False
+
+
+class _Sampler(threading.Thread):
+    """Muestrea las pilas del hilo de la petición y de sus pools (hilos con su marca)"""
+
+    def __init__(self, request_thread, tag, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.request_thread = request_thread
+        self.tag = tag
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, '')
+                if ident == self.request_thread:
+                    root = 'request'
+                elif self.tag in name:
+                    # Raíz por pool: "compare", "historic", ...
+                    root = name.split('[', 1)[0]
+                else:
+                    continue
+                folded, codes = _fold(frame)
+                if root != 'request' and _is_idle_pool_thread(codes):
+                    continue
+                self.stacks[f"{root};{folded}"] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """Hooks de Flask que perfilan las peticiones elegidas"""
+
+    def __init__(self, directory, sample_every=0, header_token='', interval_ms=5, max_files=200):
+        self.directory = directory
+        self.sample_every = sample_every
+        self.header_token = header_token
+        self.interval = interval_ms / 1000.0
+        self.max_files = max_files
+        self._counter = itertools.count(1)
+
+    @property
+    def enabled(self):
+        return self.sample_every > 0 or bool(self.header_token)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        print(f"✅ Perfilado de peticiones activo (1 de cada {self.sample_every or '∞'}, "
+              f"cabecera {PROFILE_HEADER}: {'sí' if self.header_token else 'no'}) -> {self.directory}")
+
+    def _wanted(self):
+        from flask import request
+
+        token = request.headers.get(PROFILE_HEADER)
+        if token and self.header_token and hmac.compare_digest(token, self.header_token):
+            return True
+        return self.sample_every > 0 and next(self._counter) % self.sample_every == 0
+
+    def _before_request(self):
+        from flask import g
+
+        if not self._wanted():
+            return
+        tag = f"[prof-{uuid.uuid4().hex[:8]}]"
+        _local.tag = tag
+        sampler = _Sampler(threading.get_ident(), tag, self.interval)
+        g._profile = (sampler, time.perf_counter())
+        sampler.start()
+
+    def _teardown_request(self, error):
+        from flask import g, request
+
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return
+        _local.tag = None
+        sampler, started = profile
+        sampler.stop()
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        try:
+            self._write(sampler.stacks, elapsed_ms)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar el perfil de {request.path}: {e}")
+
+    def _write(self, stacks, elapsed_ms):
+        from flask import request
+
+        route = request.path.strip('/').replace('/', '_') or 'index'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{elapsed_ms}ms-{os.getpid()}.folded"
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"✅ Perfil de {request.method} {request.full_path} ({elapsed_ms} ms, "
+              f"{sum(stacks.values())} muestras) en {path}")
+        self._prune()
+
+    def _prune(self):
+        """Conservar solo los max_files perfiles más recientes"""
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.folded')),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:-self.max_files]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def create_request_profiler():
+    """Perfilador configurado por PROFILE_SAMPLE_EVERY / PROFILE_HEADER_TOKEN / PROFILE_DIR"""
+    return RequestProfiler(
+        os.getenv('PROFILE_DIR', 'data/profiles'),
+        sample_every=int(os.getenv('PROFILE_SAMPLE_EVERY', '0')),
+        header_token=os.getenv('PROFILE_HEADER_TOKEN', ''),
+        interval_ms=float(os.getenv('PROFILE_INTERVAL_MS', '5')),
+        max_files=int(os.getenv('PROFILE_MAX_FILES', '200')),
+    )
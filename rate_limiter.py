@@ -0,0 +1,197 @@
+"""
+Limitador de peticiones (token bucket) para la API de WeatherLink.
+
+Un bucket por API key, compartido por todos los clientes del proceso y,
+con WEATHERLINK_RATE_BACKEND=redis, por todos los procesos (workers de
+gunicorn + productor Kafka) a través del Redis del docker-compose. Si Redis
+no está disponible se opera con el bucket en memoria local.
+
+Prioridades: el productor de ingesta (PRIORITY_INGEST) puede vaciar el
+bucket por completo; las llamadas interactivas del dashboard
+(PRIORITY_INTERACTIVE) dejan siempre WEATHERLINK_RATE_RESERVE tokens libres
+para la ingesta. Cuando no hay tokens, el llamador espera en cola hasta
+WEATHERLINK_RATE_MAX_WAIT segundos antes de fallar.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+PRIORITY_INGEST = 'ingest'
+PRIORITY_INTERACTIVE = 'interactive'
+
+
+class RateLimitExceeded(Exception):
+    """No se obtuvo turno dentro del tiempo máximo de espera"""
+
+
+class LocalTokenBucket:
+    """Token bucket en memoria del proceso"""
+
+    # try_acquire no hace I/O: se puede llamar desde el event loop
+    blocking = False
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, floor=0.0):
+        """Tomar un token dejando al menos `floor` en el bucket.
+
+        Devuelve 0 si se obtuvo el token, o los segundos estimados de espera.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens - 1 >= floor:
+                self.tokens -= 1
+                return 0.0
+            return (floor + 1 - self.tokens) / self.rate
+
+
+# Refill + consumo atómico en Redis; devuelve la espera como string (Lua trunca números)
+_REDIS_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens - 1 >= floor then
+    tokens = tokens - 1
+else
+    wait = (floor + 1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket:
+    """Token bucket compartido entre procesos en Redis (con respaldo local)"""
+
+    # try_acquire es una llamada de red: acquire_async la hace en un hilo
+    blocking = True
+
+    def __init__(self, redis_client, key, rate, capacity):
+        self.redis = redis_client
+        self.key = key
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._script = redis_client.register_script(_REDIS_BUCKET_SCRIPT)
+        self._fallback = LocalTokenBucket(rate, capacity)
+
+    def try_acquire(self, floor=0.0):
+        try:
+            return float(self._script(keys=[self.key], args=[self.rate, self.capacity, floor]))
+        except Exception as e:
+            print(f"⚠️ Error en rate limiter de Redis ({e}). Usando bucket local.")
+            return self._fallback.try_acquire(floor)
+
+
+class RateLimiter:
+    """Limitador por API key con prioridades y espera acotada"""
+
+    def __init__(self, bucket, reserve=0.0, max_wait=10.0):
+        self.bucket = bucket
+        self.reserve = float(reserve)
+        self.max_wait = float(max_wait)
+
+    def _floor(self, priority):
+        return 0.0 if priority == PRIORITY_INGEST else self.reserve
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """Esperar (bloqueando) hasta obtener turno"""
+        floor = self._floor(priority)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self.bucket.try_acquire(floor)
+            if wait <= 0:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RateLimitExceeded(
+                    f"Límite de peticiones a WeatherLink alcanzado (espera > {self.max_wait:g}s)"
+                )
+            time.sleep(min(wait, remaining))
+
+    async def acquire_async(self, priority=PRIORITY_INTERACTIVE):
+        """Igual que acquire() pero cediendo el event loop mientras espera"""
+        import asyncio
+
+        floor = self._floor(priority)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            if self.bucket.blocking:
+                wait = await asyncio.to_thread(self.bucket.try_acquire, floor)
+            else:
+                wait = self.bucket.try_acquire(floor)
+            if wait <= 0:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RateLimitExceeded(
+                    f"Límite de peticiones a WeatherLink alcanzado (espera > {self.max_wait:g}s)"
+                )
+            await asyncio.sleep(min(wait, remaining))
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_redis_client = None
+
+
+def _get_redis_client():
+    """Conexión Redis (síncrona) para el bucket compartido, o None si no hay servidor"""
+    global _redis_client
+    if _redis_client is None:
+        redis_url = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+        try:
+            import redis
+
+            client = redis.Redis.from_url(redis_url, socket_connect_timeout=1.0, socket_timeout=1.0)
+            client.ping()
+            print(f"✅ Rate limiter compartido en Redis: {redis_url}")
+            _redis_client = client
+        except Exception as e:
+            print(f"⚠️ Redis no disponible para el rate limiter ({e}). Usando memoria local.")
+            _redis_client = False
+    return _redis_client or None
+
+
+def get_rate_limiter(api_key):
+    """Limitador compartido para una API key (None si WEATHERLINK_RATE_LIMIT=0)"""
+    rate = float(os.getenv('WEATHERLINK_RATE_LIMIT', '5'))
+    if rate <= 0 or not api_key:
+        return None
+
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None:
+            capacity = float(os.getenv('WEATHERLINK_RATE_BURST', '10'))
+            reserve = float(os.getenv('WEATHERLINK_RATE_RESERVE', '3'))
+            max_wait = float(os.getenv('WEATHERLINK_RATE_MAX_WAIT', '10'))
+
+            bucket = None
+            if os.getenv('WEATHERLINK_RATE_BACKEND', 'memory').lower() == 'redis':
+                redis_client = _get_redis_client()
+                if redis_client is not None:
+                    # No guardar la API key en claro como clave de Redis
+                    digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+                    bucket = RedisTokenBucket(redis_client, f"weatherlink:ratelimit:{digest}", rate, capacity)
+            if bucket is None:
+                bucket = LocalTokenBucket(rate, capacity)
+
+            limiter = RateLimiter(bucket, reserve=min(reserve, capacity - 1), max_wait=max_wait)
+            _limiters[api_key] = limiter
+    return limiter
@@ -0,0 +1,231 @@
+"""
+Refresco en segundo plano de datos calientes (stale-while-revalidate).
+
+Cada entrada se guarda en la caché como {'expires_at', 'data'} y se
+conserva stale_seconds más allá de su vencimiento:
+
+- vigente: se sirve tal cual;
+- vencida, dentro de stale_seconds: se sirve la copia anterior y se
+  programa un refresco en segundo plano;
+- ausente: se carga durante la petición (una sola carga en vuelo por clave).
+
+Las claves pedidas en los últimos hot_seconds quedan registradas como
+calientes y un hilo por proceso las vuelve a cargar lead_seconds antes de
+que venzan, de modo que las peticiones casi siempre encuentran datos
+vigentes. Ese refresco anticipado solo se hace con una caché compartida
+(Redis): con la caché en memoria cada worker de gunicorn repetiría las
+mismas llamadas a WeatherLink y Supabase, así que solo se refresca en
+segundo plano lo que una petición encontró vencido.
+
+Cada refresco en segundo plano se reclama antes en la caché (add de
+refresh-claim:<clave>:<expires_at>): con Redis un solo worker refresca
+cada versión de una clave y los demás la omiten.
+
+Una carga que falla no guarda nada (las funciones de carga lanzan excepción
+ante un error, no devuelven el error como dato) y deja la clave en espera
+antes de reintentarla en segundo plano: backoff_seconds, duplicándose en
+cada fallo seguido hasta backoff_max_seconds.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from singleflight import SingleFlight
+
+# La vigencia la decide expires_at; la caché solo descarta entradas fuera de la ventana stale
+_ANY_AGE = float('inf')
+
+
+class BackgroundRefresher:
+    """Cachea cargas con expires_at y refresca las claves calientes antes de que venzan
+
+    ttl puede ser un número de segundos o una función ttl(data) -> segundos.
+    """
+
+    def __init__(self, cache, lead_seconds=5, stale_seconds=120, hot_seconds=600,
+                 poll_seconds=1.0, max_workers=4, max_hot_keys=256,
+                 backoff_seconds=5, backoff_max_seconds=300, proactive=True, claim_seconds=30):
+        self.cache = cache
+        # False: sin hilo de refresco anticipado de las claves calientes
+        self.proactive = proactive
+        # Vida del reclamo de un refresco (si el worker que lo tomó muere, otro lo retoma)
+        self.claim_seconds = claim_seconds
+        self.lead_seconds = lead_seconds
+        self.stale_seconds = stale_seconds
+        self.hot_seconds = hot_seconds
+        self.poll_seconds = poll_seconds
+        self.max_workers = max_workers
+        self.max_hot_keys = max_hot_keys
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        # key -> (load, ttl, último acceso)
+        self._hot = {}
+        # Refrescos en segundo plano ya encolados
+        self._scheduled = set()
+        # key -> (fallos seguidos, no reintentar en segundo plano antes de este instante)
+        self._failures = {}
+        self._thread = None
+        self._executor = None
+        self._pid = None
+
+    def _ensure_started(self):
+        """Hilo y pool de refresco del proceso actual (tras el fork de gunicorn)"""
+        with self._lock:
+            if self._pid == os.getpid() and (self._thread is None or self._thread.is_alive()):
+                return
+            self._scheduled.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='refresher')
+            self._pid = os.getpid()
+            self._thread = None
+            if self.proactive:
+                self._thread = threading.Thread(target=self._run, name='refresher', daemon=True)
+                self._thread.start()
+
+    def store(self, key, data, ttl):
+        """Guardar data como vigente por ttl segundos"""
+        seconds = ttl(data) if callable(ttl) else ttl
+        self.cache.set(key, {'expires_at': time.time() + seconds, 'data': data},
+                       seconds + self.stale_seconds)
+
+    def _load(self, key, load, ttl):
+        try:
+            data = load()
+        except Exception:
+            self._record_failure(key)
+            raise
+        with self._lock:
+            self._failures.pop(key, None)
+        self.store(key, data, ttl)
+        return data
+
+    def _record_failure(self, key):
+        with self._lock:
+            failures = self._failures.get(key, (0, 0))[0] + 1
+            delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (failures - 1))
+            self._failures[key] = (failures, time.monotonic() + delay)
+
+    def _backing_off(self, key, now):
+        """True si la clave falló hace poco y aún no toca reintentarla (con _lock tomado)"""
+        failure = self._failures.get(key)
+        return failure is not None and now < failure[1]
+
+    def load(self, key, load, ttl):
+        """Cargar y guardar ya, compartiendo la carga con las llamadas concurrentes"""
+        return self._flight.do(key, self._load, key, load, ttl)
+
+    def peek(self, key):
+        """(data, vigente) de la entrada en caché, o None si no hay ni copia vieja"""
+        entry = self.cache.get(key, _ANY_AGE)
+        if entry is None:
+            return None
+        now = time.time()
+        if now >= entry['expires_at'] + self.stale_seconds:
+            return None
+        return entry['data'], now < entry['expires_at']
+
+    def track(self, key, load, ttl):
+        """Registrar key como caliente (el hilo la mantendrá vigente)"""
+        self._ensure_started()
+        with self._lock:
+            self._hot[key] = (load, ttl, time.monotonic())
+            if len(self._hot) > self.max_hot_keys:
+                coldest = min(self._hot, key=lambda k: self._hot[k][2])
+                del self._hot[coldest]
+                self._failures.pop(coldest, None)
+
+    def refresh_later(self, key, load, ttl):
+        """Encolar un refresco en segundo plano (si no hay uno ya en cola para key)"""
+        self._ensure_started()
+        with self._lock:
+            if key in self._scheduled or self._backing_off(key, time.monotonic()):
+                return
+            self._scheduled.add(key)
+        self._executor.submit(self._background_refresh, key, load, ttl)
+
+    def _claim(self, key):
+        """True si este proceso debe refrescar key: sigue por vencer y nadie más lo reclamó"""
+        entry = self.cache.get(key, _ANY_AGE)
+        expires_at = entry['expires_at'] if entry is not None else 0
+        if expires_at - time.time() > self.lead_seconds:
+            # Otro worker ya la refrescó
+            return False
+        return self.cache.add(f"refresh-claim:{key}:{expires_at}", os.getpid(), self.claim_seconds)
+
+    def _background_refresh(self, key, load, ttl):
+        try:
+            if self._claim(key):
+                self.load(key, load, ttl)
+        except Exception as e:
+            # La copia anterior sigue sirviéndose hasta que salga de la ventana stale
+            print(f"⚠️ Error refrescando {key} en segundo plano: {e}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(key)
+
+    def get(self, key, load, ttl, hot=True):
+        """Valor de key con stale-while-revalidate
+
+        Con hot la clave se registra como caliente; las claves con parámetros
+        libres (rangos, tamaños) deberían pasar hot=False.
+        """
+        if hot:
+            self.track(key, load, ttl)
+        cached = self.peek(key)
+        if cached is None:
+            return self.load(key, load, ttl)
+        data, fresh = cached
+        if not fresh:
+            self.refresh_later(key, load, ttl)
+        return data
+
+    def _due_keys(self):
+        """Claves calientes que vencen dentro de lead_seconds (las frías se olvidan)"""
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (_, _, seen) in self._hot.items() if now - seen > self.hot_seconds]:
+                del self._hot[key]
+                self._failures.pop(key, None)
+            hot = [(key, load, ttl) for key, (load, ttl, _) in self._hot.items()
+                   if key not in self._scheduled and not self._backing_off(key, now)]
+
+        due = []
+        for key, load, ttl in hot:
+            entry = self.cache.get(key, _ANY_AGE)
+            if entry is None or entry['expires_at'] - time.time() <= self.lead_seconds:
+                due.append((key, load, ttl))
+        return due
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                for key, load, ttl in self._due_keys():
+                    self.refresh_later(key, load, ttl)
+            except Exception as e:
+                print(f"⚠️ Error en el refresco en segundo plano: {e}")
+
+
+def create_refresher(cache):
+    """Refrescador configurado por REFRESH_LEAD_SEC / CACHE_STALE_SEC / REFRESH_HOT_SEC / REFRESH_BACKOFF_SEC
+
+    El refresco anticipado de claves calientes solo se activa si la caché es
+    compartida entre workers (CACHE_BACKEND=redis).
+    """
+    return BackgroundRefresher(
+        cache,
+        lead_seconds=float(os.getenv('REFRESH_LEAD_SEC', '5')),
+        stale_seconds=float(os.getenv('CACHE_STALE_SEC', '120')),
+        hot_seconds=float(os.getenv('REFRESH_HOT_SEC', '600')),
+        poll_seconds=float(os.getenv('REFRESH_POLL_SEC', '1')),
+        max_workers=int(os.getenv('REFRESH_WORKERS', '4')),
+        backoff_seconds=float(os.getenv('REFRESH_BACKOFF_SEC', '5')),
+        backoff_max_seconds=float(os.getenv('REFRESH_BACKOFF_MAX_SEC', '300')),
+        proactive=cache.shared,
+        claim_seconds=float(os.getenv('REFRESH_CLAIM_SEC', '30')),
+    )
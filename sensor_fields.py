@@ -0,0 +1,162 @@
+"""
+Resolución aprendida de campos de los sensores WeatherLink.
+
+Cada estación/tipo de sensor emite solo algunas de las variantes de nombre
+que el cliente contempla (temp / temp_out / temp_last, cinco claves de lluvia
+en mm, cinco en pulgadas, ...). Un FieldPlan se compila una vez a partir de
+las claves que la estación envía realmente y descarta las alternativas
+ausentes, de modo que normalmente cada campo queda en una sola consulta
+directa. Las reglas reproducen exactamente el orden de prioridad y la
+semántica de los encadenamientos originales.
+"""
+
+MM = 1.0
+IN_TO_MM = 25.4
+
+
+class FieldRule:
+    """Regla de resolución de un campo
+
+    mode='or':      primer valor truthy (equivalente a get(a) or get(b) or ...)
+    mode='notnull': primer valor distinto de None, con factor de conversión;
+                    devuelve (valor, clave, unidad)
+    fallback_key:   clave usada tal cual (aunque sea None) si ninguna otra aplica
+    """
+
+    def __init__(self, mode, keys, fallback_key=None):
+        self.mode = mode
+        # Normalizar a tuplas (clave, factor, unidad)
+        self.keys = tuple(k if isinstance(k, tuple) else (k, MM, 'mm') for k in keys)
+        self.fallback_key = fallback_key
+
+    def compile(self, keyset):
+        """Función extractora especializada para las claves presentes en keyset"""
+        present = tuple(k for k in self.keys if k[0] in keyset)
+
+        if self.mode == 'or':
+            last_key = self.keys[-1][0]
+            names = tuple(k[0] for k in present)
+            if not names:
+                return lambda record: None
+            if len(names) == 1 and names[0] == last_key:
+                key = names[0]
+                return lambda record: record.get(key)
+
+            def extract_or(record):
+                for name in names:
+                    value = record.get(name)
+                    if value:
+                        return value
+                # Igual que el encadenamiento con 'or': queda el valor de la última clave
+                return record.get(last_key)
+            return extract_or
+
+        fallback = self.fallback_key if self.fallback_key in keyset else None
+        if len(present) == 1 and fallback is None:
+            key, factor, unit = present[0]
+            if factor == MM:
+                def extract_single(record):
+                    value = record.get(key)
+                    if value is None:
+                        return None, None, None
+                    return value, key, unit
+            else:
+                def extract_single(record):
+                    value = record.get(key)
+                    if value is None:
+                        return None, None, None
+                    return value * factor, key, unit
+            return extract_single
+
+        def extract_notnull(record):
+            for key, factor, unit in present:
+                value = record.get(key)
+                if value is not None:
+                    return (value if factor == MM else value * factor), key, unit
+            if fallback is not None:
+                return record.get(fallback), fallback, 'mm'
+            return None, None, None
+        return extract_notnull
+
+
+_RAIN_RATE_KEYS = (
+    ('rain_rate_last_mm', MM, 'mm'), ('rain_rate_mm', MM, 'mm'), ('rain_rate_hi_mm', MM, 'mm'),
+    ('rain_rate_last_in', IN_TO_MM, 'in'), ('rain_rate_in', IN_TO_MM, 'in'), ('rain_rate_last', IN_TO_MM, 'in'),
+)
+_RAIN_DAILY_KEYS = (
+    ('rainfall_daily_mm', MM, 'mm'), ('rain_day_mm', MM, 'mm'), ('rainfall_mm', MM, 'mm'),
+    ('rainfall_daily_in', IN_TO_MM, 'in'), ('rain_day_in', IN_TO_MM, 'in'), ('rainfall_in', IN_TO_MM, 'in'),
+)
+
+# Datos actuales (/current): ver WeatherLinkClient._parse_current_conditions
+CURRENT_RULES = {
+    'temperature': FieldRule('or', ['temp', 'temp_out']),
+    'humidity': FieldRule('or', ['hum', 'hum_out']),
+    'wind_speed': FieldRule('or', ['wind_speed_last', 'wind_speed_avg_last_10_min',
+                                   'wind_speed', 'wind_speed_10_min']),
+    'wind_dir': FieldRule('or', ['wind_dir_last', 'wind_dir']),
+    'uv_index': FieldRule('or', ['uv_index', 'uv']),
+    # _rain_to_mm
+    'rain': FieldRule('notnull', [
+        ('rainfall_daily_mm', MM, 'mm'), ('rainfall_mm', MM, 'mm'), ('rainfall_last_15_min_mm', MM, 'mm'),
+        ('rain_day_mm', MM, 'mm'), ('rain_rate_mm', MM, 'mm'),
+        ('rainfall_daily_in', IN_TO_MM, 'in'), ('rainfall_in', IN_TO_MM, 'in'), ('rain_rate_in', IN_TO_MM, 'in'),
+        ('rain_day_in', IN_TO_MM, 'in'), ('rain_rate_last', IN_TO_MM, 'in'),
+        ('rainfall_last_15_min', MM, 'mm'),
+    ]),
+    # _extract_rain_metrics
+    'rain_rate_mm_h': FieldRule('notnull', _RAIN_RATE_KEYS),
+    'rain_daily_mm': FieldRule('notnull', _RAIN_DAILY_KEYS),
+    'rain_last_15_min_mm': FieldRule('notnull', [
+        ('rainfall_last_15_min_mm', MM, 'mm'), ('rainfall_last_15_min_in', IN_TO_MM, 'in'),
+        ('rainfall_last_15_min', MM, 'mm'),
+    ]),
+    'rain_last_60_min_mm': FieldRule('notnull', [
+        ('rainfall_last_60_min_mm', MM, 'mm'), ('rainfall_last_60_min_in', IN_TO_MM, 'in'),
+    ]),
+}
+
+# Datos históricos (/historic): ver WeatherLinkClient._parse_historic_records
+HISTORIC_RULES = {
+    'temperature': FieldRule('or', ['temp', 'temp_out', 'temp_last']),
+    'humidity': FieldRule('or', ['hum', 'hum_out', 'hum_last']),
+    'wind_speed': FieldRule('or', ['wind_speed_last', 'wind_speed_avg_last_10_min', 'wind_speed',
+                                   'wind_speed_10_min', 'wind_speed_avg']),
+    'wind_dir': FieldRule('or', ['wind_dir_last', 'wind_dir']),
+    'rain': FieldRule('notnull', [
+        ('rainfall_mm', MM, 'mm'), ('rainfall_last_15_min_mm', MM, 'mm'),
+        ('rain_day_mm', MM, 'mm'), ('rain_rate_mm', MM, 'mm'),
+        ('rainfall_in', IN_TO_MM, 'in'), ('rain_rate_in', IN_TO_MM, 'in'), ('rain_day_in', IN_TO_MM, 'in'),
+        ('rain_rate_last', IN_TO_MM, 'in'),  # suele venir en pulgadas
+        ('rainfall_last_15_min', IN_TO_MM, 'in'),
+    ], fallback_key='rain_rate_last_mm'),
+    'solar_radiation': FieldRule('or', ['solar_rad', 'solar_rad_avg']),
+    'uv_index': FieldRule('or', ['uv_index', 'uv']),
+    'dew_point': FieldRule('or', ['dew_point', 'dew_point_last']),
+}
+
+RULES = {
+    'current': CURRENT_RULES,
+    'historic': HISTORIC_RULES,
+}
+
+
+class FieldPlan:
+    """Extractores compilados para un esquema concreto (conjunto de claves)"""
+
+    def __init__(self, rules, keyset):
+        self.keyset = frozenset(keyset)
+        self.key_count = len(self.keyset)
+        self.extractors = {name: rule.compile(self.keyset) for name, rule in rules.items()}
+
+    def matches(self, record):
+        """True si el registro tiene el mismo esquema con el que se compiló el plan"""
+        return len(record) == self.key_count and self.keyset.issuperset(record)
+
+    def __getitem__(self, name):
+        return self.extractors[name]
+
+
+def compile_plan(kind, record):
+    """Compilar un plan ('current' o 'historic') para las claves de record"""
+    return FieldPlan(RULES[kind], record.keys())
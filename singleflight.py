@@ -0,0 +1,70 @@
+"""
+Coalescencia de peticiones concurrentes ("singleflight").
+
+Si varios hilos piden la misma clave a la vez, solo el primero ejecuta la
+llamada real; el resto espera y recibe el mismo resultado (o la misma
+excepción). AsyncSingleFlight hace lo mismo entre corrutinas de un event
+loop (modo ASGI).
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes por clave en una sola ejecución"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Ejecutar fn(*args, **kwargs) una sola vez para todas las llamadas concurrentes con `key`"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """SingleFlight para corrutinas de un mismo event loop"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """Esperar await fn(*args, **kwargs) una sola vez para todas las llamadas concurrentes con `key`"""
+        import asyncio
+
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: si un cliente se desconecta, la llamada sigue para el resto
+        return await asyncio.shield(future)
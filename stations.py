@@ -0,0 +1,35 @@
+"""
+Estaciones WeatherLink configuradas en el entorno.
+
+Única definición de las fincas (clave, nombre y variables FINCAn_*) para la
+app web, el productor de Kafka y el proceso de exportaciones.
+"""
+
+import os
+
+STATION_NAMES = {
+    'finca1': 'PYGANFLOR',
+    'finca2': 'Urcuquí',
+    'finca3': 'Malchinguí',
+}
+
+
+def create_stations(configured_only=False):
+    """{clave: {'name', 'api_key', 'api_secret', 'station_id'}} desde el entorno
+
+    Con configured_only se omiten las estaciones a las que les falta alguna
+    credencial (FINCAn_API_KEY, FINCAn_API_SECRET o FINCAn_STATION_ID).
+    """
+    stations = {}
+    for key, name in STATION_NAMES.items():
+        prefix = key.upper()
+        station = {
+            'name': name,
+            'api_key': os.getenv(f'{prefix}_API_KEY'),
+            'api_secret': os.getenv(f'{prefix}_API_SECRET'),
+            'station_id': os.getenv(f'{prefix}_STATION_ID'),
+        }
+        if configured_only and not (station['api_key'] and station['api_secret'] and station['station_id']):
+            continue
+        stations[key] = station
+    return stations
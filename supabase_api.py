@@ -5,6 +5,7 @@ para visualización en dashboard
 
 import os
 import requests
+import metrics
 from datetime import datetime, timedelta
 from collections import defaultdict
 
@@ -21,10 +22,14 @@ class SupabaseAPI:
     def _request(self, method, endpoint, params=None, json=None):
         """Hace una petición a la API REST de Supabase"""
         url = f"{self.url}/rest/v1/{endpoint}"
+        # Estación filtrada (station_key=eq.finca1) para las métricas
+        station = str((params or {}).get('station_key', ''))[3:]
         try:
-            response = requests.request(
-                method, url, headers=self.headers, params=params, json=json, timeout=self.timeout
-            )
+            with metrics.upstream_call('supabase', endpoint, station) as call:
+                response = requests.request(
+                    method, url, headers=self.headers, params=params, json=json, timeout=self.timeout
+                )
+                call.status = response.status_code
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -169,8 +174,12 @@ class SupabaseAPI:
 
             by_week = defaultdict(lambda: defaultdict(float))
             by_day = defaultdict(lambda: defaultdict(float))
+            last_updated = None
             
             for event in events:
+                updated = event.get('updated_at') or event.get('event_start')
+                if updated and (last_updated is None or updated > last_updated):
+                    last_updated = updated
                 rain = event.get('rain_accumulated', 0) or 0
                 event_start = datetime.fromisoformat(event['event_start'].replace('Z', '+00:00'))
                 
@@ -183,7 +192,8 @@ class SupabaseAPI:
             
             result = {
                 'by_week': {k: dict(v) for k, v in by_week.items()},
-                'by_day': {k: dict(v) for k, v in by_day.items()}
+                'by_day': {k: dict(v) for k, v in by_day.items()},
+                'last_updated': last_updated
             }
             return {'success': True, 'data': result}
         except Exception as e:
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from cache_backend import LRUCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def test_get_returns_value_within_ttl(clock):
+    cache = LRUCache()
+    cache.set('k', {'a': 1}, 60)
+    assert cache.get('k', 60) == {'a': 1}
+    assert cache.get('otra', 60) is None
+
+
+def test_get_respects_the_reader_ttl(clock):
+    cache = LRUCache()
+    cache.set('k', 'v', 600)
+    clock[0] += 30
+    # Más vieja que lo que acepta este lector, pero se conserva para otros
+    assert cache.get('k', 10) is None
+    assert cache.get('k', 60) == 'v'
+    assert len(cache) == 1
+
+
+def test_expired_entries_are_dropped(clock):
+    cache = LRUCache()
+    cache.set('k', 'v', 60)
+    clock[0] += 60
+    assert cache.get('k', float('inf')) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    # Leer 'a' la vuelve la más reciente: sale 'b'
+    cache.get('a', 60)
+    cache.set('c', 3, 60)
+
+    assert len(cache) == 2
+    assert cache.get('b', 60) is None
+    assert cache.get('a', 60) == 1
+    assert cache.get('c', 60) == 3
+
+
+def test_set_overwrites_and_renews(clock):
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    cache.set('a', 10, 60)
+    cache.set('c', 3, 60)
+
+    assert cache.get('a', 60) == 10
+    assert cache.get('b', 60) is None
+
+
+def test_get_many_returns_only_valid_keys(clock):
+    cache = LRUCache()
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 10)
+    clock[0] += 20
+    assert cache.get_many(['a', 'b', 'c'], 60) == {'a': 1}
+
+
+def test_add_only_stores_missing_or_expired_keys(clock):
+    cache = LRUCache()
+    assert cache.add('claim', 1, 30)
+    assert not cache.add('claim', 2, 30)
+    assert cache.get('claim', 30) == 1
+
+    clock[0] += 31
+    assert cache.add('claim', 3, 30)
+    assert cache.get('claim', 30) == 3
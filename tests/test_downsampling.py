@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from downsampling import (downsample_history, downsample_indices, downsample_records, lttb_indices,
+                          peak_indices)
+
+
+def reference_lttb(x, y, n_out):
+    """LTTB punto a punto (mismos buckets que lttb_indices)"""
+    n = len(x)
+    edges = [int(e) for e in np.linspace(1, n - 1, n_out - 1).astype(np.int64)]
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = sum(x[end:next_end]) / (next_end - end)
+        avg_y = sum(y[end:next_end]) / (next_end - end)
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def test_lttb_matches_point_by_point_reference():
+    rng = np.random.default_rng(7)
+    x = np.arange(1000, dtype=np.float64) * 300
+    y = np.cumsum(rng.normal(size=1000))
+    assert lttb_indices(x, y, 50).tolist() == reference_lttb(x.tolist(), y.tolist(), 50)
+
+
+def test_lttb_keeps_endpoints_and_size():
+    x = np.arange(500, dtype=np.float64)
+    y = np.sin(x / 20)
+    indices = lttb_indices(x, y, 40)
+    assert len(indices) == 40
+    assert indices[0] == 0 and indices[-1] == 499
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_keeps_an_isolated_spike():
+    x = np.arange(300, dtype=np.float64)
+    y = np.zeros(300)
+    y[137] = 50.0
+    assert 137 in lttb_indices(x, y, 20)
+
+
+@pytest.mark.parametrize('n_out, expected', [(10, list(range(5))), (2, [0, 4]), (1, [0])])
+def test_lttb_small_outputs(n_out, expected):
+    x = np.arange(5, dtype=np.float64)
+    assert lttb_indices(x, x, n_out).tolist() == expected
+
+
+def test_peak_indices_keeps_first_maximum_of_rainy_buckets():
+    y = np.array([0, 1, 3, 3, 0, 0, 0, 0, np.nan, 2, 0, 5])
+    # Buckets [0, 4), [4, 8), [8, 12): el segundo no tiene lluvia
+    assert peak_indices(y, 3).tolist() == [2, 11]
+    assert peak_indices(np.array([]), 3).tolist() == []
+
+
+def test_downsample_indices_skips_nan_and_keeps_rain_peaks():
+    n = 1000
+    x = np.arange(n, dtype=np.float64)
+    temperature = np.sin(x / 50)
+    temperature[:100] = np.nan
+    rain = np.zeros(n)
+    rain[613] = 1.2
+
+    indices = downsample_indices(x, [temperature], [rain], 100)
+
+    assert len(indices) <= 110
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert 613 in indices
+    assert not np.isin(np.arange(1, 100), indices).any()
+
+
+def test_downsample_records_returns_original_records():
+    records = [{'timestamp': 1_700_000_000 + i * 300, 'temperature': float(i % 37),
+                'humidity': 50.0, 'rain': 0.0} for i in range(2000)]
+    records[1234]['rain'] = 0.8
+
+    reduced = downsample_records(records, 200)
+
+    assert len(reduced) <= 220
+    # Las mismas filas, no copias
+    assert {id(r) for r in reduced} <= {id(r) for r in records}
+    assert records[1234] in reduced
+    assert [r['timestamp'] for r in reduced] == sorted(r['timestamp'] for r in reduced)
+    assert downsample_records(records[:100], 200) == records[:100]
+
+
+def test_downsample_history_reduces_parallel_lists():
+    n = 600
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    data = {
+        'timestamps': [(start + timedelta(minutes=i)).isoformat().replace('+00:00', 'Z') for i in range(n)],
+        'temperatura': [float(i % 13) for i in range(n)],
+        'humedad': [None if i % 7 == 0 else 60.0 for i in range(n)],
+        'dpv': [1.0] * n,
+        'radiacion_solar': [float(i) for i in range(n)],
+        'lluvia': [0.0] * n,
+    }
+
+    reduced = downsample_history(data, 60)
+
+    assert set(reduced) == set(data)
+    lengths = {len(values) for values in reduced.values()}
+    assert len(lengths) == 1 and lengths.pop() < n
+    assert reduced['timestamps'][0] == data['timestamps'][0]
+    assert reduced['timestamps'][-1] == data['timestamps'][-1]
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from cache_backend import LRUCache
+from export_jobs import ExportJobManager
+from historic_cache import HistoricRangeCache
+from historic_store import DAY_SECONDS
+
+# Medianoche UTC
+DAY = 1_699_920_000
+
+
+class DayClient:
+    """Cliente con un registro por hora (y uno sin timestamp) que cuenta las descargas"""
+
+    station_id = 1
+
+    def __init__(self):
+        self.requests = []
+
+    def _records(self, start_timestamp, end_timestamp):
+        records = [{'timestamp': ts} for ts in range(start_timestamp - start_timestamp % 3600,
+                                                     end_timestamp + 1, 3600) if ts >= start_timestamp]
+        return records + [{'temperature': 20.0}]
+
+    def iter_historic_data(self, start_timestamp, end_timestamp, max_workers=None, **kwargs):
+        self.requests.append((start_timestamp, end_timestamp))
+        yield self._records(start_timestamp, end_timestamp)
+
+    def get_historic_data(self, start_timestamp, end_timestamp, max_workers=None):
+        self.requests.append((start_timestamp, end_timestamp))
+        return {'records': self._records(start_timestamp, end_timestamp)}
+
+
+def make_manager(tmp_path, with_cache):
+    client = DayClient()
+    clients = {'st': client}
+    historic_cache = HistoricRangeCache(clients, LRUCache(), bucket_seconds=3600) if with_cache else None
+    manager = ExportJobManager(clients, {'st': {'name': 'Estación'}}, str(tmp_path),
+                               run_in_process=False, historic_cache=historic_cache)
+    return manager, client
+
+
+def job_for(start, end):
+    return {'id': 'a' * 32, 'start_timestamp': start, 'end_timestamp': end, 'chunks_done': 0}
+
+
+@pytest.mark.parametrize('with_cache', [False, True])
+def test_partial_days_skip_records_without_timestamp(tmp_path, with_cache):
+    manager, _ = make_manager(tmp_path, with_cache)
+    start, end = DAY + 6 * 3600, DAY + DAY_SECONDS + 6 * 3600
+
+    chunks = list(manager._station_chunks(job_for(start, end), 'st'))
+
+    assert len(chunks) == 2
+    assert all(start <= r['timestamp'] <= end for chunk in chunks for r in chunk)
+    assert sum(len(chunk) for chunk in chunks) == 25
+
+
+def test_overlapping_jobs_reuse_cached_days(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, 'time', lambda: DAY + 10 * DAY_SECONDS)
+    manager, client = make_manager(tmp_path, with_cache=True)
+
+    list(manager._station_chunks(job_for(DAY, DAY + 2 * DAY_SECONDS - 1), 'st'))
+    list(manager._station_chunks(job_for(DAY + DAY_SECONDS, DAY + 3 * DAY_SECONDS - 1), 'st'))
+
+    # Solo el tercer día se descarga en el segundo trabajo
+    assert client.requests == [(DAY, DAY + DAY_SECONDS),
+                               (DAY + DAY_SECONDS, DAY + 2 * DAY_SECONDS),
+                               (DAY + 2 * DAY_SECONDS, DAY + 3 * DAY_SECONDS)]
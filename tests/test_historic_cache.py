@@ -0,0 +1,181 @@
+import time
+
+import pytest
+
+from cache_backend import LRUCache
+from historic_cache import HistoricRangeCache
+from weatherlink_client import FailedChunk
+
+HOUR = 3600
+# Inicio de un bucket: el reloj de las pruebas arranca 30 minutos después
+BASE = 1_700_002_800
+
+
+class FakeClient:
+    """Cliente con un registro cada 10 minutos que anota los rangos pedidos"""
+
+    station_id = 1
+
+    def __init__(self):
+        self.requests = []
+
+    def iter_historic_data(self, start_timestamp, end_timestamp, max_workers=None, **kwargs):
+        self.requests.append((start_timestamp, end_timestamp))
+        first = start_timestamp - start_timestamp % 600
+        yield [{'timestamp': ts} for ts in range(first, end_timestamp + 1, 600) if ts >= start_timestamp]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [BASE + 1800.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def make_cache(**kwargs):
+    client = FakeClient()
+    kwargs.setdefault('open_ttl', 300)
+    kwargs.setdefault('closed_ttl', 86400)
+    kwargs.setdefault('grace_seconds', 900)
+    cache = HistoricRangeCache({'st': client}, LRUCache(), bucket_seconds=HOUR, **kwargs)
+    return cache, client
+
+
+def timestamps(result):
+    return [r['timestamp'] for r in result['records']]
+
+
+def test_second_request_is_served_from_cache(clock):
+    cache, client = make_cache()
+    start, end = BASE - 2 * HOUR, int(clock[0])
+
+    first = cache.get_range('st', start, end)
+    second = cache.get_range('st', start, end)
+
+    assert not first['from_cache']
+    assert second['from_cache']
+    assert timestamps(first) == timestamps(second)
+    assert len(client.requests) == 1
+
+
+def test_only_open_buckets_are_refetched_after_open_ttl(clock):
+    cache, client = make_cache()
+    start = BASE - 3 * HOUR
+    cache.get_range('st', start, int(clock[0]))
+
+    clock[0] += 301
+    result = cache.get_range('st', start, int(clock[0]))
+
+    assert not result['from_cache']
+    # Los buckets anteriores están cerrados (fin + gracia <= ahora): solo se pide el actual
+    assert client.requests[-1][0] == BASE
+    assert timestamps(result) == list(range(start, int(clock[0]) + 1, 600))
+
+
+def test_open_bucket_within_stale_window_is_served_and_reported(clock):
+    stale = []
+    cache, client = make_cache(stale_seconds=600, on_stale=stale.append)
+    start, end = BASE - HOUR, int(clock[0])
+    cache.get_range('st', start, end)
+
+    clock[0] += 400  # bucket abierto vencido (open_ttl=300) pero dentro de la ventana stale
+    result = cache.get_range('st', start, end)
+
+    assert result['from_cache']
+    assert stale == ['st']
+    assert len(client.requests) == 1
+
+
+def test_open_bucket_past_stale_window_is_fetched(clock):
+    stale = []
+    cache, client = make_cache(stale_seconds=600, on_stale=stale.append)
+    start = BASE - 2 * HOUR
+    cache.get_range('st', start, int(clock[0]))
+
+    clock[0] += 1000
+    result = cache.get_range('st', start, int(clock[0]))
+
+    assert not result['from_cache']
+    assert stale == []
+    # Los buckets anteriores ya estaban cerrados (fin + gracia <= ahora): solo se pide el abierto
+    assert client.requests[-1][0] == BASE
+
+
+def test_refresh_open_refetches_fresh_open_buckets(clock):
+    cache, client = make_cache()
+    start, end = BASE - 2 * HOUR, int(clock[0])
+    cache.get_range('st', start, end)
+
+    cache.refresh_open('st', start, end)
+
+    assert len(client.requests) == 2
+    assert client.requests[-1][0] == BASE
+    assert cache.get_range('st', start, end)['from_cache']
+
+
+def test_refresh_recent_covers_buckets_still_in_grace(clock):
+    cache, client = make_cache()
+    # 10 minutos después del cierre del bucket anterior: sigue en el margen de gracia
+    clock[0] = BASE + 600
+    cache.get_range('st', BASE - 3 * HOUR, int(clock[0]))
+
+    cache.refresh_recent('st')
+
+    # Se vuelven a pedir el bucket en gracia y el actual, no los cerrados
+    assert client.requests[-1] == (BASE - HOUR, int(clock[0]))
+
+
+def test_closed_empty_bucket_uses_empty_ttl(clock):
+    cache, client = make_cache(empty_ttl=7200)
+    client.iter_historic_data = lambda start, end, max_workers=None, **kwargs: iter([[]])
+    cache.get_range('st', BASE - 3 * HOUR, BASE - 2 * HOUR - 1)
+
+    stored_at, expires_at, entry = cache.cache._data[cache._bucket_key('st', BASE - 3 * HOUR)]
+    assert entry['complete'] and entry['records'] == []
+    assert expires_at - stored_at == 7200
+
+
+def test_failed_chunk_is_not_cached(clock):
+    cache, client = make_cache()
+    working = client.iter_historic_data
+
+    def failing(start_timestamp, end_timestamp, max_workers=None, **kwargs):
+        client.requests.append((start_timestamp, end_timestamp))
+        yield FailedChunk(start_timestamp, end_timestamp, Exception('Error en API: 429'))
+
+    start, end = BASE - 3 * HOUR, int(clock[0])
+    client.iter_historic_data = failing
+    stats = {}
+    first = list(cache.iter_range('st', start, end, stats))
+    assert first == []
+    assert stats['failed_buckets'] == 4
+
+    # WeatherLink se recupera: el rango se vuelve a pedir en lugar de servir buckets vacíos
+    client.iter_historic_data = working
+    second = cache.get_range('st', start, end)
+    assert not second['from_cache']
+    assert timestamps(second) == list(range(start, end + 1, 600))
+    assert len(client.requests) == 2
+
+
+def test_failed_chunk_only_skips_its_own_buckets(clock):
+    cache, client = make_cache()
+    start = BASE - 3 * HOUR
+
+    def partly_failing(start_timestamp, end_timestamp, max_workers=None, **kwargs):
+        client.requests.append((start_timestamp, end_timestamp))
+        yield [{'timestamp': ts} for ts in range(start_timestamp, start_timestamp + HOUR, 600)]
+        yield FailedChunk(start_timestamp + HOUR, end_timestamp, Exception('timeout'))
+
+    client.iter_historic_data = partly_failing
+    cache.get_range('st', start, int(clock[0]))
+
+    assert cache.cache.get(cache._bucket_key('st', start), 86400) is not None
+    assert cache.cache.get(cache._bucket_key('st', start + HOUR), 86400) is None
+
+
+def test_refresh_open_raises_when_a_chunk_fails(clock):
+    cache, client = make_cache()
+    client.iter_historic_data = lambda start, end, max_workers=None, **kwargs: iter([FailedChunk(start, end, Exception())])
+    with pytest.raises(Exception, match='no se pudieron descargar'):
+        cache.refresh_recent('st')
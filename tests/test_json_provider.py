@@ -0,0 +1,32 @@
+from datetime import date, datetime, timezone
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+pytest.importorskip('orjson')
+
+from json_provider import OrjsonProvider
+
+
+@pytest.fixture
+def providers():
+    app = Flask(__name__)
+    return DefaultJSONProvider(app), OrjsonProvider(app)
+
+
+@pytest.mark.parametrize('value', [
+    datetime(2024, 3, 5, 14, 30, tzinfo=timezone.utc),
+    datetime(2024, 3, 5, 14, 30),
+    date(2024, 3, 5),
+])
+def test_dates_keep_flask_http_date_format(providers, value):
+    default, fast = providers
+    obj = {'ultima_actualizacion': value, 'records': [{'timestamp': 1, 'temperature': 20.5}]}
+    assert fast.loads(fast.dumps(obj)) == default.loads(default.dumps(obj))
+
+
+def test_keys_are_sorted_like_the_default_provider(providers):
+    default, fast = providers
+    obj = {'b': 1, 'a': [1.5, None, 'x']}
+    assert fast.dumps(obj) == default.dumps(obj).replace(', ', ',').replace(': ', ':')
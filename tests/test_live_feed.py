@@ -0,0 +1,48 @@
+import asyncio
+import threading
+
+import pytest
+
+from live_feed import LiveFeedHub
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = LiveFeedHub('localhost:9092', 'weatherlink.raw', ['finca1'], queue_size=2)
+    # Sin hilo consumidor de Kafka: las pruebas publican a mano
+    monkeypatch.setattr(hub, '_ensure_started', lambda: None)
+    return hub
+
+
+def test_async_subscription_receives_events_from_other_threads(hub):
+    async def main():
+        subscription = hub.subscribe_async()
+        thread = threading.Thread(target=hub.publish, args=('reading', {'station_key': 'finca1'}))
+        thread.start()
+        event = await subscription.get(timeout=1)
+        thread.join()
+        hub.unsubscribe(subscription)
+        return event
+
+    assert asyncio.run(main()) == ('reading', {'station_key': 'finca1'})
+
+
+def test_async_subscription_times_out_without_events(hub):
+    async def main():
+        subscription = hub.subscribe_async()
+        with pytest.raises(asyncio.TimeoutError):
+            await subscription.get(timeout=0.01)
+
+    asyncio.run(main())
+
+
+def test_async_subscription_drops_oldest_when_full(hub):
+    async def main():
+        subscription = hub.subscribe_async()
+        for n in range(3):
+            hub.publish('reading', n)
+        # Dejar correr las entregas programadas con call_soon_threadsafe
+        await asyncio.sleep(0)
+        return [await subscription.get(timeout=1) for _ in range(2)]
+
+    assert asyncio.run(main()) == [('reading', 1), ('reading', 2)]
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import (PRIORITY_INGEST, PRIORITY_INTERACTIVE, LocalTokenBucket, RateLimiter,
+                          RateLimitExceeded, get_rate_limiter)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj manual: time.sleep avanza el reloj en lugar de esperar"""
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(time, 'sleep', sleep)
+    return now, sleeps
+
+
+def test_bucket_allows_burst_then_reports_wait(clock):
+    bucket = LocalTokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_bucket_refills_up_to_capacity(clock):
+    now, _ = clock
+    bucket = LocalTokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.try_acquire()
+
+    now[0] += 0.5
+    assert bucket.try_acquire() == 0.0
+    now[0] += 100
+    assert [bucket.try_acquire() for _ in range(4)] == [0.0, 0.0, 0.0, pytest.approx(0.5)]
+
+
+def test_interactive_calls_leave_the_reserve_for_ingest(clock):
+    limiter = RateLimiter(LocalTokenBucket(rate=1, capacity=5), reserve=2, max_wait=0)
+    for _ in range(3):
+        limiter.acquire(PRIORITY_INTERACTIVE)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(PRIORITY_INTERACTIVE)
+
+    limiter.acquire(PRIORITY_INGEST)
+    limiter.acquire(PRIORITY_INGEST)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(PRIORITY_INGEST)
+
+
+def test_acquire_waits_for_a_token(clock):
+    now, sleeps = clock
+    limiter = RateLimiter(LocalTokenBucket(rate=4, capacity=1), max_wait=10)
+    limiter.acquire()
+    limiter.acquire()
+    assert sleeps == [pytest.approx(0.25)]
+
+
+def test_acquire_gives_up_after_max_wait(clock):
+    now, sleeps = clock
+    limiter = RateLimiter(LocalTokenBucket(rate=0.1, capacity=1), max_wait=3)
+    limiter.acquire()
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire()
+    assert sum(sleeps) == pytest.approx(3)
+
+
+def test_acquire_async_waits_for_a_token():
+    limiter = RateLimiter(LocalTokenBucket(rate=100, capacity=1), max_wait=1)
+
+    async def main():
+        await limiter.acquire_async()
+        await limiter.acquire_async()
+
+    started = time.monotonic()
+    asyncio.run(main())
+    assert time.monotonic() - started >= 0.005
+
+
+def test_acquire_async_runs_blocking_buckets_in_a_thread():
+    class BlockingBucket:
+        blocking = True
+
+        def __init__(self):
+            self.threads = []
+
+        def try_acquire(self, floor=0.0):
+            self.threads.append(threading.current_thread())
+            return 0.0
+
+    bucket = BlockingBucket()
+    asyncio.run(RateLimiter(bucket).acquire_async())
+    assert bucket.threads[0] is not threading.main_thread()
+
+
+def test_get_rate_limiter_shares_one_limiter_per_key(monkeypatch):
+    monkeypatch.setattr(rate_limiter, '_limiters', {})
+    monkeypatch.setenv('WEATHERLINK_RATE_LIMIT', '5')
+    monkeypatch.setenv('WEATHERLINK_RATE_BURST', '2')
+    monkeypatch.setenv('WEATHERLINK_RATE_RESERVE', '3')
+    monkeypatch.setenv('WEATHERLINK_RATE_BACKEND', 'memory')
+
+    limiter = get_rate_limiter('clave-a')
+    assert get_rate_limiter('clave-a') is limiter
+    assert get_rate_limiter('clave-b') is not limiter
+    # La reserva nunca deja al tráfico interactivo sin tokens
+    assert limiter.reserve == 1
+
+    monkeypatch.setenv('WEATHERLINK_RATE_LIMIT', '0')
+    assert get_rate_limiter('clave-c') is None
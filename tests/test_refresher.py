@@ -0,0 +1,197 @@
+import threading
+import time
+
+import pytest
+
+from cache_backend import LRUCache
+from refresher import BackgroundRefresher, create_refresher
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def make_refresher(**kwargs):
+    # poll_seconds alto: el hilo de refresco no interviene en las pruebas
+    kwargs.setdefault('poll_seconds', 3600)
+    return BackgroundRefresher(LRUCache(), **kwargs)
+
+
+def test_peek_fresh_stale_expired(clock):
+    refresher = make_refresher(stale_seconds=60)
+    assert refresher.peek('k') is None
+
+    refresher.store('k', 'datos', 30)
+    assert refresher.peek('k') == ('datos', True)
+
+    clock[0] += 45
+    assert refresher.peek('k') == ('datos', False)
+
+    clock[0] += 60
+    assert refresher.peek('k') is None
+
+
+def test_store_callable_ttl(clock):
+    refresher = make_refresher(stale_seconds=0)
+    refresher.store('k', [1, 2, 3], lambda data: len(data) * 10)
+    clock[0] += 29
+    assert refresher.peek('k') == ([1, 2, 3], True)
+    clock[0] += 2
+    assert refresher.peek('k') is None
+
+
+def test_get_loads_missing_key_synchronously(clock):
+    refresher = make_refresher()
+    calls = []
+
+    def load():
+        calls.append(1)
+        return 'nuevo'
+
+    assert refresher.get('k', load, 30) == 'nuevo'
+    assert refresher.get('k', load, 30) == 'nuevo'
+    assert len(calls) == 1
+
+
+def test_get_serves_stale_and_refreshes_in_background(clock):
+    refresher = make_refresher(stale_seconds=60)
+    refresher.store('k', 'viejo', 30)
+    clock[0] += 45
+    refreshed = threading.Event()
+
+    def load():
+        refreshed.set()
+        return 'nuevo'
+
+    assert refresher.get('k', load, 30) == 'viejo'
+    assert refreshed.wait(5)
+    refresher._executor.shutdown(wait=True)
+    assert refresher.peek('k') == ('nuevo', True)
+
+
+def test_refresh_later_is_scheduled_once_per_key():
+    refresher = make_refresher()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return 'nuevo'
+
+    refresher.refresh_later('k', load, 30)
+    refresher.refresh_later('k', load, 30)
+    assert refresher._scheduled == {'k'}
+
+    release.set()
+    refresher._executor.shutdown(wait=True)
+    assert len(calls) == 1
+    assert refresher._scheduled == set()
+
+
+def test_failed_refresh_backs_off(monkeypatch):
+    refresher = make_refresher(backoff_seconds=10, backoff_max_seconds=25)
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+
+    def fail():
+        raise RuntimeError('WeatherLink caído')
+
+    for expected_delay in (10, 20, 25):
+        with pytest.raises(RuntimeError):
+            refresher.load('k', fail, 30)
+        failures, retry_at = refresher._failures['k']
+        assert retry_at == now[0] + expected_delay
+
+    # En espera: refresh_later no encola nada
+    refresher._ensure_started()
+    refresher.refresh_later('k', fail, 30)
+    assert refresher._scheduled == set()
+
+    refresher.load('k', lambda: 'ok', 30)
+    assert 'k' not in refresher._failures
+
+
+def test_failed_load_does_not_cache_the_error(clock):
+    refresher = make_refresher()
+
+    def fail():
+        raise RuntimeError('WeatherLink caído')
+
+    with pytest.raises(RuntimeError):
+        refresher.get('k', fail, 30)
+    assert refresher.peek('k') is None
+
+
+def test_max_hot_keys_evicts_the_coldest(monkeypatch):
+    refresher = make_refresher(max_hot_keys=2)
+    now = [0.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+
+    for key in ('a', 'b', 'c'):
+        now[0] += 1
+        refresher.track(key, lambda: None, 30)
+    assert set(refresher._hot) == {'b', 'c'}
+
+    # Un acceso nuevo a 'b' la vuelve la más caliente
+    now[0] += 1
+    refresher.track('b', lambda: None, 30)
+    now[0] += 1
+    refresher.track('d', lambda: None, 30)
+    assert set(refresher._hot) == {'b', 'd'}
+
+
+def test_due_keys_skips_fresh_and_forgets_cold(clock, monkeypatch):
+    refresher = make_refresher(lead_seconds=5, hot_seconds=60)
+    now = [0.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+
+    refresher.track('vigente', lambda: None, 30)
+    refresher.store('vigente', 'x', 30)
+    refresher.track('sin_datos', lambda: None, 30)
+    assert [key for key, _, _ in refresher._due_keys()] == ['sin_datos']
+
+    clock[0] += 26
+    assert sorted(key for key, _, _ in refresher._due_keys()) == ['sin_datos', 'vigente']
+
+    now[0] += 61
+    assert refresher._due_keys() == []
+    assert refresher._hot == {}
+
+
+def test_background_refresh_runs_once_per_version_across_workers(clock):
+    # Dos workers con la misma caché compartida
+    cache = LRUCache()
+    workers = [BackgroundRefresher(cache, poll_seconds=3600, stale_seconds=60) for _ in range(2)]
+    workers[0].store('k', 'viejo', 30)
+    clock[0] += 45
+    calls = []
+
+    def load():
+        calls.append(1)
+        return 'nuevo'
+
+    for worker in workers:
+        worker._background_refresh('k', load, 30)
+    assert len(calls) == 1
+    assert workers[1].peek('k') == ('nuevo', True)
+
+    # La siguiente versión vuelve a poder refrescarse
+    clock[0] += 45
+    workers[1]._background_refresh('k', load, 30)
+    assert len(calls) == 2
+
+
+def test_proactive_refresh_needs_a_shared_cache():
+    refresher = create_refresher(LRUCache())
+    assert not refresher.proactive
+    refresher._ensure_started()
+    assert refresher._thread is None
+
+    # Lo vencido se sigue refrescando a pedido
+    refreshed = threading.Event()
+    refresher.refresh_later('k', refreshed.set, 30)
+    assert refreshed.wait(5)
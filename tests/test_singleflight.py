@@ -0,0 +1,99 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'resultado'
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flight.do, 'k', fn)
+        assert started.wait(5)
+        followers = [executor.submit(flight.do, 'k', fn) for _ in range(4)]
+        # Los seguidores quedan esperando al líder
+        assert not any(f.done() for f in followers)
+        release.set()
+        results = [f.result(5) for f in [leader] + followers]
+
+    assert results == ['resultado'] * 5
+    assert len(calls) == 1
+
+
+def test_error_is_shared_and_next_call_retries():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('falló')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flight.do, 'k', fail)
+        assert started.wait(5)
+        follower = executor.submit(flight.do, 'k', fail)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError):
+                future.result(5)
+
+    # La llamada terminada no queda registrada: la siguiente vuelve a ejecutar
+    assert flight.do('k', lambda: 'ok') == 'ok'
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+
+
+def test_async_concurrent_calls_share_one_execution():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'resultado'
+
+    async def main():
+        results = await asyncio.gather(*(flight.do('k', fn) for _ in range(5)))
+        again = await flight.do('k', fn)
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results == ['resultado'] * 5
+    assert again == 'resultado'
+    # Una ejecución para las concurrentes y otra para la posterior
+    assert len(calls) == 2
+
+
+def test_async_cancelled_caller_does_not_cancel_the_call():
+    flight = AsyncSingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        return 'resultado'
+
+    async def main():
+        first = asyncio.ensure_future(flight.do('k', fn))
+        second = asyncio.ensure_future(flight.do('k', fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'resultado'
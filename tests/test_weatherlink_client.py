@@ -0,0 +1,291 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+import requests
+
+import weatherlink_client
+from weatherlink_client import AsyncWeatherLinkClient, FailedChunk, WeatherLinkClient, get_shared_session
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+        self.text = f"status {status_code}"
+
+    def json(self):
+        return self._payload
+
+
+class FakeSession:
+    """Sesión que devuelve (o lanza) las respuestas programadas en orden"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append({'url': url, 'params': dict(params), 'headers': headers, 'timeout': timeout})
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_historic_store(monkeypatch):
+    # Sin almacén de días cerrados: cada prueba ve solo lo que responde la sesión falsa
+    monkeypatch.setenv('WEATHERLINK_HISTORIC_STORE', '')
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    # El token bucket también duerme: se prueba aparte (test_rate_limiter.py)
+    monkeypatch.setenv('WEATHERLINK_RATE_LIMIT', '0')
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(time, 'sleep', recorded.append)
+    return recorded
+
+
+@pytest.fixture
+def network_env(monkeypatch):
+    monkeypatch.setenv('WEATHERLINK_MAX_RETRIES', '3')
+    monkeypatch.setenv('WEATHERLINK_BACKOFF_BASE', '0.5')
+    monkeypatch.setenv('WEATHERLINK_BACKOFF_MAX', '8')
+    monkeypatch.setenv('WEATHERLINK_CONNECT_TIMEOUT', '2')
+    monkeypatch.setenv('WEATHERLINK_READ_TIMEOUT', '7')
+
+
+def make_client(session):
+    return WeatherLinkClient('clave', 'secreto', '1234', session=session)
+
+
+def test_request_sends_credentials_and_timeout(network_env, sleeps):
+    session = FakeSession(FakeResponse(200, {'ok': True}))
+    assert make_client(session)._make_request('current/1234') == {'ok': True}
+
+    call = session.calls[0]
+    assert call['url'] == 'https://api.weatherlink.com/v2/current/1234'
+    assert call['params'] == {'api-key': 'clave'}
+    assert call['headers'] == {'X-Api-Secret': 'secreto'}
+    assert call['timeout'] == (2.0, 7.0)
+    assert sleeps == []
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retryable_status_is_retried_then_succeeds(network_env, sleeps, status):
+    session = FakeSession(FakeResponse(status), FakeResponse(status), FakeResponse(200, {'ok': True}))
+    assert make_client(session)._make_request('current/1234') == {'ok': True}
+    assert len(session.calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_gives_up_after_max_retries(network_env, sleeps):
+    session = FakeSession(*[FakeResponse(503) for _ in range(4)])
+    with pytest.raises(Exception, match='503'):
+        make_client(session)._make_request('current/1234')
+    # 1 intento + WEATHERLINK_MAX_RETRIES reintentos, sin esperar tras el último
+    assert len(session.calls) == 4
+    assert len(sleeps) == 3
+
+
+def test_client_errors_are_not_retried(network_env, sleeps):
+    session = FakeSession(FakeResponse(401))
+    with pytest.raises(Exception, match='401'):
+        make_client(session)._make_request('current/1234')
+    assert len(session.calls) == 1
+    assert sleeps == []
+
+
+def test_network_errors_are_retried(network_env, sleeps):
+    session = FakeSession(requests.exceptions.ConnectTimeout('lento'),
+                          requests.exceptions.ConnectionError('caída'),
+                          FakeResponse(200, {'ok': True}))
+    assert make_client(session)._make_request('current/1234') == {'ok': True}
+    assert len(sleeps) == 2
+
+
+def test_network_errors_give_up_after_max_retries(network_env, sleeps):
+    session = FakeSession(*[requests.exceptions.ReadTimeout('lento') for _ in range(4)])
+    with pytest.raises(Exception, match='conexión'):
+        make_client(session)._make_request('current/1234')
+    assert len(session.calls) == 4
+
+
+def test_backoff_is_exponential_with_full_jitter(network_env, monkeypatch):
+    # Con jitter completo la espera es uniforme en [0, techo]: se fija al techo
+    monkeypatch.setattr(weatherlink_client.random, 'uniform', lambda low, high: high)
+    client = make_client(FakeSession())
+    assert [client._backoff_delay(attempt) for attempt in range(6)] == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
+
+
+def test_backoff_honours_retry_after(network_env, sleeps):
+    session = FakeSession(FakeResponse(429, headers={'Retry-After': '3'}),
+                          FakeResponse(429, headers={'Retry-After': '120'}),
+                          FakeResponse(200, {'ok': True}))
+    make_client(session)._make_request('current/1234')
+    # Retry-After acotado por WEATHERLINK_BACKOFF_MAX
+    assert sleeps == [3.0, 8.0]
+
+
+def test_shared_session_is_pooled(monkeypatch):
+    monkeypatch.setattr(weatherlink_client, '_shared_session', None)
+    monkeypatch.setenv('WEATHERLINK_POOL_SIZE', '4')
+    session = get_shared_session()
+    assert get_shared_session() is session
+    adapter = session.get_adapter('https://api.weatherlink.com/v2/')
+    assert adapter._pool_maxsize == 4
+    assert make_client(None).session is session
+
+
+class HistoricSession:
+    """Responde /historic con un registro por hora del chunk pedido"""
+
+    def __init__(self, barrier=None):
+        self.barrier = barrier
+        self.chunks = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        start, end = params['start-timestamp'], params['end-timestamp']
+        self.chunks.append((start, end))
+        if self.barrier is not None:
+            # Todos los chunks deben estar en vuelo a la vez
+            self.barrier.wait(timeout=5)
+        data = [{'ts': ts, 'temp_last': 68.0, 'hum_last': 50.0} for ts in range(start, end, 3600)]
+        return FakeResponse(200, {'sensors': [{'sensor_type': 45, 'data': data}]})
+
+
+def test_historic_chunks_are_fetched_concurrently_and_kept_in_order(network_env):
+    start = 1_700_006_400
+    end = start + 3 * 86400
+    session = HistoricSession(barrier=threading.Barrier(3))
+    result = make_client(session).get_historic_data(start, end, max_workers=3)
+
+    assert sorted(session.chunks) == [(start + d * 86400, start + (d + 1) * 86400) for d in range(3)]
+    assert [r['timestamp'] for r in result['records']] == list(range(start, end, 3600))
+
+
+def test_historic_sequential_mode_matches_concurrent(network_env):
+    start = 1_700_006_400
+    end = start + 2 * 86400 + 7200
+    sequential = make_client(HistoricSession()).get_historic_data(start, end, max_workers=1)
+    concurrent = make_client(HistoricSession()).get_historic_data(start, end, max_workers=4)
+    assert sequential['records'] == concurrent['records']
+    assert len(sequential['records']) == 50
+
+
+def test_shared_limit_caps_chunks_in_flight_across_clients(network_env):
+    start = 1_700_006_400
+    in_flight = [0]
+    peak = [0]
+    lock = threading.Lock()
+    ok = HistoricSession()
+
+    class CountingSession:
+        def get(self, url, params=None, headers=None, timeout=None):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+            return ok.get(url, params, headers, timeout)
+
+    limit = threading.BoundedSemaphore(2)
+    results = []
+
+    def run():
+        client = make_client(CountingSession())
+        results.append(sum(len(r) for r in client.iter_historic_data(start, start + 4 * 86400,
+                                                                      max_workers=4, limit=limit)))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == [96, 96, 96]
+    assert peak[0] == 2
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_cancel_stops_pending_chunks(network_env, max_workers):
+    start = 1_700_006_400
+    cancel = threading.Event()
+    ok = HistoricSession()
+
+    class CancellingSession:
+        # El plazo vence mientras se descarga el primer chunk
+        def get(self, url, params=None, headers=None, timeout=None):
+            cancel.set()
+            return ok.get(url, params, headers, timeout)
+
+    chunks = make_client(CancellingSession()).iter_historic_data(
+        start, start + 5 * 86400, max_workers=max_workers, limit=threading.BoundedSemaphore(1), cancel=cancel)
+    with pytest.raises(CancelledError):
+        list(chunks)
+    assert len(ok.chunks) == 1
+
+
+def test_failed_chunk_is_reported_as_failed_chunk(network_env, sleeps):
+    start = 1_700_006_400
+    ok = HistoricSession()
+
+    class FlakySession:
+        # El segundo día responde 503 hasta agotar los reintentos
+        def get(self, url, params=None, headers=None, timeout=None):
+            if params['start-timestamp'] == start + 86400:
+                return FakeResponse(503)
+            return ok.get(url, params, headers, timeout)
+
+    client = make_client(FlakySession())
+    chunks = list(client.iter_historic_data(start, start + 3 * 86400, max_workers=1))
+
+    assert [type(chunk) for chunk in chunks] == [list, FailedChunk, list]
+    assert chunks[1] == [] and (chunks[1].start, chunks[1].end) == (start + 86400, start + 2 * 86400)
+    # get_historic_data sigue devolviendo el rango con el hueco
+    records = client.get_historic_data(start, start + 3 * 86400, max_workers=1)['records']
+    assert len(records) == 48
+
+
+def test_empty_chunk_is_a_plain_list(network_env):
+    class EmptySession:
+        def get(self, url, params=None, headers=None, timeout=None):
+            return FakeResponse(200, {'sensors': []})
+
+    chunks = list(make_client(EmptySession()).iter_historic_data(1_700_006_400, 1_700_010_000))
+    assert chunks == [[]] and not isinstance(chunks[0], FailedChunk)
+
+
+def test_async_client_opens_the_store_off_the_event_loop(network_env, monkeypatch):
+    opened_in = []
+
+    def fake_store():
+        opened_in.append(threading.current_thread())
+        return None
+
+    monkeypatch.setattr(weatherlink_client, 'get_default_store', fake_store)
+    session = HistoricSession()
+
+    class AsyncSession:
+        async def get(self, url, params=None, headers=None):
+            response = session.get(url, params)
+            response.text = ''
+            return response
+
+    async def main():
+        client = AsyncWeatherLinkClient('key', 'secret', '1234', client=AsyncSession())
+        return [chunk async for chunk in client.iter_historic_data(1_700_006_400, 1_700_013_600)]
+
+    chunks = asyncio.run(main())
+    assert [r['timestamp'] for chunk in chunks for r in chunk] == [1_700_006_400, 1_700_010_000]
+    assert opened_in and threading.main_thread() not in opened_in
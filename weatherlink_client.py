@@ -1,5 +1,77 @@
+import os
+import random
+import threading
 import time
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from itertools import islice
+
 import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from historic_store import DAY_SECONDS, get_default_store
+from profiling import pool_prefix
+from rate_limiter import PRIORITY_INTERACTIVE, get_rate_limiter
+from sensor_fields import compile_plan
+
+
+# Códigos HTTP que justifican reintentar con backoff
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return int(default)
+
+
+class FailedChunk(list):
+    """Chunk histórico que no se pudo descargar (error registrado)
+
+    Se comporta como una lista vacía, así que quien solo concatena registros
+    (get_historic_data) obtiene el rango con ese hueco, como siempre; las
+    cachés (HistoricRangeCache) lo distinguen de un chunk que WeatherLink
+    respondió sin registros y no guardan sus buckets.
+    """
+
+    def __init__(self, start, end, error):
+        super().__init__()
+        self.start = start
+        self.end = end
+        self.error = error
+
+
+def get_shared_session():
+    """Sesión HTTP keep-alive compartida por todos los clientes del proceso.
+
+    Todas las estaciones hablan con el mismo host, así que un único pool
+    acotado (WEATHERLINK_POOL_SIZE) reutiliza las conexiones TLS entre
+    estaciones y entre chunks históricos.
+    """
+    global _shared_session
+    if _shared_session is None:
+        with _shared_session_lock:
+            if _shared_session is None:
+                pool_size = _env_int('WEATHERLINK_POOL_SIZE', 10)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _shared_session = session
+    return _shared_session
 
 
 class WeatherLinkClient:
@@ -7,11 +79,45 @@ class WeatherLinkClient:
     
     BASE_URL = "https://api.weatherlink.com/v2"
     
-    def __init__(self, api_key, api_secret, station_id):
+    def __init__(self, api_key, api_secret, station_id, session=None, store=None,
+                 priority=PRIORITY_INTERACTIVE):
         self.api_key = api_key
         self.api_secret = api_secret
         self.station_id = station_id
-    
+        self.session = session or get_shared_session()
+        # Cuota compartida por API key; la ingesta (PRIORITY_INGEST) tiene prioridad
+        self.rate_limiter = get_rate_limiter(api_key)
+        self.priority = priority
+        # Almacén persistente de días cerrados (WEATHERLINK_HISTORIC_STORE); el
+        # almacén por defecto se abre con la primera consulta histórica
+        self._store = store
+        # Planes de campos aprendidos por (kind, sensor_type)
+        self._field_plans = {}
+
+        # Configuración de red (mismas variables .env que las credenciales FINCA*)
+        self.timeout = (
+            _env_float('WEATHERLINK_CONNECT_TIMEOUT', 5),
+            _env_float('WEATHERLINK_READ_TIMEOUT', 20),
+        )
+        self.max_retries = _env_int('WEATHERLINK_MAX_RETRIES', 3)
+        self.backoff_base = _env_float('WEATHERLINK_BACKOFF_BASE', 0.5)
+        self.backoff_max = _env_float('WEATHERLINK_BACKOFF_MAX', 8)
+
+    @property
+    def store(self):
+        """Almacén de días cerrados (None si está deshabilitado)"""
+        return self._store if self._store is not None else get_default_store()
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """Espera exponencial con jitter completo; respeta Retry-After si viene."""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except (TypeError, ValueError):
+                pass
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
     def _make_request(self, endpoint, params=None):
         """Hacer una petición autenticada a la API"""
         if params is None:
@@ -25,13 +131,26 @@ class WeatherLinkClient:
             'X-Api-Secret': self.api_secret
         }
         
-        # Hacer petición
+        # Hacer petición (con reintentos ante 429/5xx y errores de red)
         url = f"{self.BASE_URL}/{endpoint}"
-        response = requests.get(url, params=params, headers=headers)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self.priority)
+            try:
+                with metrics.upstream_call('weatherlink', endpoint.split('/')[0], self.station_id) as call:
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+                    call.status = response.status_code
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise Exception(f"Error de conexión con API: {e}")
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                time.sleep(self._backoff_delay(attempt, response.headers.get('Retry-After')))
+                continue
             raise Exception(f"Error en API: {response.status_code} - {response.text}")
     
     def _calculate_vpd(self, temp_f, humidity):
@@ -53,7 +172,20 @@ class WeatherLinkClient:
         
         return round(vpd, 2)
     
-    def _extract_rain_metrics(self, sensor_data):
+    def _field_plan(self, kind, sensor_type, record):
+        """Plan de campos aprendido para (kind, sensor_type) de esta estación.
+
+        Se compila con las claves que la estación emite realmente y solo se
+        vuelve a aprender cuando cambia el esquema del registro.
+        """
+        cache_key = (kind, sensor_type)
+        plan = self._field_plans.get(cache_key)
+        if plan is None or not plan.matches(record):
+            plan = compile_plan(kind, record)
+            self._field_plans[cache_key] = plan
+        return plan
+
+    def _extract_rain_metrics(self, sensor_data, plan=None):
         """Extrae de forma separada y precisa las diferentes métricas de lluvia de WeatherLink:
         - rain_daily_mm: Acumulado del día en mm
         - rain_rate_mm_h: Tasa o intensidad instantánea en mm/hora
@@ -61,51 +193,27 @@ class WeatherLinkClient:
         - rain_last_60_min_mm: Lluvia en últimos 60 min en mm
         - is_raining: Booleano indicando si hay lluvia activa
         """
+        if plan is None:
+            plan = compile_plan('current', sensor_data)
+
         # 1. Tasa / Intensidad instantánea (mm/h)
-        rate_mm_keys = ["rain_rate_last_mm", "rain_rate_mm", "rain_rate_hi_mm"]
-        rate_in_keys = ["rain_rate_last_in", "rain_rate_in", "rain_rate_last"]
-        rain_rate_mm_h = None
-        for k in rate_mm_keys:
-            if k in sensor_data and sensor_data[k] is not None:
-                rain_rate_mm_h = float(sensor_data[k])
-                break
-        if rain_rate_mm_h is None:
-            for k in rate_in_keys:
-                if k in sensor_data and sensor_data[k] is not None:
-                    rain_rate_mm_h = float(sensor_data[k]) * 25.4
-                    break
-        if rain_rate_mm_h is None:
-            rain_rate_mm_h = 0.0
+        rain_rate_mm_h = plan['rain_rate_mm_h'](sensor_data)[0]
+        rain_rate_mm_h = float(rain_rate_mm_h) if rain_rate_mm_h is not None else 0.0
 
         # 2. Acumulado diario (mm)
-        daily_mm_keys = ["rainfall_daily_mm", "rain_day_mm", "rainfall_mm"]
-        daily_in_keys = ["rainfall_daily_in", "rain_day_in", "rainfall_in"]
-        rain_daily_mm = None
-        for k in daily_mm_keys:
-            if k in sensor_data and sensor_data[k] is not None:
-                rain_daily_mm = float(sensor_data[k])
-                break
-        if rain_daily_mm is None:
-            for k in daily_in_keys:
-                if k in sensor_data and sensor_data[k] is not None:
-                    rain_daily_mm = float(sensor_data[k]) * 25.4
-                    break
+        rain_daily_mm = plan['rain_daily_mm'](sensor_data)[0]
+        if rain_daily_mm is not None:
+            rain_daily_mm = float(rain_daily_mm)
 
         # 3. Lluvia últimos 15 min
-        rain_15m_mm = None
-        if "rainfall_last_15_min_mm" in sensor_data and sensor_data["rainfall_last_15_min_mm"] is not None:
-            rain_15m_mm = float(sensor_data["rainfall_last_15_min_mm"])
-        elif "rainfall_last_15_min_in" in sensor_data and sensor_data["rainfall_last_15_min_in"] is not None:
-            rain_15m_mm = float(sensor_data["rainfall_last_15_min_in"]) * 25.4
-        elif "rainfall_last_15_min" in sensor_data and sensor_data["rainfall_last_15_min"] is not None:
-            rain_15m_mm = float(sensor_data["rainfall_last_15_min"])
+        rain_15m_mm = plan['rain_last_15_min_mm'](sensor_data)[0]
+        if rain_15m_mm is not None:
+            rain_15m_mm = float(rain_15m_mm)
 
         # 4. Lluvia últimos 60 min
-        rain_60m_mm = None
-        if "rainfall_last_60_min_mm" in sensor_data and sensor_data["rainfall_last_60_min_mm"] is not None:
-            rain_60m_mm = float(sensor_data["rainfall_last_60_min_mm"])
-        elif "rainfall_last_60_min_in" in sensor_data and sensor_data["rainfall_last_60_min_in"] is not None:
-            rain_60m_mm = float(sensor_data["rainfall_last_60_min_in"]) * 25.4
+        rain_60m_mm = plan['rain_last_60_min_mm'](sensor_data)[0]
+        if rain_60m_mm is not None:
+            rain_60m_mm = float(rain_60m_mm)
 
         # 5. Flag is_raining
         is_raining = (rain_rate_mm_h > 0) or (rain_15m_mm is not None and rain_15m_mm > 0)
@@ -118,44 +226,24 @@ class WeatherLinkClient:
             'is_raining': is_raining
         }
 
-    def _rain_to_mm(self, sensor_data):
-        """Devuelve lluvia en mm detectando automáticamente la unidad."""
-        mm_keys = [
-            "rainfall_daily_mm",
-            "rainfall_mm",
-            "rainfall_last_15_min_mm",
-            "rain_day_mm",
-            "rain_rate_mm",
-        ]
-        in_keys = [
-            "rainfall_daily_in",
-            "rainfall_in",
-            "rain_rate_in",
-            "rain_day_in",
-            "rain_rate_last",  # valor suele venir en pulgadas
-        ]
-
-        # Priorizar campos explícitos en mm
-        for key in mm_keys:
-            if key in sensor_data and sensor_data[key] is not None:
-                return sensor_data[key], key, "mm"
-
-        # Si no hay mm, convertir desde pulgadas
-        for key in in_keys:
-            if key in sensor_data and sensor_data[key] is not None:
-                return sensor_data[key] * 25.4, key, "in"
-
-        # Intento final con campos genéricos
-        if "rainfall_last_15_min" in sensor_data and sensor_data["rainfall_last_15_min"] is not None:
-            return sensor_data["rainfall_last_15_min"], "rainfall_last_15_min", "mm"
+    def _rain_to_mm(self, sensor_data, plan=None):
+        """Devuelve lluvia en mm detectando automáticamente la unidad.
 
-        return None, None, None
+        Prioriza campos explícitos en mm, luego convierte desde pulgadas y por
+        último usa campos genéricos (ver sensor_fields.CURRENT_RULES['rain']).
+        """
+        if plan is None:
+            plan = compile_plan('current', sensor_data)
+        return plan['rain'](sensor_data)
 
     def get_current_conditions(self):
         """Obtener condiciones actuales de la estación"""
         endpoint = "current/" + self.station_id
         data = self._make_request(endpoint)
-        
+        return self._parse_current_conditions(data)
+
+    def _parse_current_conditions(self, data):
+        """Consolidar la respuesta de /current en un diccionario plano"""
         # Buscar el sensor meteorológico principal (ISS)
         # Tipos de sensores comunes: 23 (ISS), 45, 53 (WeatherLink Live con ISS), 55 (WeatherLink Live), etc.
         weather_data = {}
@@ -170,22 +258,20 @@ class WeatherLinkClient:
                     # Sensor meteorológico exterior (temp, hum, viento, lluvia)
                     if sensor_type in [23, 45, 53, 55]:
                         # Manejar diferentes formatos de nombres de campos
-                        temp = sensor_data.get('temp') or sensor_data.get('temp_out')
-                        hum = sensor_data.get('hum') or sensor_data.get('hum_out')
+                        plan = self._field_plan('current', sensor_type, sensor_data)
+                        temp = plan['temperature'](sensor_data)
+                        hum = plan['humidity'](sensor_data)
 
                         # Extraer métricas detalladas de lluvia
-                        rain_metrics = self._extract_rain_metrics(sensor_data)
-                        rain_mm, rain_field, rain_unit = self._rain_to_mm(sensor_data)
+                        rain_metrics = self._extract_rain_metrics(sensor_data, plan)
+                        rain_mm, rain_field, rain_unit = self._rain_to_mm(sensor_data, plan)
                         
                         weather_data.update({
                             'timestamp': sensor_data.get('ts'),
                             'temperature': temp,
                             'humidity': hum,
-                            'wind_speed': (sensor_data.get('wind_speed_last') or 
-                                         sensor_data.get('wind_speed_avg_last_10_min') or
-                                         sensor_data.get('wind_speed') or
-                                         sensor_data.get('wind_speed_10_min')),
-                            'wind_dir': sensor_data.get('wind_dir_last') or sensor_data.get('wind_dir'),
+                            'wind_speed': plan['wind_speed'](sensor_data),
+                            'wind_dir': plan['wind_dir'](sensor_data),
                             'rain_rate': rain_mm,
                             'rain_rate_mm': rain_mm,
                             'rain_rate_field': rain_field,
@@ -196,7 +282,7 @@ class WeatherLinkClient:
                             'rain_last_60_min_mm': rain_metrics['rain_last_60_min_mm'],
                             'is_raining': rain_metrics['is_raining'],
                             'solar_radiation': sensor_data.get('solar_rad'),
-                            'uv_index': sensor_data.get('uv_index') or sensor_data.get('uv'),
+                            'uv_index': plan['uv_index'](sensor_data),
                             'dew_point': sensor_data.get('dew_point'),
                             'heat_index': sensor_data.get('heat_index'),
                             'wind_chill': sensor_data.get('wind_chill'),
@@ -223,108 +309,228 @@ class WeatherLinkClient:
         
         return weather_data
     
-    def get_historic_data(self, start_timestamp, end_timestamp):
+    # La API de WeatherLink limita a 24 horas (86400 segundos) por petición
+    HISTORIC_MAX_RANGE = 86400
+
+    def _historic_chunks(self, start_timestamp, end_timestamp):
+        """Dividir el rango en chunks de 24 horas [(inicio, fin, día_cerrado), ...]
+
+        Con almacén persistente los chunks se alinean a días UTC; día_cerrado es
+        la medianoche del día si ya no puede cambiar (cacheable) o None.
+        """
+        chunks = []
+        if self.store is None:
+            current_start = start_timestamp
+            while current_start < end_timestamp:
+                current_end = min(current_start + self.HISTORIC_MAX_RANGE, end_timestamp)
+                chunks.append((current_start, current_end, None))
+                current_start = current_end
+            return chunks
+
+        now = time.time()
+        day = self.store.day_start(start_timestamp)
+        while day < end_timestamp:
+            chunk_start = max(start_timestamp, day)
+            chunk_end = min(end_timestamp, day + DAY_SECONDS)
+            closed_day = day if self.store.is_day_closed(day, now) else None
+            chunks.append((chunk_start, chunk_end, closed_day))
+            day += DAY_SECONDS
+        return chunks
+
+    def _historic_chunk_params(self, chunk):
+        """Parámetros de /historic para un chunk (los días cerrados se piden completos)"""
+        current_start, current_end, closed_day = chunk
+        if closed_day is not None:
+            current_start, current_end = closed_day, closed_day + DAY_SECONDS
+        return {
+            'start-timestamp': current_start,
+            'end-timestamp': current_end
+        }
+
+    @staticmethod
+    def _filter_chunk_records(chunk, records):
+        """Recortar los registros de un día completo a la ventana pedida"""
+        current_start, current_end, closed_day = chunk
+        if closed_day is None:
+            return records
+        return [
+            r for r in records
+            if r.get('timestamp') is None or current_start <= r['timestamp'] <= current_end
+        ]
+
+    def _cached_chunk(self, chunk):
+        """Registros del chunk desde el almacén persistente, o None"""
+        closed_day = chunk[2]
+        if closed_day is None or self.store is None:
+            return None
+        records = self.store.get(self.station_id, closed_day)
+        if records is None:
+            return None
+        return self._filter_chunk_records(chunk, records)
+
+    def _store_chunk(self, chunk, records):
+        """Guardar un día cerrado descargado y devolverlo recortado a la ventana"""
+        closed_day = chunk[2]
+        # Un día vacío puede deberse a una estación sin conexión que aún no subió su archivo
+        if closed_day is not None and self.store is not None and records:
+            self.store.put(self.station_id, closed_day, records)
+        return self._filter_chunk_records(chunk, records)
+
+    @staticmethod
+    def _drop_repeated(records, last_ts):
+        """Descartar registros ya emitidos en el chunk anterior (bordes repetidos)
+
+        Devuelve (registros, último timestamp emitido).
+        """
+        if last_ts is None or not records:
+            # Sin copiar: un FailedChunk sigue siéndolo
+            kept = records
+        else:
+            kept = [r for r in records if r.get('timestamp') is None or r['timestamp'] > last_ts]
+        for record in reversed(kept):
+            if record.get('timestamp') is not None:
+                return kept, record['timestamp']
+        return kept, last_ts
+
+    def _parse_historic_records(self, data):
+        """Normalizar los registros de una respuesta histórica"""
+        records = []
+
+        if 'sensors' in data:
+            for sensor in data['sensors']:
+                sensor_type = sensor.get('sensor_type')
+                
+                # Solo procesar sensores meteorológicos principales (incluyendo tipo 53)
+                if sensor_type in [23, 45, 53, 55] and 'data' in sensor:
+                    # Manejar múltiples formatos de nombres de campos
+                    # Datos históricos usan: temp_last, hum_last, wind_speed_avg, solar_rad_avg
+                    # Datos actuales usan: temp/temp_out, hum/hum_out, wind_speed_last
+                    # El plan se aprende una vez por estación/sensor y se revalida por registro
+                    # (si cambia el conjunto de claves se vuelve a compilar)
+                    plan = None
+                    for record in sensor['data']:
+                        if plan is None or not plan.matches(record):
+                            plan = self._field_plan('historic', sensor_type, record)
+                            temp_of = plan['temperature']
+                            hum_of = plan['humidity']
+                            wind_of = plan['wind_speed']
+                            wind_dir_of = plan['wind_dir']
+                            # Detectar y convertir lluvia a mm evitando conversiones dobles
+                            rain_of = plan['rain']
+                            solar_of = plan['solar_radiation']
+                            uv_of = plan['uv_index']
+                            dew_point_of = plan['dew_point']
+
+                        rain_mm, rain_field, _ = rain_of(record)
+                        records.append({
+                            'timestamp': record.get('ts'),
+                            'temperature': temp_of(record),
+                            'humidity': hum_of(record),
+                            'wind_speed': wind_of(record),
+                            'wind_dir': wind_dir_of(record),
+                            'rain': rain_mm,
+                            'rain_mm': rain_mm,
+                            'rain_field': rain_field,
+                            'solar_radiation': solar_of(record),
+                            'uv_index': uv_of(record),
+                            'dew_point': dew_point_of(record),
+                        })
+                    break  # Solo usar el primer sensor meteorológico
+
+        return records
+
+    def _fetch_historic_chunk(self, chunk):
+        """Descargar y normalizar un chunk; devuelve FailedChunk si falla (se registra el error)"""
+        cached = self._cached_chunk(chunk)
+        if cached is not None:
+            return cached
+
+        current_start, current_end, _ = chunk
+        endpoint = "historic/" + self.station_id
+        params = self._historic_chunk_params(chunk)
+        try:
+            data = self._make_request(endpoint, params)
+            return self._store_chunk(chunk, self._parse_historic_records(data))
+        except Exception as e:
+            # Si hay error en un chunk, continuar con el siguiente
+            print(f"Error obteniendo datos de {current_start} a {current_end}: {str(e)}")
+            return FailedChunk(current_start, current_end, e)
+
+    def iter_historic_data(self, start_timestamp, end_timestamp, max_workers=None, limit=None, cancel=None):
+        """Generador de datos históricos: produce la lista normalizada de cada chunk
+        en orden de timestamp, sin acumular el rango completo en memoria. Un
+        chunk que falla se produce como FailedChunk (vacío).
+
+        Con max_workers > 1 (por defecto WEATHERLINK_HISTORIC_WORKERS) se
+        adelantan como máximo max_workers chunks en paralelo. limit (un
+        semáforo) acota las descargas simultáneas compartidas con otras
+        llamadas (p. ej. todas las estaciones de /api/compare); con cancel
+        (threading.Event) activado no se descargan más chunks y se lanza
+        CancelledError.
+        """
+        if max_workers is None:
+            max_workers = _env_int('WEATHERLINK_HISTORIC_WORKERS', 4)
+
+        chunks = self._historic_chunks(start_timestamp, end_timestamp)
+        last_ts = None
+
+        def check_cancel():
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+
+        def fetch(chunk):
+            if limit is None:
+                return self._fetch_historic_chunk(chunk)
+            with limit:
+                # Puede haber esperado al semáforo más allá del plazo
+                check_cancel()
+                return self._fetch_historic_chunk(chunk)
+
+        if max_workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                check_cancel()
+                records, last_ts = self._drop_repeated(fetch(chunk), last_ts)
+                yield records
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)),
+                                      thread_name_prefix=pool_prefix('historic'))
+        pending = deque()
+        try:
+            remaining = iter(chunks)
+            for chunk in islice(remaining, max_workers):
+                pending.append(executor.submit(fetch, chunk))
+            while pending:
+                chunk_records = pending.popleft().result()
+                check_cancel()
+                next_chunk = next(remaining, None)
+                if next_chunk is not None:
+                    pending.append(executor.submit(fetch, next_chunk))
+                records, last_ts = self._drop_repeated(chunk_records, last_ts)
+                yield records
+        finally:
+            # Si el consumidor abandona el generador, no descargar lo que falta
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def get_historic_data(self, start_timestamp, end_timestamp, max_workers=None, columnar=False):
         """Obtener datos históricos de la estación
         
         La API de WeatherLink limita a 24 horas (86400 segundos) por petición.
         Este método divide automáticamente en múltiples peticiones si es necesario.
+        Los días UTC ya cerrados se leen del almacén persistente si están en él.
+        Con max_workers > 1 (por defecto WEATHERLINK_HISTORIC_WORKERS) los chunks
+        se descargan en paralelo y se reensamblan en orden de timestamp.
+        Con columnar=True, 'records' es un HistoricColumns (arreglos NumPy).
         """
-        MAX_RANGE = 86400  # 24 horas en segundos
         all_records = []
-        
-        # Dividir el rango en chunks de 24 horas
-        current_start = start_timestamp
-        
-        while current_start < end_timestamp:
-            current_end = min(current_start + MAX_RANGE, end_timestamp)
-            
-            endpoint = "historic/" + self.station_id
-            params = {
-                'start-timestamp': current_start,
-                'end-timestamp': current_end
-            }
-            
-            try:
-                data = self._make_request(endpoint, params)
-                
-                # Procesar datos históricos de este chunk
-                if 'sensors' in data:
-                    for sensor in data['sensors']:
-                        sensor_type = sensor.get('sensor_type')
-                        
-                        # Solo procesar sensores meteorológicos principales (incluyendo tipo 53)
-                        if sensor_type in [23, 45, 53, 55] and 'data' in sensor:
-                            for record in sensor['data']:
-                                # Manejar múltiples formatos de nombres de campos
-                                # Datos históricos usan: temp_last, hum_last, wind_speed_avg, solar_rad_avg
-                                # Datos actuales usan: temp/temp_out, hum/hum_out, wind_speed_last
-                                temp = (record.get('temp') or 
-                                       record.get('temp_out') or 
-                                       record.get('temp_last'))
-                                
-                                hum = (record.get('hum') or 
-                                      record.get('hum_out') or 
-                                      record.get('hum_last'))
-                                
-                                wind = (record.get('wind_speed_last') or 
-                                       record.get('wind_speed_avg_last_10_min') or
-                                       record.get('wind_speed') or
-                                       record.get('wind_speed_10_min') or
-                                       record.get('wind_speed_avg'))
-                                
-                                # Detectar y convertir lluvia a mm evitando conversiones dobles
-                                rain_mm = None
-                                rain_field = None
-                                for key in [
-                                    'rainfall_mm',
-                                    'rainfall_last_15_min_mm',
-                                    'rain_day_mm',
-                                    'rain_rate_mm',
-                                ]:
-                                    if key in record and record[key] is not None:
-                                        rain_mm = record[key]
-                                        rain_field = key
-                                        break
-
-                                if rain_mm is None:
-                                    for key in [
-                                        'rainfall_in',
-                                        'rain_rate_in',
-                                        'rain_day_in',
-                                        'rain_rate_last',  # suele venir en pulgadas
-                                        'rainfall_last_15_min',
-                                    ]:
-                                        if key in record and record[key] is not None:
-                                            rain_mm = record[key] * 25.4
-                                            rain_field = key
-                                            break
-                                if rain_mm is None and 'rain_rate_last_mm' in record:
-                                    rain_mm = record['rain_rate_last_mm']
-                                    rain_field = 'rain_rate_last_mm'
-                                
-                                solar = (record.get('solar_rad') or
-                                        record.get('solar_rad_avg'))
-                                
-                                all_records.append({
-                                    'timestamp': record.get('ts'),
-                                    'temperature': temp,
-                                    'humidity': hum,
-                                    'wind_speed': wind,
-                                    'wind_dir': record.get('wind_dir_last') or record.get('wind_dir'),
-                                    'rain': rain_mm,
-                                    'rain_mm': rain_mm,
-                                    'rain_field': rain_field,
-                                    'solar_radiation': solar,
-                                    'uv_index': record.get('uv_index') or record.get('uv'),
-                                    'dew_point': record.get('dew_point') or record.get('dew_point_last'),
-                                })
-                            break  # Solo usar el primer sensor meteorológico
-            except Exception as e:
-                # Si hay error en un chunk, continuar con el siguiente
-                print(f"Error obteniendo datos de {current_start} a {current_end}: {str(e)}")
-            
-            # Mover al siguiente chunk
-            current_start = current_end
+        for records in self.iter_historic_data(start_timestamp, end_timestamp, max_workers):
+            all_records.extend(records)
+
+        if columnar:
+            from historic_columns import HistoricColumns
+            all_records = HistoricColumns.from_records(all_records)
         
         return {
             'station_id': self.station_id,
@@ -337,3 +543,211 @@ class WeatherLinkClient:
         """Obtener información/metadatos de la estación"""
         endpoint = "stations/" + self.station_id
         return self._make_request(endpoint)
+
+
+class LazyClients(Mapping):
+    """Clientes por estación que se crean en el primer uso, no al importar.
+
+    stations es {key: {'api_key', 'api_secret', 'station_id', ...}}. Con
+    preload_app el master de gunicorn no abre sesiones HTTP ni el almacén
+    SQLite: cada worker crea sus clientes tras el fork, solo los que usa.
+    """
+
+    def __init__(self, stations, factory=None):
+        self._stations = stations
+        self._factory = factory or WeatherLinkClient
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        client = self._clients.get(key)
+        if client is None:
+            station = self._stations[key]
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._factory(station['api_key'], station['api_secret'], station['station_id'])
+                    self._clients[key] = client
+        return client
+
+    def __contains__(self, key):
+        # Sin crear el cliente (Mapping.__contains__ llamaría a __getitem__)
+        return key in self._stations
+
+    def __iter__(self):
+        return iter(self._stations)
+
+    def __len__(self):
+        return len(self._stations)
+
+
+# ============================================
+# Cliente asíncrono (httpx + asyncio)
+# ============================================
+
+_shared_async_client = None
+
+
+def get_shared_async_client():
+    """httpx.AsyncClient compartido por los clientes asíncronos del event loop actual.
+
+    Se crea de forma perezosa para que los procesos síncronos (Flask) no
+    importen httpx. Cerrar con close_shared_async_client() al terminar.
+    """
+    global _shared_async_client
+    if _shared_async_client is None or _shared_async_client.is_closed:
+        import httpx
+
+        pool_size = _env_int('WEATHERLINK_POOL_SIZE', 10)
+        _shared_async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                _env_float('WEATHERLINK_READ_TIMEOUT', 20),
+                connect=_env_float('WEATHERLINK_CONNECT_TIMEOUT', 5),
+            ),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+    return _shared_async_client
+
+
+async def close_shared_async_client():
+    """Cerrar el httpx.AsyncClient compartido (si existe)"""
+    global _shared_async_client
+    if _shared_async_client is not None:
+        await _shared_async_client.aclose()
+        _shared_async_client = None
+
+
+class AsyncWeatherLinkClient(WeatherLinkClient):
+    """Versión asíncrona de WeatherLinkClient sobre un httpx.AsyncClient compartido.
+
+    Mismas firmas y resultados que el cliente síncrono, pero los métodos
+    públicos son corrutinas: un único event loop puede consultar muchas
+    estaciones y repartir los chunks históricos sin hilos.
+    """
+
+    def __init__(self, api_key, api_secret, station_id, client=None, store=None,
+                 priority=PRIORITY_INTERACTIVE):
+        super().__init__(api_key, api_secret, station_id,
+                         session=client or get_shared_async_client(), store=store,
+                         priority=priority)
+
+    async def _make_request(self, endpoint, params=None):
+        """Hacer una petición autenticada a la API"""
+        # Importaciones diferidas: los workers de Flask no cargan asyncio ni httpx
+        import asyncio
+
+        import httpx
+
+        if params is None:
+            params = {}
+        params['api-key'] = self.api_key
+        headers = {
+            'X-Api-Secret': self.api_secret
+        }
+
+        url = f"{self.BASE_URL}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(self.priority)
+            try:
+                with metrics.upstream_call('weatherlink', endpoint.split('/')[0], self.station_id) as call:
+                    response = await self.session.get(url, params=params, headers=headers)
+                    call.status = response.status_code
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise Exception(f"Error de conexión con API: {e}")
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await asyncio.sleep(self._backoff_delay(attempt, response.headers.get('Retry-After')))
+                continue
+            raise Exception(f"Error en API: {response.status_code} - {response.text}")
+
+    async def get_current_conditions(self):
+        """Obtener condiciones actuales de la estación"""
+        data = await self._make_request("current/" + self.station_id)
+        return self._parse_current_conditions(data)
+
+    async def _fetch_historic_chunk(self, chunk):
+        """Descargar y normalizar un chunk; devuelve FailedChunk si falla (se registra el error)"""
+        import asyncio
+
+        # Los días cerrados pasan por el almacén SQLite: en un hilo, fuera del event loop.
+        # Solo hay día cerrado si el almacén ya se abrió al dividir el rango
+        use_store = chunk[2] is not None and self.store is not None
+        if use_store:
+            cached = await asyncio.to_thread(self._cached_chunk, chunk)
+            if cached is not None:
+                return cached
+
+        current_start, current_end, _ = chunk
+        params = self._historic_chunk_params(chunk)
+        try:
+            data = await self._make_request("historic/" + self.station_id, params)
+            records = self._parse_historic_records(data)
+            if use_store:
+                return await asyncio.to_thread(self._store_chunk, chunk, records)
+            return self._store_chunk(chunk, records)
+        except Exception as e:
+            print(f"Error obteniendo datos de {current_start} a {current_end}: {str(e)}")
+            return FailedChunk(current_start, current_end, e)
+
+    async def iter_historic_data(self, start_timestamp, end_timestamp, max_workers=None, limit=None):
+        """Generador asíncrono de datos históricos, un chunk normalizado a la vez
+        (como máximo max_workers chunks adelantados; limit es un asyncio.Semaphore
+        compartido con otras llamadas). Se cancela cancelando la tarea."""
+        import asyncio
+
+        if max_workers is None:
+            max_workers = _env_int('WEATHERLINK_HISTORIC_WORKERS', 4)
+
+        # La primera llamada abre el almacén SQLite por defecto: en un hilo, fuera del event loop
+        chunks = await asyncio.to_thread(self._historic_chunks, start_timestamp, end_timestamp)
+        last_ts = None
+
+        async def fetch(chunk):
+            if limit is None:
+                return await self._fetch_historic_chunk(chunk)
+            async with limit:
+                return await self._fetch_historic_chunk(chunk)
+
+        pending = deque()
+        try:
+            remaining = iter(chunks)
+            for chunk in islice(remaining, max(1, max_workers)):
+                pending.append(asyncio.ensure_future(fetch(chunk)))
+            while pending:
+                chunk_records = await pending.popleft()
+                next_chunk = next(remaining, None)
+                if next_chunk is not None:
+                    pending.append(asyncio.ensure_future(fetch(next_chunk)))
+                records, last_ts = self._drop_repeated(chunk_records, last_ts)
+                yield records
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_historic_data(self, start_timestamp, end_timestamp, max_workers=None, columnar=False):
+        """Obtener datos históricos; los chunks de 24h se piden concurrentemente
+        (como máximo max_workers a la vez) y se devuelven en orden de timestamp."""
+        all_records = []
+        async for records in self.iter_historic_data(start_timestamp, end_timestamp, max_workers):
+            all_records.extend(records)
+
+        if columnar:
+            from historic_columns import HistoricColumns
+            all_records = HistoricColumns.from_records(all_records)
+
+        return {
+            'station_id': self.station_id,
+            'start_timestamp': start_timestamp,
+            'end_timestamp': end_timestamp,
+            'records': all_records
+        }
+
+    async def get_station_metadata(self):
+        """Obtener información/metadatos de la estación"""
+        return await self._make_request("stations/" + self.station_id)